@@ -1,20 +1,92 @@
 import os
+import copy
+import hashlib
 import json
+import logging
 import threading
+import uuid
 import time
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file, abort
+from flask import Flask, Response, request, jsonify, send_file, abort
 from flask_cors import CORS
-import yt_dlp
-import sqlite3
 from pathlib import Path
+from db import Database
+from jobs import JobQueue, RetryLater, JOB_QUEUED, JOB_RUNNING, JOB_PROCESSING, JOB_DEFERRED
+from events import EventBroker, format_sse
+from info_cache import InfoCache, normalize_url
+from janitor import run_janitor
+from formats import load_rules, select_formats
+from file_serving import send_file_range, parse_range_header, if_range_matches, RangeNotSatisfiable
+from dedup import deduplicate_download
+from storage import StorageManager, parse_size
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Histogram, CallbackMetric
+from batch import expand_playlist, pick_format, run_batch
+from bandwidth import BandwidthScheduler, PRIORITY_WEIGHTS, parse_rate
+from logs import LogManager, request_id_var, trace_var, trace_log, tracing
+from startup import Startup, yt_dlp, warm_yt_dlp
+from executor import ExecutorBusyError, SingleFlightExecutor
+from postprocess import ProcessingPool, PostProcessingError
+from thumbnails import ThumbnailCache, THUMBNAIL_ID, pick_thumbnail
+from static_assets import StaticAssets
+from exports import ExportStore, EXPORT_FORMATS
+from scheduler import ExtractionScheduler, HostThrottledError
+from hls import HlsCache, HlsUnavailableError, PLAYLIST_MIMETYPE, SEGMENT_MIMETYPE
+from bulk_files import BulkFileManager
 
-app = Flask(__name__, static_folder='build', static_url_path='')
+# The React build is served by serve_frontend from static_assets' manifest
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 # Configure Flask for Unicode support
 app.config['JSON_AS_ASCII'] = False
 
+# Logging: JSON lines (LOG_FORMAT=text for plain lines) written by a
+# background thread. DEBUG records are sampled at LOG_SAMPLE_DEBUG unless
+# the request sent X-Trace: 1. Levels can be changed at /api/admin/logging.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+LOG_SAMPLE_DEBUG = float(os.environ.get('LOG_SAMPLE_DEBUG', '0.01'))
+# Seconds between checks for log config changes made through other workers
+LOG_CONFIG_INTERVAL = float(os.environ.get('LOG_CONFIG_INTERVAL', '5'))
+
+log_manager = LogManager(LOG_LEVEL, LOG_FORMAT, sample_rates={'DEBUG': LOG_SAMPLE_DEBUG}).start()
+log = logging.getLogger('app')
+format_log = logging.getLogger('formats')
+
+# Startup runs in phases: importing this module only builds the app, the
+# database and job queue come up on a background thread, and yt-dlp is
+# imported on first use (or warmed in the background with PRELOAD_YT_DLP,
+# or in the gunicorn master by gunicorn.conf.py).
+STARTUP_TIMEOUT = float(os.environ.get('STARTUP_TIMEOUT', '30'))
+PRELOAD_YT_DLP = os.environ.get('PRELOAD_YT_DLP', '1') == '1'
+
+startup = Startup()
+
+# Routes that answer before the database is ready
+LIGHTWEIGHT_ENDPOINTS = {'test_endpoint', 'startup_status', 'serve_frontend'}
+
+@app.before_request
+def assign_request_id():
+    request_id_var.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16])
+    trace_var.set(request.headers.get('X-Trace') == '1')
+
+@app.before_request
+def wait_for_startup():
+    if request.endpoint in LIGHTWEIGHT_ENDPOINTS or startup.ready.is_set() and not startup.error:
+        return None
+    error = startup.wait(STARTUP_TIMEOUT)
+    if error:
+        return jsonify({'error': error}), 503
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+# Files of the React build, indexed once; gzip/brotli variants missing
+# from the build are compressed in the background at startup
+static_assets = StaticAssets('build').load()
+
 # Test endpoint
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
@@ -28,15 +100,17 @@ def test_video_info():
 # Debug endpoint to see what's being received
 @app.route('/api/debug', methods=['POST'])
 def debug_endpoint():
-    print(f"Headers: {dict(request.headers)}")
-    print(f"Content-Type: {request.content_type}")
-    print(f"Raw data: {request.get_data()}")
+    log.info("Debug request", extra={
+        'headers': dict(request.headers),
+        'content_type': request.content_type,
+        'raw_data': request.get_data(as_text=True)
+    })
     try:
         data = request.get_json()
-        print(f"Parsed JSON: {data}")
+        log.info("Debug request parsed", extra={'data': data})
         return jsonify({'received': data})
     except Exception as e:
-        print(f"Error parsing JSON: {e}")
+        log.warning("Debug request JSON error: %s", e)
         return jsonify({'error': str(e)})
 
 # Configuration
@@ -46,13 +120,214 @@ CONFIG_DIR = Path("config")
 CONFIG_DIR.mkdir(exist_ok=True)
 DATABASE = DATA_DIR / "downloads.db"
 
-# Global state for download management
-download_state = {
-    "is_downloading": False,
-    "current_download": None,
-    "progress": 0,
-    "status": "idle"
-}
+db = Database(DATABASE)
+
+# gunicorn worker processes (also read by gunicorn.conf.py). Shared state
+# lives in the database, so any worker can answer for any job.
+WEB_CONCURRENCY = max(int(os.environ.get('WEB_CONCURRENCY', '1')), 1)
+
+# Number of downloads that may run at the same time, across all workers
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', '2'))
+
+# yt-dlp extraction runs on its own pool so slow sites cannot tie up every
+# request thread: at most EXTRACTION_MAX_PENDING distinct URLs wait or run
+# (more get 503), and a request gives up waiting after EXTRACTION_TIMEOUT
+# seconds (the extraction still finishes and fills the cache)
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', '4'))
+EXTRACTION_MAX_PENDING = int(os.environ.get('EXTRACTION_MAX_PENDING', '16'))
+EXTRACTION_TIMEOUT = float(os.environ.get('EXTRACTION_TIMEOUT', '60'))
+
+extraction_pool = SingleFlightExecutor(EXTRACTION_WORKERS, EXTRACTION_MAX_PENDING, name='extract')
+
+# Extractions per site: at most HOST_MAX_CONCURRENCY at once, backing off
+# (up to HOST_BACKOFF_MAX seconds) when the site answers 429 (or 403 repeatedly); a request
+# waits up to HOST_MAX_WAIT for its turn. YoutubeDL instances are reused.
+HOST_MAX_CONCURRENCY = int(os.environ.get('HOST_MAX_CONCURRENCY', '2'))
+HOST_BACKOFF_MAX = float(os.environ.get('HOST_BACKOFF_MAX', '300'))
+HOST_MAX_WAIT = float(os.environ.get('HOST_MAX_WAIT', '30'))
+# Download jobs a throttled site sends back to the queue fail after this many retries
+JOB_MAX_RETRIES = int(os.environ.get('JOB_MAX_RETRIES', '10'))
+
+extraction_scheduler = ExtractionScheduler(
+    {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': False,
+        'encoding': 'utf-8',
+        'writesubtitles': False,
+        'writeautomaticsub': False,
+        'listsubtitles': False,
+    },
+    max_per_host=HOST_MAX_CONCURRENCY,
+    backoff_max=HOST_BACKOFF_MAX,
+    max_wait=HOST_MAX_WAIT
+)
+
+# ffmpeg post-processing (merging separate audio, remuxing to a faststart
+# MP4, thumbnails) runs on its own pool of POSTPROCESS_WORKERS processes so
+# a finished download frees its slot right away. Skipped without ffmpeg.
+FFMPEG = os.environ.get('FFMPEG', 'ffmpeg')
+POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS', '2'))
+POSTPROCESS_TIMEOUT = float(os.environ.get('POSTPROCESS_TIMEOUT', '3600'))
+POSTPROCESS_REMUX = os.environ.get('POSTPROCESS_REMUX', '1') == '1'
+POSTPROCESS_THUMBNAILS = os.environ.get('POSTPROCESS_THUMBNAILS', '0') == '1'
+
+processing = ProcessingPool(
+    FFMPEG, POSTPROCESS_WORKERS, POSTPROCESS_TIMEOUT, remux=POSTPROCESS_REMUX, thumbnails=POSTPROCESS_THUMBNAILS
+)
+
+# Thumbnails of video info and downloads are fetched (or generated with
+# ffmpeg) once, kept scaled down under data/thumbnails up to
+# THUMBNAIL_CACHE_SIZE, and served by /api/thumbnail/<id>
+THUMBNAIL_DIR = DATA_DIR / "thumbnails"
+THUMBNAIL_CACHE_SIZE = parse_size(os.environ.get('THUMBNAIL_CACHE_SIZE', '256M'))
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', '480'))
+THUMBNAIL_MAX_AGE = int(os.environ.get('THUMBNAIL_MAX_AGE', str(7 * 86400)))
+
+thumbnails = ThumbnailCache(db, THUMBNAIL_DIR, THUMBNAIL_CACHE_SIZE, THUMBNAIL_WIDTH, processing)
+
+# Downloads play in the browser as HLS (/api/hls/<id>/index.m3u8): segments
+# of about HLS_SEGMENT_SECONDS are stream-copied with ffmpeg when first
+# requested and kept under data/hls, least recently played deleted first
+# past HLS_CACHE_SIZE
+HLS_DIR = DATA_DIR / "hls"
+HLS_CACHE_SIZE = parse_size(os.environ.get('HLS_CACHE_SIZE', '2G'))
+HLS_SEGMENT_SECONDS = float(os.environ.get('HLS_SEGMENT_SECONDS', '6'))
+
+hls = HlsCache(HLS_DIR, processing, HLS_CACHE_SIZE, HLS_SEGMENT_SECONDS)
+
+def forget_download(download_id):
+    """Delete what was derived from a download (thumbnail, HLS segments)"""
+    thumbnails.remove(download_id)
+    hls.remove(download_id)
+
+# Server-Sent Events: max progress events per second per job, and how long
+# one stream stays open before the browser is asked to reconnect
+EVENTS_MAX_RATE = float(os.environ.get('EVENTS_MAX_RATE', '4'))
+EVENTS_STREAM_TIMEOUT = 300
+EVENTS_KEEPALIVE = 15
+
+event_broker = EventBroker(max_rate=EVENTS_MAX_RATE)
+
+# Video info cache: entries expire after INFO_CACHE_TTL seconds and at most
+# INFO_CACHE_SIZE URLs are kept in the database
+INFO_CACHE_TTL = int(os.environ.get('INFO_CACHE_TTL', '1800'))
+INFO_CACHE_SIZE = int(os.environ.get('INFO_CACHE_SIZE', '500'))
+
+info_cache = InfoCache(db, ttl=INFO_CACHE_TTL, max_entries=INFO_CACHE_SIZE)
+
+# Partial files of failed jobs are kept this long so the job can be resumed;
+# files no job owns are removed once older than the grace period
+PARTIAL_RETENTION_SECONDS = int(os.environ.get('PARTIAL_RETENTION_HOURS', '24')) * 3600
+PARTIAL_GRACE_SECONDS = 3600
+
+# /api/export: max files per archive and how long an export can be
+# downloaded again or resumed
+EXPORT_MAX_FILES = int(os.environ.get('EXPORT_MAX_FILES', '10000'))
+EXPORT_TTL = int(os.environ.get('EXPORT_TTL_HOURS', '24')) * 3600
+
+exports = ExportStore(db, ttl=EXPORT_TTL)
+
+# /api/downloads page sizes
+DOWNLOADS_PAGE_SIZE = 50
+MAX_DOWNLOADS_PAGE_SIZE = 500
+
+# How file bodies are sent: 'sendfile' (by the worker, zero-copy under
+# gunicorn), 'x-accel' (nginx X-Accel-Redirect) or 'x-sendfile' (Apache)
+SENDFILE_MODE = os.environ.get('SENDFILE_MODE', 'sendfile')
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-data/')
+
+# Total download bandwidth shared by all running jobs (e.g. '10M'; 0 = unlimited)
+# and how many fragments of an HLS/DASH download are fetched in parallel
+BANDWIDTH_LIMIT = parse_rate(os.environ.get('BANDWIDTH_LIMIT', '0'))
+FRAGMENT_CONCURRENCY = int(os.environ.get('FRAGMENT_CONCURRENCY', '4'))
+
+# Each worker process enforces an equal share of the limit
+bandwidth = BandwidthScheduler(BANDWIDTH_LIMIT / WEB_CONCURRENCY)
+
+# Storage quota for downloaded files (e.g. '50G'; 0 = unlimited), eviction
+# order ('lru' or 'age'), optional max idle age, and free space to keep
+STORAGE_QUOTA = parse_size(os.environ.get('STORAGE_QUOTA', '0'))
+STORAGE_POLICY = os.environ.get('STORAGE_POLICY', 'lru')
+STORAGE_MAX_AGE_SECONDS = float(os.environ.get('STORAGE_MAX_AGE_DAYS', '0')) * 86400
+STORAGE_MIN_FREE = parse_size(os.environ.get('STORAGE_MIN_FREE', '512M'))
+
+storage = StorageManager(
+    db,
+    DATA_DIR,
+    quota=STORAGE_QUOTA,
+    policy=STORAGE_POLICY,
+    max_age=STORAGE_MAX_AGE_SECONDS,
+    min_free=STORAGE_MIN_FREE,
+    on_remove=forget_download
+)
+
+# /api/files/bulk: max operations per request; files of deleted downloads
+# are unlinked in the background after the transaction commits
+FILES_BULK_MAX_ITEMS = int(os.environ.get('FILES_BULK_MAX_ITEMS', '5000'))
+
+# The app's own caches under DATA_DIR: not move targets, not scanned by the janitor
+RESERVED_DIRS = (THUMBNAIL_DIR.name, HLS_DIR.name)
+file_manager = BulkFileManager(db, DATA_DIR, reserved=RESERVED_DIRS, on_delete=forget_download)
+
+# /api/batch: parallel metadata extractions and max entries per request
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '4'))
+BATCH_MAX_ENTRIES = int(os.environ.get('BATCH_MAX_ENTRIES', '1000'))
+
+# Format picker rules (languages, containers, codecs); see formats.DEFAULT_RULES
+format_rules = load_rules(CONFIG_DIR / "format_rules.json")
+
+# Metrics served by /api/metrics. Hot paths only bump in-memory counters;
+# the callback metrics are read when the endpoint is scraped.
+EXTRACTION_SECONDS = Histogram(
+    'downloader_extraction_seconds', 'yt-dlp metadata extraction latency', ['extractor'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+FORMAT_PROCESSING_SECONDS = Histogram(
+    'downloader_format_processing_seconds', 'Time to filter, size and sort the format list'
+)
+DOWNLOAD_SECONDS = Histogram(
+    'downloader_download_seconds', 'Download job duration', ['extractor'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    'downloader_download_throughput_bytes_per_second', 'Average download throughput per job', ['extractor'],
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2)
+)
+POSTPROCESS_SECONDS = Histogram(
+    'downloader_postprocess_seconds', 'ffmpeg post-processing step duration', ['step'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 15, 30, 60, 300, 900)
+)
+BYTES_SERVED = Counter(
+    'downloader_bytes_served_total', 'Response body bytes of stored files sent to clients', ['endpoint']
+)
+CallbackMetric(
+    'downloader_info_cache_lookups_total', 'Video info cache lookups by result',
+    lambda: {(key,): value for key, value in info_cache.stats.items()},
+    kind='counter', labelnames=['result']
+)
+CallbackMetric(
+    'downloader_queue_depth', 'Jobs waiting in the download queue',
+    lambda: job_queue.counts().get(JOB_QUEUED, 0)
+)
+CallbackMetric('downloader_active_downloads', 'Downloads running in this process', lambda: job_queue.active_count())
+CallbackMetric('downloader_download_rate_bytes', 'Aggregate download rate', lambda: bandwidth.snapshot()['aggregate_rate'])
+CallbackMetric('downloader_event_subscribers', 'Open Server-Sent Events streams', lambda: event_broker.subscriber_count())
+CallbackMetric('downloader_extractions_pending', 'Extractions queued or running in this process', lambda: extraction_pool.pending())
+CallbackMetric(
+    'downloader_host_active_extractions', 'Extractions running against each host in this process',
+    lambda: {(host,): state['active'] for host, state in extraction_scheduler.snapshot()['hosts'].items()},
+    labelnames=['host']
+)
+CallbackMetric(
+    'downloader_host_backoff_seconds', 'Remaining backoff per host after 429/403 answers',
+    lambda: {(host,): state['backoff_seconds'] for host, state in extraction_scheduler.snapshot()['hosts'].items()},
+    labelnames=['host']
+)
+CallbackMetric('downloader_thumbnail_fetches_pending', 'Thumbnails being fetched or generated in this process', lambda: thumbnails.pending())
+CallbackMetric('downloader_hls_cuts_pending', 'HLS playlists and segments being cut in this process', lambda: hls.pending())
+CallbackMetric('downloader_bulk_unlinks_pending', 'Files of bulk-deleted downloads waiting to be unlinked', lambda: file_manager.pending())
+CallbackMetric('downloader_postprocess_pending', 'Downloads waiting for or running ffmpeg in this process', lambda: processing.pending())
 
 def init_database():
     """Initialize SQLite database for tracking downloads"""
@@ -61,43 +336,125 @@ def init_database():
         DATABASE.touch()
         DATABASE.chmod(0o777)
     
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            url TEXT NOT NULL,
-            filename TEXT NOT NULL,
-            filepath TEXT NOT NULL,
-            filesize INTEGER,
-            resolution TEXT,
-            duration REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status TEXT DEFAULT 'completed'
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    db.migrate()
+
+def follow_log_config():
+    """Apply log config changes made at /api/admin/logging by any worker"""
+    log_manager.follow(lambda: db.get_setting('logging'), LOG_CONFIG_INTERVAL)
 
-def progress_hook(d):
+def progress_hook(job_id, d):
     """Progress hook for yt-dlp downloads"""
+    fields = {}
     if d['status'] == 'downloading':
         if 'total_bytes' in d and d['total_bytes']:
             progress = (d['downloaded_bytes'] / d['total_bytes']) * 100
-            download_state['progress'] = round(progress, 2)
+            fields['progress'] = round(progress, 2)
+            fields['total_bytes'] = d['total_bytes']
         elif 'total_bytes_estimate' in d and d['total_bytes_estimate']:
             progress = (d['downloaded_bytes'] / d['total_bytes_estimate']) * 100
-            download_state['progress'] = round(progress, 2)
+            fields['progress'] = round(progress, 2)
+            fields['total_bytes'] = d['total_bytes_estimate']
+        
+        fields['downloaded_bytes'] = d.get('downloaded_bytes')
+        fields['speed'] = d.get('speed')
+        fields['eta'] = d.get('eta')
+        fields['fragment_index'] = d.get('fragment_index')
+        fields['fragment_count'] = d.get('fragment_count')
+        
+        stats = bandwidth.job_stats(job_id)
+        if stats:
+            fields['rate'] = stats['rate']
+            fields['rate_limit'] = stats['rate_limit']
+    
+    job_queue.report_progress(job_id, **fields)
+
+def trace_format(fmt, reason):
+    """select_formats trace hook: one DEBUG record per raw format"""
+    trace_log(
+        format_log, logging.DEBUG, "Format %s %s", fmt.get('format_id'), 'skipped' if reason else 'kept',
+        format_id=fmt.get('format_id'), ext=fmt.get('ext'), resolution=fmt.get('resolution'),
+        reason=reason
+    )
+
+def extract_metadata(url, block=False):
+    """Return the /api/video-info metadata for a URL, from the cache or yt-dlp.
+    
+    Raises ExecutorBusyError when the extraction pool is full (unless block)
+    and TimeoutError when extraction takes longer than EXTRACTION_TIMEOUT.
+    """
+    cached = info_cache.get(url)
+    if cached:
+        log.debug("Video info cache hit", extra={'url': url})
+        return dict(cached[1], url=url)
     
-    download_state['status'] = d['status']
+    # Concurrent requests for the same URL share one extraction
+    metadata = extraction_pool.run(normalize_url(url), fetch_metadata, url, timeout=EXTRACTION_TIMEOUT, block=block)
+    return dict(metadata, url=url)
+
+def fetch_metadata(url):
+    """Extract metadata with yt-dlp and cache it; runs on the extraction pool"""
+    # Extract video info using yt-dlp (within the site's limits)
+    started = time.perf_counter()
+    info = extraction_scheduler.extract(url)
+    elapsed = time.perf_counter() - started
+    EXTRACTION_SECONDS.labels(info.get('extractor_key', 'unknown')).observe(elapsed)
+    log.info("Extracted video info", extra={
+        'url': url,
+        'title': info.get('title'),
+        'extractor': info.get('extractor_key'),
+        'format_count': len(info.get('formats') or []),
+        'duration_ms': round(elapsed * 1000, 1)
+    })
+    # Extract relevant metadata
+    upload_date = info.get('upload_date', '')
+    if upload_date and len(upload_date) == 8:
+        # Format YYYYMMDD to readable date
+        try:
+            year = upload_date[:4]
+            month = upload_date[4:6]
+            day = upload_date[6:8]
+            upload_date = f"{year}-{month}-{day}"
+        except:
+            upload_date = upload_date
+    
+    metadata = {
+        'url': url,
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'uploader': info.get('uploader', 'Unknown'),
+        'view_count': info.get('view_count', 0),
+        'upload_date': upload_date,
+        # Served from the thumbnail cache instead of the origin
+        'thumbnail': thumbnails.register_url(pick_thumbnail(info, THUMBNAIL_WIDTH)),
+        'formats': []
+    }
+    
+    # Get all available formats
+    formats = info.get('formats', [])
+    if formats:
+        # Per-format decisions are only logged when format tracing is on
+        trace = trace_format if tracing(format_log) else None
+        
+        # Filter, size and sort the formats offered in the format picker
+        started = time.perf_counter()
+        available_formats = select_formats(formats, info.get('duration', 0), format_rules, trace=trace)
+        FORMAT_PROCESSING_SECONDS.observe(time.perf_counter() - started)
+        
+        # Add all formats to metadata
+        metadata['formats'] = available_formats
+        
+        if not available_formats:
+            log.warning("No formats available after filtering", extra={'url': url, 'format_count': len(formats)})
+    
+    # Cache the raw info (reused by download_video) and the processed metadata
+    info_cache.put(url, yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True), metadata)
+    return metadata
 
 @app.route('/api/video-info', methods=['POST'])
 def get_video_info():
     """Get video metadata without downloading"""
-    print("=== VIDEO-INFO ENDPOINT CALLED ===")
     try:
         data = request.get_json()
-        print(f"Received data: {data}")
         
         if not data:
             return jsonify({'error': 'No JSON data received'}), 400
@@ -106,332 +463,638 @@ def get_video_info():
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
-        print(f"Processing URL: {url}")
-        
-        # Check if another download is in progress
-        global download_state
-        if download_state['is_downloading']:
-            print("Another download is in progress")
-            return jsonify({'error': 'Another download is in progress'}), 400
-        
-        # Extract video info using yt-dlp
         try:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'encoding': 'utf-8',
-                'writesubtitles': False,
-                'writeautomaticsub': False,
-                'listsubtitles': False,
-            }
-            
-            print("Starting yt-dlp extraction...")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                title = info.get('title', 'Unknown')
-                try:
-                    print(f"yt-dlp extraction successful: {title}")
-                except UnicodeEncodeError:
-                    print("yt-dlp extraction successful: [Title contains special characters]")
-                
-                # Extract relevant metadata
-                upload_date = info.get('upload_date', '')
-                if upload_date and len(upload_date) == 8:
-                    # Format YYYYMMDD to readable date
-                    try:
-                        year = upload_date[:4]
-                        month = upload_date[4:6]
-                        day = upload_date[6:8]
-                        upload_date = f"{year}-{month}-{day}"
-                    except:
-                        upload_date = upload_date
-                
-                metadata = {
-                    'url': url,
-                    'title': info.get('title', 'Unknown'),
-                    'duration': info.get('duration', 0),
-                    'uploader': info.get('uploader', 'Unknown'),
-                    'view_count': info.get('view_count', 0),
-                    'upload_date': upload_date,
-                    'thumbnail': info.get('thumbnail', ''),
-                    'formats': []
-                }
-                
-                # Get all available formats
-                formats = info.get('formats', [])
-                if formats:
-                    print(f"Found {len(formats)} formats")
-                    
-                    # Process all video formats (not just the best one)
-                    available_formats = []
-                    print(f"Processing {len(formats)} formats...")
-                    for fmt in formats:
-                        print(f"Format: {fmt.get('format_id')} - {fmt.get('ext')} - {fmt.get('resolution')} - vcodec: {fmt.get('vcodec')} - acodec: {fmt.get('acodec')}")
-                        
-                        # Skip formats without video (but allow audio-only for some platforms)
-                        if fmt.get('vcodec') == 'none':
-                            continue
-                        
-                        # For Reddit and similar platforms, allow video-only formats
-                        # (audio will be merged during download)
-                        if fmt.get('acodec') == 'none' and fmt.get('ext') not in ['mp4', 'webm', 'mkv']:
-                            continue
-                        
-                        # Include all common video formats (be more permissive)
-                        if fmt.get('ext') not in ['mp4', 'webm', 'mkv', 'm4a', 'flv', 'avi', 'mov', 'wmv', '3gp']:
-                            continue
-                        
-                        # Language filtering: Only allow English and Hungarian audio
-                        audio_language_raw = fmt.get('language')
-                        audio_language = audio_language_raw.lower() if audio_language_raw else ''
-                        language_preference = fmt.get('language_preference', 0)
-                        
-                        # Check if format has explicit language info
-                        has_language_info = audio_language or language_preference > 0
-        
-                        # If format has language info and it's not English/Hungarian, skip it
-                        if has_language_info:
-                            if audio_language not in ['en', 'eng', 'english', 'hu', 'hun', 'hungarian', 'magyar', '']:
-                                print(f"Skipping format {fmt.get('format_id')} due to language: {audio_language}")
-                                continue
-                        
-                        # Additional check: Look for language codes in format note or description
-                        format_note_raw = fmt.get('format_note')
-                        format_note = format_note_raw.lower() if format_note_raw else ''
-                        if format_note and any(lang in format_note for lang in ['deutsch', 'german', 'de', 'ger']):
-                            print(f"Skipping format {fmt.get('format_id')} due to German language detected in format note: {format_note}")
-                            continue
-                        
-                        # Use actual file size if available, otherwise estimate
-                        filesize = fmt.get('filesize', 0)
-                        if filesize == 0 or filesize is None:
-                            # Estimate based on duration and resolution
-                            duration = info.get('duration', 0)
-                            resolution = fmt.get('resolution', '0x0')
-                            width, height = 0, 0
-                            if resolution and resolution != 'audio only':
-                                try:
-                                    width, height = map(int, resolution.split('x'))
-                                except:
-                                    pass
-                            
-                            # More accurate estimation based on resolution and duration
-                            total_pixels = width * height
-                            if total_pixels >= 1920 * 1080:  # 1080p or higher
-                                filesize = duration * 2.0 * 1024 * 1024  # 2MB per minute
-                            elif total_pixels >= 1280 * 720:  # 720p
-                                filesize = duration * 1.2 * 1024 * 1024  # 1.2MB per minute
-                            elif total_pixels >= 854 * 480:  # 480p
-                                filesize = duration * 0.8 * 1024 * 1024  # 0.8MB per minute
-                            elif total_pixels >= 640 * 360:  # 360p
-                                filesize = duration * 0.5 * 1024 * 1024  # 0.5MB per minute
-                            else:  # Lower resolution
-                                filesize = duration * 0.3 * 1024 * 1024  # 0.3MB per minute
-                        
-                        # Only include formats with sufficient information
-                        fps = fmt.get('fps')
-                        if fps is None or fps == 0:
-                            fps = None  # Don't show FPS if not available
-                        
-                        format_info = {
-                            'format_id': fmt.get('format_id'),
-                            'ext': fmt.get('ext'),
-                            'resolution': fmt.get('resolution', 'Unknown'),
-                            'filesize': int(filesize),
-                            'fps': fps,
-                            'vcodec': fmt.get('vcodec', 'Unknown'),
-                            'acodec': fmt.get('acodec', 'Unknown'),
-                            'quality': fmt.get('quality', 0),
-                            'format_note': fmt.get('format_note', ''),
-                            'tbr': fmt.get('tbr', 0),  # Total bitrate
-                            'language': audio_language or 'unknown',  # Add language info
-                            'language_preference': language_preference
-                        }
-                        
-                        # Skip formats with incomplete critical information
-                        if (format_info['format_id'] and 
-                            format_info['ext'] and 
-                            format_info['resolution'] != 'Unknown' and
-                            format_info['filesize'] > 0):
-                            available_formats.append(format_info)
-                    
-                    # Sort formats by resolution (highest first), then by quality, then by filesize
-                    def get_resolution_pixels(resolution_str):
-                        """Extract total pixels from resolution string for sorting"""
-                        if not resolution_str or resolution_str == 'Unknown':
-                            return 0
-                        try:
-                            if 'x' in resolution_str:
-                                width, height = map(int, resolution_str.split('x'))
-                                return width * height
-                        except:
-                            pass
-                        return 0
-                    
-                    available_formats.sort(key=lambda x: (
-                        get_resolution_pixels(x['resolution']),  # Primary: resolution (pixels)
-                        x['tbr'] if x['tbr'] else 0,            # Secondary: bitrate (higher is better)
-                        x['quality'] if x['quality'] else 0     # Tertiary: quality
-                    ), reverse=True)
-                    
-                    # Add all formats to metadata
-                    metadata['formats'] = available_formats
-                    print(f"Added {len(available_formats)} formats to metadata")
-                    
-                    if available_formats:
-                        best_format = available_formats[0]  # First one is highest quality
-                        print(f"Best format: {best_format.get('resolution', 'Unknown')} {best_format.get('ext', 'Unknown')}")
-                    else:
-                        print("No formats available after filtering!")
-                
-                try:
-                    print(f"Returning metadata: {metadata['title']}")
-                except UnicodeEncodeError:
-                    print("Returning metadata: [Title contains special characters]")
-                return jsonify(metadata)
-                
+            metadata = extract_metadata(url)
+        except ExecutorBusyError:
+            return jsonify({'error': 'Too many videos are being looked up, try again shortly'}), 503, {'Retry-After': '5'}
+        except TimeoutError:
+            return jsonify({'error': 'Video info is taking long to extract, try again shortly'}), 504
+        except HostThrottledError as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(round(e.retry_after), 1))}
         except Exception as e:
-            print(f"yt-dlp error: {str(e)}")
+            log.warning("Video info extraction failed: %s", e, extra={'url': url})
             return jsonify({'error': f'Failed to extract video info: {str(e)}'}), 400
         
+        return jsonify(metadata)
+        
     except Exception as e:
-        print(f"Error in video-info endpoint: {e}")
+        log.exception("Error in video-info endpoint")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/download', methods=['POST'])
 def start_download():
-    """Start video download"""
-    global download_state
-    
-    if download_state['is_downloading']:
-        return jsonify({'error': 'Another download is in progress'}), 400
-    
+    """Queue a video download and return its job ID"""
     data = request.get_json()
     url = data.get('url')
     filename = data.get('filename', 'video')
     format_id = data.get('format_id')  # Optional format selection
+    priority = data.get('priority', 'interactive')  # 'batch' yields bandwidth to interactive jobs
     
     if not url:
         return jsonify({'error': 'URL is required'}), 400
+    if priority not in PRIORITY_WEIGHTS:
+        return jsonify({'error': f"Invalid priority, use one of: {', '.join(PRIORITY_WEIGHTS)}"}), 400
+    
+    # Same URL and format already downloaded: answer with that file instantly
+    existing = find_existing_download(url, format_id)
+    if existing:
+        job_id = job_queue.submit_completed(url, filename, existing['id'], format_id, priority)
+        return jsonify({
+            'message': 'Already downloaded',
+            'job_id': job_id,
+            'job': job_queue.get_job(job_id),
+            'download_id': existing['id']
+        })
     
-    # Start download in background thread
-    thread = threading.Thread(target=download_video, args=(url, filename, format_id))
-    thread.daemon = True
-    thread.start()
+    job_id = job_queue.submit(url, filename, format_id, priority)
     
-    return jsonify({'message': 'Download started'})
+    return jsonify({'message': 'Download queued', 'job_id': job_id, 'job': job_queue.get_job(job_id)}), 202
 
-def download_video(url, filename, format_id=None):
-    """Download video in background thread"""
-    global download_state
+@app.route('/api/batch', methods=['POST'])
+def start_batch():
+    """Queue downloads for a list of URLs and/or a playlist, streaming results as NDJSON"""
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls') or []
+    playlist_url = data.get('playlist_url')
+    policy = data.get('format_policy') or {}
+    priority = data.get('priority', 'batch')
     
-    download_state['is_downloading'] = True
-    download_state['progress'] = 0
-    download_state['status'] = 'downloading'
+    if not isinstance(urls, list) or not all(isinstance(url, str) and url for url in urls):
+        return jsonify({'error': 'urls must be a list of URLs'}), 400
+    if not urls and not playlist_url:
+        return jsonify({'error': 'urls or playlist_url is required'}), 400
+    if not isinstance(policy, dict):
+        return jsonify({'error': 'format_policy must be an object'}), 400
+    max_height = policy.get('max_height')
+    if max_height is not None and (not isinstance(max_height, int) or isinstance(max_height, bool)):
+        return jsonify({'error': 'format_policy.max_height must be an integer'}), 400
+    if priority not in PRIORITY_WEIGHTS:
+        return jsonify({'error': f"Invalid priority, use one of: {', '.join(PRIORITY_WEIGHTS)}"}), 400
     
-    try:
+    urls = urls[:BATCH_MAX_ENTRIES]
+    
+    def sources():
+        for url in urls:
+            yield url, None
+        if playlist_url and len(urls) < BATCH_MAX_ENTRIES:
+            yield from expand_playlist(playlist_url, BATCH_MAX_ENTRIES - len(urls), extraction_scheduler)
+    
+    def process(index, url, title):
+        # The batch pool already bounds concurrency: wait for a slot instead of failing
+        metadata = extract_metadata(url, block=True)
+        format_id = pick_format(metadata['formats'], policy)
+        filename = metadata.get('title') or title or 'video'
+        result = {'type': 'entry', 'index': index, 'url': url, 'title': metadata.get('title'), 'format_id': format_id}
+        
+        existing = find_existing_download(url, format_id)
+        if existing:
+            job_id = job_queue.submit_completed(url, filename, existing['id'], format_id, priority)
+            return dict(result, status='exists', job_id=job_id, download_id=existing['id'])
+        
+        job_id = job_queue.submit(url, filename, format_id, priority)
+        return dict(result, status='queued', job_id=job_id)
+    
+    def generate():
+        cancelled = threading.Event()
+        counts = {'queued': 0, 'exists': 0, 'error': 0}
+        try:
+            # One line per entry as soon as it is queued, in completion order
+            for result in run_batch(sources(), process, BATCH_WORKERS, cancelled):
+                if result is None:
+                    break
+                if result['type'] == 'entry':
+                    counts[result['status']] += 1
+                yield json.dumps(result) + '\n'
+            yield json.dumps(dict(counts, type='done')) + '\n'
+        finally:
+            # Client went away: stop expanding the playlist
+            cancelled.set()
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def find_existing_download(url, format_id):
+    """Completed download of the same normalized URL and format whose file is still there"""
+    existing = db.find_completed_download(url, format_id)
+    if existing and os.path.exists(existing['filepath']):
+        return existing
+    return None
+
+def estimate_download_size(metadata, format_id):
+    """Estimated bytes of a download from the cached format list (None if unknown)"""
+    formats = {fmt['format_id']: fmt for fmt in metadata.get('formats', [])}
+    if not formats:
+        return None
+    if format_id:
+        # Merged selections like '137+140' download every part
+        parts = [formats.get(part) for part in format_id.split('+')]
+        if all(parts):
+            return sum(part.get('filesize') or 0 for part in parts) or None
+    # Default selector: assume the best format offered
+    return metadata['formats'][0].get('filesize')
+
+def record_format_pp(job_id):
+    """Post-processor recording the format yt-dlp selected so a resumed job picks the same one"""
+    # Defined here because yt-dlp is only imported once a download runs
+    class RecordFormatPP(yt_dlp.postprocessor.PostProcessor):
+        def run(self, info):
+            job_queue.update_job(job_id, selected_format=info.get('format_id'))
+            return [], info
+    
+    return RecordFormatPP()
+
+def download_video(job):
+    """Download a queued job's video; runs on a job queue worker thread"""
+    job_id = job['id']
+    url = job['url']
+    filename = job['filename']
+    format_id = job['format_id']
+    
+    # Another job may have fetched the same URL and format while this one was queued
+    existing = find_existing_download(url, format_id)
+    if existing:
+        log.info("Job reuses download %s", existing['id'])
+        return existing['id']
+    
+    # Extract through the scheduler (per-site limits, warm instances) so the
+    # download itself only fetches media
+    cached = info_cache.get(url)
+    if not cached:
+        try:
+            extract_metadata(url, block=True)
+            cached = info_cache.get(url)
+        except TimeoutError:
+            log.warning("Extraction is slow, the download extracts on its own")
+        except HostThrottledError as e:
+            # Wait out the site's backoff in the queue instead of failing the job
+            raise RetryLater(e.retry_after, str(e)) from e
+    
+    # Make room before starting instead of running out of space mid-write
+    estimated_size = estimate_download_size(cached[1], job.get('selected_format') or format_id) if cached else None
+    storage.reserve(estimated_size, reason=f'job {job_id}')
+    
+    output_path = job.get('output_template')
+    if output_path:
+        # Resuming an interrupted job: reuse its file name so yt-dlp continues the .part file
+        log.info("Resuming job into %s", output_path)
+    else:
         # Generate unique filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         safe_filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        output_filename = f"{safe_filename}_{timestamp}.%(ext)s"
-        output_path = DATA_DIR / output_filename
+        # The job id keeps jobs started in the same second from sharing a file
+        output_filename = f"{safe_filename}_{timestamp}_{job_id}.%(ext)s"
+        output_path = str(DATA_DIR / output_filename)
+        job_queue.update_job(job_id, output_template=output_path)
+    
+    # Build format selector
+    if job.get('selected_format'):
+        # Resume with the exact format the interrupted attempt picked
+        format_selector = job['selected_format']
+    elif format_id:
+        # Use specific format if provided
+        format_selector = format_id
+    else:
+        # Use fallback format selector that works better across platforms
+        format_selector = 'best[ext=mp4]/best[ext=webm]/best[ext=mkv]/best'
+    
+    recorded = {}
+    received = {}
+    received_lock = threading.Lock()
+    
+    def hook(d):
+        # Charge newly received bytes to the bandwidth scheduler; this sleeps
+        # (on the downloading or fragment thread) when the job is over its share
+        if d['status'] == 'downloading' and d.get('downloaded_bytes') is not None:
+            key = d.get('tmpfilename') or d.get('filename')
+            with received_lock:
+                delta = d['downloaded_bytes'] - received.get(key, d['downloaded_bytes'])
+                received[key] = d['downloaded_bytes']
+            bandwidth.consume(job_id, delta)
         
-        # Build format selector
-        if format_id:
-            # Use specific format if provided
-            format_selector = format_id
-        else:
-            # Use fallback format selector that works better across platforms
-            format_selector = 'best[ext=mp4]/best[ext=webm]/best[ext=mkv]/best'
+        progress_hook(job_id, d)
+        # Remember the .part file so the janitor knows it belongs to this job
+        tmpfilename = d.get('tmpfilename')
+        if tmpfilename and recorded.get('part_path') != tmpfilename:
+            recorded['part_path'] = tmpfilename
+            job_queue.update_job(job_id, part_path=tmpfilename)
+    
+    ydl_opts = {
+        'outtmpl': output_path,
+        'format': format_selector,
+        'progress_hooks': [hook],
+        'continuedl': True,
+        'concurrent_fragment_downloads': FRAGMENT_CONCURRENCY,
+        'quiet': True,
+        'noprogress': True,  # progress goes to the job queue, not stdout
+        'encoding': 'utf-8',
+    }
+    
+    bandwidth.register(job_id, job.get('priority') or 'interactive')
+    job_queue.start_phase(job_id, 'downloading')
+    try:
+        return _run_download(job, url, ydl_opts, cached)
+    finally:
+        bandwidth.unregister(job_id)
+
+def _run_download(job, url, ydl_opts, cached):
+    """Run yt-dlp for a job and record the finished file, or hand it to post-processing"""
+    job_id = job['id']
+    started = time.perf_counter()
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Cookies the extraction received (consent, session) go along
+        extraction_scheduler.share_cookies(ydl, url)
+        ydl.add_post_processor(record_format_pp(job_id), when='before_dl')
         
-        ydl_opts = {
-            'outtmpl': str(output_path),
-            'format': format_selector,
-            'progress_hooks': [progress_hook],
-            'quiet': True,
-            'encoding': 'utf-8',
-        }
+        info = None
+        if cached:
+            # Reuse the info extracted by /api/video-info instead of extracting again
+            try:
+                info = ydl.process_ie_result(copy.deepcopy(cached[0]), download=True)
+            except yt_dlp.utils.DownloadError as e:
+                log.warning("Cached info failed, extracting again: %s", e)
+                info_cache.invalidate(url)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if info is None:
             info = ydl.extract_info(url, download=True)
-            
-            # Get actual downloaded file path
-            actual_filename = ydl.prepare_filename(info)
-            if not os.path.exists(actual_filename):
-                # Try with different extensions
-                for ext in ['mp4', 'webm', 'mkv']:
-                    test_path = actual_filename.rsplit('.', 1)[0] + f'.{ext}'
-                    if os.path.exists(test_path):
-                        actual_filename = test_path
-                        break
-            
-            # Store download info in database
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO downloads (url, filename, filepath, filesize, resolution, duration)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                url,
-                os.path.basename(actual_filename),
-                actual_filename,
-                os.path.getsize(actual_filename) if os.path.exists(actual_filename) else 0,
-                info.get('resolution', 'Unknown'),
-                info.get('duration', 0)
-            ))
-            conn.commit()
-            conn.close()
-            
-            download_state['current_download'] = {
-                'filename': os.path.basename(actual_filename),
-                'filepath': actual_filename,
-                'filesize': os.path.getsize(actual_filename) if os.path.exists(actual_filename) else 0
-            }
-            
+        
+        # Get actual downloaded file path
+        actual_filename = ydl.prepare_filename(info)
+        if not os.path.exists(actual_filename):
+            # Try with different extensions
+            for ext in ['mp4', 'webm', 'mkv']:
+                test_path = actual_filename.rsplit('.', 1)[0] + f'.{ext}'
+                if os.path.exists(test_path):
+                    actual_filename = test_path
+                    break
+    
+    # A video-only format gets its audio from a second download; the
+    # post-processing pool muxes the two
+    audio_path = None
+    if processing.available and info.get('acodec') == 'none' and info.get('vcodec') not in (None, 'none'):
+        audio_path = _download_audio(ydl_opts, cached, info, actual_filename)
+    
+    elapsed = time.perf_counter() - started
+    extractor = info.get('extractor_key', 'unknown')
+    DOWNLOAD_SECONDS.labels(extractor).observe(elapsed)
+    if elapsed > 0 and os.path.exists(actual_filename):
+        DOWNLOAD_THROUGHPUT.labels(extractor).observe(os.path.getsize(actual_filename) / elapsed)
+    
+    steps = processing.plan(actual_filename, audio_path) if os.path.exists(actual_filename) else []
+    if not steps:
+        return record_download(job, info, actual_filename)
+    
+    # Free the download slot; postprocess_download finishes the job
+    job_queue.defer(job_id)
+    processing.submit(postprocess_download, job, info, actual_filename, audio_path, steps)
+    return JOB_DEFERRED
+
+def _download_audio(ydl_opts, cached, info, video_path):
+    """Download the best audio-only format next to the video; returns its path or None"""
+    base = os.path.splitext(video_path)[0]
+    audio_opts = dict(ydl_opts, format='bestaudio[ext=m4a]/bestaudio', outtmpl=base + '.audio.%(ext)s')
+    try:
+        with yt_dlp.YoutubeDL(audio_opts) as ydl:
+            extraction_scheduler.share_cookies(ydl, info.get('webpage_url') or info.get('original_url') or '')
+            audio_info = ydl.process_ie_result(copy.deepcopy(cached[0] if cached else info), download=True)
+            path = ydl.prepare_filename(audio_info)
+    except yt_dlp.utils.DownloadError as e:
+        log.warning("No separate audio downloaded, keeping the video only: %s", e)
+        return None
+    return path if os.path.exists(path) else None
+
+def postprocess_download(job, info, path, audio_path, steps):
+    """Run a downloaded job's ffmpeg steps and finish it; runs on the post-processing pool"""
+    # Runs in the download worker's context, so log records keep the job ID
+    job_id = job['id']
+    try:
+        if 'merge' in steps:
+            job_queue.start_phase(job_id, 'merging')
+            began = time.perf_counter()
+            path = processing.merge(path, audio_path)
+            POSTPROCESS_SECONDS.labels('merge').observe(time.perf_counter() - began)
+        if 'remux' in steps:
+            job_queue.start_phase(job_id, 'remuxing')
+            began = time.perf_counter()
+            path = processing.remux(path)
+            POSTPROCESS_SECONDS.labels('remux').observe(time.perf_counter() - began)
+        
+        download_id = record_download(job, info, path)
+        
+        if 'thumbnail' in steps:
+            job_queue.start_phase(job_id, 'thumbnail')
+            began = time.perf_counter()
+            try:
+                thumbnails.generate(download_id, path, info.get('duration'))
+                POSTPROCESS_SECONDS.labels('thumbnail').observe(time.perf_counter() - began)
+            except PostProcessingError as e:
+                log.warning("No thumbnail for download %s: %s", download_id, e)
+        
+        job_queue.finish(job_id, download_id=download_id)
     except Exception as e:
-        download_state['status'] = f'error: {str(e)}'
-    finally:
-        download_state['is_downloading'] = False
-        download_state['progress'] = 100
+        log.exception("Post-processing failed")
+        job_queue.finish(job_id, error=str(e))
+
+def record_download(job, info, path):
+    """Store a finished file in the database, deduplicate it and enforce the quota"""
+    job_id = job['id']
+    download_id = db.add_download(
+        job['url'],
+        os.path.basename(path),
+        path,
+        os.path.getsize(path) if os.path.exists(path) else 0,
+        info.get('resolution', 'Unknown'),
+        info.get('duration', 0),
+        format_id=job['format_id']
+    )
+    thumbnails.register(download_id, pick_thumbnail(info, THUMBNAIL_WIDTH))
+    
+    # Store identical content only once (hardlinked to the earlier copy)
+    try:
+        original_id = deduplicate_download(db, download_id)
+        if original_id:
+            log.info("Download %s has the same content as %s, hardlinked", download_id, original_id)
+    except OSError as e:
+        log.warning("Deduplication of download %s failed: %s", download_id, e)
+    
+    # The estimate may have been missing or low: bring usage back under the quota
+    storage.enforce(reason=f'job {job_id}')
+    
+    return download_id
+
+def publish_job_event(job, immediate):
+    """Forward job queue changes to Server-Sent Events subscribers"""
+    event_broker.publish(job['id'], job, immediate)
+
+job_queue = JobQueue(
+    db,
+    download_video,
+    max_workers=MAX_CONCURRENT_DOWNLOADS,
+    max_running=MAX_CONCURRENT_DOWNLOADS,
+    listener=publish_job_event,
+    # Jobs running in other workers only matter to open event streams
+    relay_when=lambda: event_broker.subscriber_count() > 0,
+    max_retries=JOB_MAX_RETRIES
+)
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List download jobs, optionally filtered by ?status=queued,running"""
+    status_param = request.args.get('status', '')
+    statuses = [s for s in status_param.split(',') if s]
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    return jsonify(job_queue.list_jobs(statuses, limit))
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of a single download job"""
+    job = job_queue.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<int:job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Re-queue a failed job; it continues from its partial file if one is left"""
+    if not job_queue.resume(job_id):
+        return jsonify({'error': 'Only failed jobs can be resumed'}), 400
+    return jsonify(job_queue.get_job(job_id))
 
-@app.route('/api/download-status', methods=['GET'])
-def get_download_status():
-    """Get current download status"""
-    return jsonify(download_state)
+@app.route('/api/janitor', methods=['POST'])
+def janitor_endpoint():
+    """Reconcile partial download files against the job table now"""
+    return jsonify(run_janitor(db, DATA_DIR, PARTIAL_GRACE_SECONDS, PARTIAL_RETENTION_SECONDS, RESERVED_DIRS))
+
+@app.route('/api/bandwidth', methods=['GET'])
+def get_bandwidth():
+    """Get per-job and aggregate download rates and limits"""
+    return jsonify(bandwidth.snapshot())
+
+@app.route('/api/storage', methods=['GET'])
+def get_storage():
+    """Get storage usage, quota and recent eviction runs"""
+    return jsonify(storage.get_stats())
+
+@app.route('/api/storage/evict', methods=['POST'])
+def evict_storage():
+    """Enforce the storage quota and age limit now"""
+    return jsonify(storage.enforce(reason='manual'))
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Expose metrics in the Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/admin/hosts')
+def extraction_hosts():
+    """Per-site extraction slots, waiting requests and backoff in this worker"""
+    return jsonify(extraction_scheduler.snapshot())
+
+@app.route('/api/admin/logging', methods=['GET', 'PUT'])
+def logging_config():
+    """Get or change log levels and sample rates at runtime"""
+    if request.method == 'PUT':
+        data = request.get_json(silent=True) or {}
+        try:
+            log_manager.apply(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': str(e)}), 400
+        # Other workers pick the change up from the database within LOG_CONFIG_INTERVAL
+        db.update_setting('logging', lambda current: {
+            key: {**((current or {}).get(key) or {}), **(data.get(key) or {})} for key in ('levels', 'sample_rates')
+        })
+        log.info("Logging configuration changed", extra={'config': data})
+    return jsonify(log_manager.get_config())
+
+@app.route('/api/info-cache/stats', methods=['GET'])
+def get_info_cache_stats():
+    """Get video info cache hit/miss counters"""
+    return jsonify(info_cache.get_stats())
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Stream job events as Server-Sent Events (all jobs, or ?job=<id>)"""
+    job_id = request.args.get('job', type=int)
+    
+    # Subscribe before taking the snapshot so no change falls in between
+    subscription = event_broker.subscribe(job_id)
+    if job_id is not None:
+        snapshot = [job for job in [job_queue.get_job(job_id)] if job]
+    else:
+        snapshot = job_queue.list_jobs([JOB_QUEUED, JOB_RUNNING, JOB_PROCESSING])
+    
+    def generate():
+        yield "retry: 3000\n\n"
+        for job in reversed(snapshot):
+            yield format_sse('job', job)
+        
+        deadline = time.time() + EVENTS_STREAM_TIMEOUT
+        while not subscription.closed and time.time() < deadline:
+            events = subscription.get(EVENTS_KEEPALIVE)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield format_sse('job', event)
+    
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs when the stream ends or the client disconnects
+    response.call_on_close(subscription.close)
+    return response
+
+def serve_file(filepath, mimetype, download_name=None, as_attachment=False):
+    """Send a stored file with Range/ETag support using the configured SENDFILE_MODE"""
+    response = send_file_range(
+        filepath,
+        mimetype,
+        download_name=download_name,
+        as_attachment=as_attachment,
+        mode=SENDFILE_MODE,
+        data_dir=DATA_DIR,
+        accel_prefix=X_ACCEL_PREFIX
+    )
+    if response.status_code in (200, 206) and response.content_length:
+        BYTES_SERVED.labels(request.endpoint).inc(response.content_length)
+    return response
 
 @app.route('/api/download-file/<int:download_id>', methods=['GET'])
 def download_file(download_id):
     """Download file to user's computer"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT filepath, filename FROM downloads WHERE id = ?', (download_id,))
-    result = cursor.fetchone()
-    conn.close()
+    download = db.get_download(download_id)
     
-    if not result:
+    if not download:
         abort(404)
     
-    filepath, filename = result
+    filepath, filename = download['filepath'], download['filename']
     
     if not os.path.exists(filepath):
         abort(404)
     
-    return send_file(filepath, as_attachment=True, download_name=filename)
+    storage.touch(download_id)
+    return serve_file(filepath, 'application/octet-stream', filename, as_attachment=True)
+
+@app.route('/api/export', methods=['POST'])
+def create_export():
+    """Stream a ZIP (store-only ZIP64) or tar archive of several downloads.
+
+    Takes JSON or form data: ``ids`` (list or comma-separated), or the
+    filters of /api/downloads (status, resolution, since, until, filename,
+    q), and ``format`` ('zip' or 'tar'). The archive can be fetched again
+    from the URL in Content-Location (tar with Range, to resume).
+    """
+    data = request.get_json(silent=True) or request.form.to_dict()
+    fmt = data.get('format', 'zip')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Invalid format, use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    
+    ids = data.get('ids')
+    try:
+        if ids:
+            if isinstance(ids, str):
+                ids = [part for part in ids.split(',') if part.strip()]
+            download_ids = list(dict.fromkeys(int(download_id) for download_id in ids))
+        else:
+            download_ids = []
+            cursor = None
+            while True:
+                items, cursor = db.list_downloads(
+                    limit=MAX_DOWNLOADS_PAGE_SIZE,
+                    cursor=cursor,
+                    status=data.get('status'),
+                    resolution=data.get('resolution'),
+                    since=data.get('since'),
+                    until=data.get('until'),
+                    filename=data.get('filename'),
+                    search=data.get('q')
+                )
+                download_ids.extend(item['id'] for item in items)
+                if not cursor or len(download_ids) > EXPORT_MAX_FILES:
+                    break
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid export request: {e}'}), 400
+    
+    if not download_ids:
+        return jsonify({'error': 'No downloads to export'}), 400
+    if len(download_ids) > EXPORT_MAX_FILES:
+        return jsonify({'error': f'Too many downloads to export (max {EXPORT_MAX_FILES})'}), 400
+    
+    return export_response(exports.create(download_ids, fmt))
+
+@app.route('/api/export/<export_id>', methods=['GET'])
+def get_export(export_id):
+    """Download an export again; tar exports support Range to resume"""
+    export = exports.get(export_id)
+    if not export:
+        return jsonify({'error': 'Export not found or expired'}), 404
+    return export_response(export)
+
+@app.route('/api/export/<export_id>/progress', methods=['GET'])
+def get_export_progress(export_id):
+    """Bytes sent by the latest transfer of an export"""
+    export = exports.get(export_id)
+    if not export:
+        return jsonify({'error': 'Export not found or expired'}), 404
+    export['download_ids'] = len(export['download_ids'])
+    return jsonify(export)
+
+def export_response(export):
+    """Archive response built from the files on disk, read one chunk at a time"""
+    archive, etag = exports.archive(export)
+    if not archive.entries:
+        return jsonify({'error': 'None of the files to export exist anymore'}), 404
+    
+    response = Response(mimetype=archive.mimetype)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['Content-Location'] = f"/api/export/{export['id']}"
+    response.headers['X-Export-ID'] = export['id']
+    response.headers.set(
+        'Content-Disposition', 'attachment',
+        filename=f"downloads-{datetime.fromtimestamp(export['created_at']):%Y%m%d-%H%M%S}.{archive.extension}"
+    )
+    
+    start, end = 0, archive.size - 1
+    if archive.supports_ranges:
+        response.headers['Accept-Ranges'] = 'bytes'
+        try:
+            byte_range = parse_range_header(request.headers.get('Range'), archive.size)
+        except RangeNotSatisfiable:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{archive.size}'
+            return response
+        # The ETag changes if a file changed since, and then the whole archive is sent
+        modified = max([export['created_at']] + [entry.mtime for entry in archive.entries])
+        if byte_range and if_range_matches(request.headers.get('If-Range'), etag, modified):
+            start, end = byte_range
+            response.status_code = 206
+            response.headers['Content-Range'] = f'bytes {start}-{end}/{archive.size}'
+    else:
+        response.headers['Accept-Ranges'] = 'none'
+    
+    bytes_served = BYTES_SERVED.labels(request.endpoint)
+    response.response = exports.stream(export, archive, start, end, on_bytes=bytes_served.inc)
+    response.direct_passthrough = True
+    response.content_length = end - start + 1
+    return response
 
 @app.route('/api/stream-file/<int:download_id>', methods=['GET'])
 def stream_file(download_id):
     """Stream file for video player (no download attachment)"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT filepath, filename FROM downloads WHERE id = ?', (download_id,))
-    result = cursor.fetchone()
-    conn.close()
+    download = db.get_download(download_id)
     
-    if not result:
+    if not download:
         abort(404)
     
-    filepath, filename = result
+    filepath, filename = download['filepath'], download['filename']
     
     if not os.path.exists(filepath):
         abort(404)
@@ -453,30 +1116,77 @@ def stream_file(download_id):
     
     mimetype = mime_types.get(file_ext, 'video/mp4')
     
-    return send_file(filepath, mimetype=mimetype, as_attachment=False)
+    storage.touch(download_id)
+    return serve_file(filepath, mimetype)
+
+@app.route('/api/hls/<int:download_id>/index.m3u8')
+def hls_playlist(download_id):
+    """HLS playlist of a download; its segments are cut when first requested"""
+    download = db.get_download(download_id)
+    
+    if not download or not os.path.exists(download['filepath']):
+        abort(404)
+    
+    try:
+        playlist, etag = hls.playlist(download_id, download['filepath'], timeout=EXTRACTION_TIMEOUT)
+    except HlsUnavailableError as e:
+        return jsonify({'error': str(e)}), 415
+    except ExecutorBusyError:
+        return jsonify({'error': 'Too many videos are being prepared, try again shortly'}), 503, {'Retry-After': '5'}
+    except TimeoutError:
+        return jsonify({'error': 'Video is taking long to prepare, try again shortly'}), 504
+    
+    storage.touch(download_id)
+    response = Response(playlist, mimetype=PLAYLIST_MIMETYPE)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/hls/<int:download_id>/<int:segment>.ts')
+def hls_segment(download_id, segment):
+    """One segment of a download's HLS playlist"""
+    download = db.get_download(download_id)
+    
+    if not download or not os.path.exists(download['filepath']):
+        abort(404)
+    
+    try:
+        path = hls.segment(download_id, download['filepath'], segment, timeout=EXTRACTION_TIMEOUT)
+    except HlsUnavailableError as e:
+        return jsonify({'error': str(e)}), 415
+    except ExecutorBusyError:
+        return jsonify({'error': 'Too many segments are being cut, try again shortly'}), 503, {'Retry-After': '1'}
+    except TimeoutError:
+        return jsonify({'error': 'Segment is taking long to cut, try again shortly'}), 504
+    except PostProcessingError as e:
+        log.warning("Could not cut HLS segment %d of download %d: %s", segment, download_id, e)
+        return jsonify({'error': f'Could not cut segment: {e}'}), 500
+    if path is None:
+        abort(404)
+    
+    storage.touch(download_id)
+    return serve_file(path, SEGMENT_MIMETYPE)
 
 @app.route('/api/delete-file/<int:download_id>', methods=['DELETE'])
 def delete_file(download_id):
     """Delete file from server"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT filepath FROM downloads WHERE id = ?', (download_id,))
-    result = cursor.fetchone()
+    download = db.get_download(download_id)
     
-    if not result:
-        conn.close()
+    if not download:
         return jsonify({'error': 'File not found'}), 404
     
-    filepath = result[0]
+    filepath = download['filepath']
     
-    # Delete file from filesystem
-    if os.path.exists(filepath):
+    # Delete file from filesystem unless another record still points at it.
+    # Deduplicated copies are hardlinks, so their data is only freed when
+    # the last link goes.
+    if os.path.exists(filepath) and db.count_file_references(filepath) <= 1:
         os.remove(filepath)
     
+    forget_download(download_id)
+    
     # Delete record from database
-    cursor.execute('DELETE FROM downloads WHERE id = ?', (download_id,))
-    conn.commit()
-    conn.close()
+    db.delete_download(download_id)
     
     return jsonify({'message': 'File deleted successfully'})
 
@@ -489,21 +1199,15 @@ def rename_file(download_id):
     if not new_filename:
         return jsonify({'error': 'New filename is required'}), 400
     
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
     # Get current file info
-    cursor.execute('SELECT filepath, filename FROM downloads WHERE id = ?', (download_id,))
-    result = cursor.fetchone()
+    download = db.get_download(download_id)
     
-    if not result:
-        conn.close()
+    if not download:
         return jsonify({'error': 'File not found'}), 404
     
-    old_filepath, old_filename = result
+    old_filepath, old_filename = download['filepath'], download['filename']
     
     if not os.path.exists(old_filepath):
-        conn.close()
         return jsonify({'error': 'Physical file not found'}), 404
     
     # Generate new filepath
@@ -514,7 +1218,6 @@ def rename_file(download_id):
     
     # Check if new filename already exists
     if os.path.exists(new_filepath):
-        conn.close()
         return jsonify({'error': 'A file with this name already exists'}), 400
     
     try:
@@ -522,48 +1225,106 @@ def rename_file(download_id):
         os.rename(old_filepath, new_filepath)
         
         # Update database record
-        cursor.execute('''
-            UPDATE downloads 
-            SET filename = ?, filepath = ? 
-            WHERE id = ?
-        ''', (new_filename_with_ext, new_filepath, download_id))
-        
-        conn.commit()
-        conn.close()
+        db.rename_download(download_id, new_filename_with_ext, new_filepath)
         
         return jsonify({'message': 'File renamed successfully'})
         
     except Exception as e:
-        conn.close()
         return jsonify({'error': f'Failed to rename file: {str(e)}'}), 500
 
+@app.route('/api/files/bulk', methods=['POST'])
+def bulk_files():
+    """Delete, rename or move many downloads in one transaction.
+
+    Takes ``operations``, a list of ``{"op": "delete", "id": 1}``,
+    ``{"op": "rename", "id": 2, "filename": "new name"}`` (the extension is
+    kept) or ``{"op": "move", "id": 3, "folder": "music"}`` (a folder under
+    data/, "" for data/ itself). With ``"atomic": true``, nothing is applied
+    unless every operation succeeds. Answers with one result per operation.
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations must be a non-empty list'}), 400
+    if len(operations) > FILES_BULK_MAX_ITEMS:
+        return jsonify({'error': f'At most {FILES_BULK_MAX_ITEMS} operations per request'}), 400
+    
+    try:
+        results = file_manager.apply(operations, atomic=bool(data.get('atomic')))
+    except Exception as e:
+        log.error("Bulk file operations rolled back: %s", e, extra={'operations': len(operations)})
+        return jsonify({'error': f'Failed to apply operations, nothing was changed: {str(e)}'}), 500
+    
+    succeeded = sum(1 for result in results if result['ok'])
+    return jsonify({'results': results, 'succeeded': succeeded, 'failed': len(results) - succeeded})
+
 @app.route('/api/downloads', methods=['GET'])
 def list_downloads():
-    """List all completed downloads"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, url, filename, filesize, resolution, duration, created_at, status
-        FROM downloads 
-        ORDER BY created_at DESC
-    ''')
-    downloads = cursor.fetchall()
-    conn.close()
-    
-    result = []
-    for download in downloads:
-        result.append({
-            'id': download[0],
-            'url': download[1],
-            'filename': download[2],
-            'filesize': download[3],
-            'resolution': download[4],
-            'duration': download[5],
-            'created_at': download[6],
-            'status': download[7]
-        })
+    """List downloads newest first, one page at a time.
+
+    Query parameters: limit, cursor (next_cursor of the previous page),
+    status, resolution, since/until (dates), filename (substring) and
+    q (full-text search over filename and URL).
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', DOWNLOADS_PAGE_SIZE)), 1), MAX_DOWNLOADS_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    # The ETag changes whenever the downloads table, their thumbnails or the query change
+    version = f"{db.table_version('downloads')}-{db.table_version('thumbnails')}"
+    etag = hashlib.sha1(f"{version}?{request.query_string.decode()}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    try:
+        items, next_cursor = db.list_downloads(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            status=request.args.get('status'),
+            resolution=request.args.get('resolution'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            filename=request.args.get('filename'),
+            search=request.args.get('q')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Only rows with a thumbnail to show, so the UI does not request ones that would 404
+    with_thumbnail = thumbnails.listed(item['id'] for item in items)
+    for item in items:
+        if str(item['id']) in with_thumbnail:
+            item['thumbnail'] = f"/api/thumbnail/{item['id']}"
     
-    return jsonify(result)
+    response = jsonify({'items': items, 'next_cursor': next_cursor})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/thumbnail/<thumb_id>')
+def get_thumbnail(thumb_id):
+    """Serve a cached thumbnail (a download ID or an ID from /api/video-info)"""
+    if not THUMBNAIL_ID.fullmatch(thumb_id):
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    try:
+        thumbnail = thumbnails.get(thumb_id, timeout=EXTRACTION_TIMEOUT)
+    except ExecutorBusyError:
+        return jsonify({'error': 'Too many thumbnails are being fetched, try again shortly'}), 503, {'Retry-After': '5'}
+    except TimeoutError:
+        return jsonify({'error': 'Thumbnail is taking long to fetch, try again shortly'}), 504
+    if thumbnail is None:
+        return jsonify({'error': 'Thumbnail not found'}), 404
+
+    path, mimetype, etag = thumbnail
+    # A thumbnail ID always names the same image, so browsers may keep it;
+    # the ETag answers revalidations with 304
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=THUMBNAIL_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    return response
 
 # Serve word lists for random filename generation
 @app.route('/api/word-lists/<list_type>')
@@ -584,7 +1345,7 @@ def get_word_list(list_type):
         return jsonify(word_list)
     
     except Exception as e:
-        print(f"Error loading word list {list_type}: {e}")
+        log.warning("Error loading word list %s: %s", list_type, e)
         return jsonify({'error': 'Failed to load word list'}), 500
 
 # Serve React frontend
@@ -596,22 +1357,41 @@ def serve_frontend(path):
         # Let API routes be handled by their specific handlers
         abort(404)
     
-    # Check if it's a static file request
-    if '.' in path and not path.endswith('.html'):
-        # Try to serve static file
-        try:
-            return send_file(f'build/{path}')
-        except:
-            pass
-    
-    # Serve the main React app for all other routes
+    # Client-side routes get index.html; anything else not in the build is a 404
+    asset = static_assets.lookup(path)
+    if asset is None:
+        if static_assets.lookup('') is None:
+            return "Frontend not built. Please run 'npm run build' first.", 500
+        abort(404)
+    return static_assets.response(asset, request)
+
+def startup_janitor():
+    """Clean up partial files left behind by a previous run and enforce the storage quota"""
+    try:
+        report = run_janitor(db, DATA_DIR, PARTIAL_GRACE_SECONDS, PARTIAL_RETENTION_SECONDS, RESERVED_DIRS)
+        if report['deleted']:
+            log.info("Janitor removed %d partial files (%d bytes)", len(report['deleted']), report['reclaimed_bytes'])
+    except Exception:
+        log.exception("Janitor failed")
     try:
-        return send_file('build/index.html')
-    except:
-        return "Frontend not built. Please run 'npm run build' first.", 500
+        storage.enforce(reason='startup')
+    except Exception as e:
+        log.exception("Storage eviction failed")
+
+@app.route('/api/startup', methods=['GET'])
+def startup_status():
+    """Startup phases and their durations; answers before the app is ready"""
+    return jsonify(startup.get_status())
 
-# Initialize database when the module is imported
-init_database()
+# Initialize the database and resume queued downloads in the background;
+# requests that need them wait in wait_for_startup
+startup.start(
+    required=[('database', init_database), ('log-config', follow_log_config), ('job-queue', job_queue.start)],
+    background=[('janitor', startup_janitor), ('static-assets', static_assets.compress_missing)] + (
+        # Already imported when gunicorn.conf.py warmed it in the master
+        [('yt-dlp', warm_yt_dlp)] if PRELOAD_YT_DLP and not yt_dlp.loaded else []
+    )
+)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,146 @@
+import re
+import threading
+import time
+
+# Share of the total rate each job gets relative to the others
+PRIORITY_WEIGHTS = {'interactive': 4, 'batch': 1}
+
+# Never throttle a job below this rate (bytes/s)
+MIN_RATE = 32 * 1024
+
+
+def parse_rate(value):
+    """Parse a rate like '10M', '512K' or '1048576' (bytes per second); 0 = unlimited"""
+    if not value:
+        return 0
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f'Invalid rate: {value}')
+    number, unit = match.groups()
+    multiplier = 1024 ** ('KMG'.index(unit.upper()) + 1) if unit else 1
+    return int(float(number) * multiplier)
+
+
+class _Flow:
+    """Bandwidth state of one running job"""
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.weight = PRIORITY_WEIGHTS.get(priority, 1)
+        self.limit = 0
+        self.tokens = 0.0
+        self.refilled_at = time.monotonic()
+        self.rate = 0.0
+        self.window_bytes = 0
+        self.window_start = time.monotonic()
+        self.total_bytes = 0
+
+
+class BandwidthScheduler:
+    """Process-wide token-bucket bandwidth scheduler.
+
+    Every running job gets its own token bucket. The configured total rate
+    is split between active jobs by priority weight with max-min fairness:
+    a job that uses less than its share (because the upstream is slower)
+    hands the rest to the others. Jobs are throttled by sleeping in the
+    yt-dlp progress hook, which runs on the downloading thread.
+    """
+
+    def __init__(self, total_rate=0, rebalance_interval=1.0):
+        self.total_rate = total_rate
+        self.rebalance_interval = rebalance_interval
+        self._flows = {}
+        self._lock = threading.Lock()
+        self._rebalanced_at = 0.0
+
+    def register(self, job_id, priority='interactive'):
+        with self._lock:
+            self._flows[job_id] = _Flow(priority)
+            self._rebalance()
+
+    def unregister(self, job_id):
+        with self._lock:
+            self._flows.pop(job_id, None)
+            self._rebalance()
+
+    def consume(self, job_id, nbytes):
+        """Account nbytes received by a job, sleeping if it is over its share"""
+        if nbytes <= 0:
+            return
+        with self._lock:
+            flow = self._flows.get(job_id)
+            if flow is None:
+                return
+            now = time.monotonic()
+            flow.total_bytes += nbytes
+            flow.window_bytes += nbytes
+            elapsed = now - flow.window_start
+            if elapsed >= 1.0:
+                # Exponentially weighted moving average of the received rate
+                current = flow.window_bytes / elapsed
+                flow.rate = current if flow.rate == 0 else 0.7 * flow.rate + 0.3 * current
+                flow.window_bytes = 0
+                flow.window_start = now
+
+            if now - self._rebalanced_at >= self.rebalance_interval:
+                self._rebalance()
+
+            if not flow.limit:
+                return
+            # Refill the bucket (at most one second of burst), then pay for the bytes
+            flow.tokens = min(flow.tokens + (now - flow.refilled_at) * flow.limit, flow.limit)
+            flow.refilled_at = now
+            flow.tokens -= nbytes
+            delay = -flow.tokens / flow.limit if flow.tokens < 0 else 0
+
+        if delay:
+            time.sleep(delay)
+
+    def _rebalance(self):
+        """Split total_rate across flows by weight, capping flows that need less"""
+        self._rebalanced_at = time.monotonic()
+        if not self.total_rate:
+            for flow in self._flows.values():
+                flow.limit = 0
+            return
+
+        remaining = float(self.total_rate)
+        pending = list(self._flows.values())
+        while pending:
+            weight_sum = sum(flow.weight for flow in pending)
+            # A flow that measurably stays below its fair share only gets what
+            # it uses (plus headroom to grow); the rest is shared again
+            capped = [
+                flow for flow in pending
+                if flow.rate and flow.rate * 1.25 < remaining * flow.weight / weight_sum
+            ]
+            if not capped:
+                for flow in pending:
+                    flow.limit = max(int(remaining * flow.weight / weight_sum), MIN_RATE)
+                break
+            for flow in capped:
+                flow.limit = max(int(flow.rate * 1.25), MIN_RATE)
+                remaining -= flow.limit
+                pending.remove(flow)
+            remaining = max(remaining, 0)
+
+    def job_stats(self, job_id):
+        with self._lock:
+            flow = self._flows.get(job_id)
+            if flow is None:
+                return None
+            return {'rate': int(flow.rate), 'rate_limit': flow.limit or None, 'priority': flow.priority}
+
+    def snapshot(self):
+        """Per-job and aggregate rates for the status API"""
+        with self._lock:
+            jobs = {
+                job_id: {'rate': int(flow.rate), 'rate_limit': flow.limit or None, 'priority': flow.priority}
+                for job_id, flow in self._flows.items()
+            }
+        return {
+            'total_limit': self.total_rate or None,
+            'aggregate_rate': sum(job['rate'] for job in jobs.values()),
+            'active_jobs': len(jobs),
+            'jobs': jobs,
+        }
@@ -0,0 +1,125 @@
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from startup import yt_dlp
+
+# Marks the end of a playlist's entries (an entry itself may be None)
+_END = object()
+
+
+def expand_playlist(playlist_url, max_entries, scheduler):
+    """Yield (url, title) for each playlist entry, fetching pages lazily.
+
+    Uses flat extraction, so only the playlist pages are requested here;
+    the entries' own metadata is extracted later on the batch pool. Every
+    page is fetched within the site's limits of ``scheduler`` (an
+    ExtractionScheduler), with the site's cookies.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+        'playlistend': max_entries,
+        'encoding': 'utf-8',
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        scheduler.share_cookies(ydl, playlist_url)
+        with scheduler.slot(playlist_url):
+            info = ydl.extract_info(playlist_url, download=False, process=False)
+            # Follow redirects (e.g. a channel URL pointing at its videos tab)
+            for _ in range(5):
+                if info.get('_type') not in ('url', 'url_transparent'):
+                    break
+                info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            # Not a playlist after all: treat it as a single video
+            yield info.get('webpage_url') or playlist_url, info.get('title')
+            return
+        entries = iter(info.get('entries') or [])
+        for _ in range(max_entries):
+            # Reading an entry may fetch the next page; the slot is not held between entries
+            with scheduler.slot(playlist_url):
+                entry = next(entries, _END)
+            if entry is _END:
+                break
+            if not entry:
+                continue
+            url = entry.get('webpage_url') or entry.get('url')
+            if url:
+                yield url, entry.get('title')
+
+
+def pick_format(formats, policy):
+    """Choose a format_id from a video's selected formats by the batch format policy.
+
+    ``policy`` may pin a yt-dlp ``format`` selector for every entry, or set
+    ``max_height`` and/or ``ext`` to pick the best matching format. Without
+    either the best format of the picker (the first one) is used.
+    """
+    if policy.get('format'):
+        return policy['format']
+
+    max_height = policy.get('max_height')
+    ext = policy.get('ext')
+    for fmt in formats:
+        if ext and fmt.get('ext') != ext:
+            continue
+        if max_height:
+            resolution = fmt.get('resolution') or ''
+            height = resolution.split('x')[-1] if 'x' in resolution else ''
+            if not height.isdigit() or int(height) > max_height:
+                continue
+        return fmt['format_id']
+
+    # Nothing matched: let the downloader's default selector decide
+    return None
+
+
+def run_batch(sources, process, max_workers=4, cancelled=None):
+    """Run process(index, url, title) for every source on a bounded pool.
+
+    ``sources`` is an iterable of (url, title) that may expand lazily; it is
+    consumed on a feeder thread at most ``2 * max_workers`` entries ahead of
+    the pool. Yields process() results in completion order, then a final
+    ``None`` once every entry is done. Setting ``cancelled`` stops feeding.
+    """
+    cancelled = cancelled or threading.Event()
+    results = queue.Queue()
+    slots = threading.Semaphore(max_workers * 2)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+
+    def work(index, url, title):
+        try:
+            results.put(process(index, url, title))
+        except Exception as e:
+            results.put({'type': 'entry', 'index': index, 'url': url, 'status': 'error', 'error': str(e)})
+        finally:
+            slots.release()
+
+    def feed():
+        submitted = 0
+        try:
+            for index, (url, title) in enumerate(sources):
+                slots.acquire()
+                if cancelled.is_set():
+                    break
+                # Carry the request ID into the worker's log records
+                pool.submit(contextvars.copy_context().run, work, index, url, title)
+                submitted += 1
+        except Exception as e:
+            results.put({'type': 'error', 'error': f'Failed to expand playlist: {e}'})
+        finally:
+            pool.shutdown(wait=True)
+            results.put(None)
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(feed,), daemon=True, name='batch-feeder').start()
+
+    while True:
+        result = results.get()
+        yield result
+        if result is None:
+            return
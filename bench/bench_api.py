@@ -0,0 +1,260 @@
+"""Benchmark the API end to end against a local fake video host.
+
+Usage:
+    python bench/bench_api.py [--scenarios video-info,download,downloads,stream]
+                              [--concurrency 8] [--json out.json]
+
+Starts bench/fake_host.py and app.py under gunicorn with the stub
+extractor plugin (bench/plugins) on PYTHONPATH, so nothing leaves the
+machine. Each scenario reports p50/p99 latency and throughput; the
+server's peak RSS is sampled while it runs.
+
+    video-info  POST /api/video-info, cold (extraction) and warm (cached)
+    download    POST /api/download for progressive MP4, HLS and DASH media,
+                timed until the jobs complete
+    downloads   GET /api/downloads pages over a seeded history
+    stream      ranged GET /api/stream-file requests
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_host import FakeVideoHost
+from harness import AppServer, percentile, process_rss_mb, stub_extractor_env, write_results
+
+SCENARIOS = ('video-info', 'download', 'downloads', 'stream')
+
+
+def summarize(latencies, wall, errors, nbytes=None):
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'requests_per_s': round(len(latencies) / wall, 1) if wall else 0,
+    }
+    if nbytes is not None:
+        summary['throughput_mb_s'] = round(nbytes / wall / 1024 / 1024, 1) if wall else 0
+    return summary
+
+
+def run_concurrently(task, items, concurrency):
+    """Run task(item) -> (ok, nbytes) on a pool; returns the summary"""
+    latencies = []
+    counters = {'errors': 0, 'bytes': 0}
+    lock = threading.Lock()
+
+    def timed(item):
+        began = time.perf_counter()
+        try:
+            ok, nbytes = task(item)
+        except OSError:
+            ok, nbytes = False, 0
+        elapsed = (time.perf_counter() - began) * 1000
+        with lock:
+            latencies.append(elapsed)
+            counters['bytes'] += nbytes
+            if not ok:
+                counters['errors'] += 1
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, items))
+    wall = time.perf_counter() - began
+    return summarize(latencies, wall, counters['errors'], counters['bytes'])
+
+
+def bench_video_info(server, host, args):
+    urls = [
+        host.watch_url(f'info{i}', formats=args.formats, latency=args.extract_latency)
+        for i in range(args.requests)
+    ]
+
+    def fetch(url):
+        status, body = server.request('POST', '/api/video-info', {'url': url})
+        return status == 200, len(body)
+
+    return {
+        'cold': run_concurrently(fetch, urls, args.concurrency),
+        'warm': run_concurrently(fetch, urls, args.concurrency),
+    }
+
+
+def bench_download(server, host, args):
+    results = {}
+    size = int(args.media_mb * 1024 * 1024)
+    for kind in ('mp4', 'hls', 'dash'):
+        urls = [
+            host.watch_url(f'dl-{kind}-{i}', kind=kind, size=size, formats=args.formats)
+            for i in range(args.downloads)
+        ]
+
+        def download(url):
+            status, body = server.request('POST', '/api/download', {'url': url, 'filename': 'bench'})
+            if status not in (200, 202):
+                return False, 0
+            job_id = json.loads(body)['job_id']
+            deadline = time.time() + args.timeout
+            while time.time() < deadline:
+                status, body = server.request('GET', f'/api/jobs/{job_id}')
+                job = json.loads(body)
+                if job['status'] == 'completed':
+                    return True, size
+                if job['status'] == 'failed':
+                    return False, 0
+                time.sleep(0.05)
+            return False, 0
+
+        results[kind] = run_concurrently(download, urls, args.concurrency)
+    return results
+
+
+def seed_downloads(server, rows):
+    conn = sqlite3.connect(server.database, timeout=30)
+    conn.executemany('''
+        INSERT INTO downloads (url, filename, filepath, filesize, resolution, duration, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))
+    ''', [
+        (f'https://example.com/watch?v={i}', f'seeded video {i}.mp4', f'/nonexistent/{i}.mp4',
+         1024 * 1024, '1920x1080', 60, f'-{i} minutes')
+        for i in range(rows)
+    ])
+    conn.commit()
+    conn.close()
+
+
+def bench_downloads(server, host, args):
+    seed_downloads(server, args.rows)
+
+    # Collect cursors for deep pages once, then request random pages
+    cursors = [None]
+    while len(cursors) < 50:
+        path = '/api/downloads?limit=50' + (f'&cursor={cursors[-1]}' if cursors[-1] else '')
+        status, body = server.request('GET', path)
+        next_cursor = json.loads(body).get('next_cursor')
+        if not next_cursor:
+            break
+        cursors.append(next_cursor)
+
+    rng = random.Random(1)
+    paths = []
+    for i in range(args.requests):
+        cursor = rng.choice(cursors)
+        path = '/api/downloads?limit=50' + (f'&cursor={cursor}' if cursor else '')
+        if i % 4 == 3:
+            path += '&q=video+1'
+        paths.append(path)
+
+    def fetch(path):
+        status, body = server.request('GET', path)
+        return status == 200, len(body)
+
+    return run_concurrently(fetch, paths, args.concurrency)
+
+
+def bench_stream(server, host, args):
+    path = os.path.join(server.data_dir, 'stream-bench.mp4')
+    with open(path, 'wb') as f:
+        f.truncate(args.file_mb * 1024 * 1024)
+    download_id = server.add_download(path)
+    size = os.path.getsize(path)
+    range_bytes = 1024 * 1024
+
+    rng = random.Random(2)
+    ranges = []
+    for _ in range(args.requests):
+        start = rng.randrange(0, max(size - range_bytes, 1))
+        ranges.append((start, min(start + range_bytes, size) - 1))
+
+    def fetch(byte_range):
+        start, end = byte_range
+        status, body = server.request(
+            'GET', f'/api/stream-file/{download_id}', headers={'Range': f'bytes={start}-{end}'}
+        )
+        return status == 206 and len(body) == end - start + 1, len(body)
+
+    return run_concurrently(fetch, ranges, args.concurrency)
+
+
+BENCHMARKS = {
+    'video-info': bench_video_info,
+    'download': bench_download,
+    'downloads': bench_downloads,
+    'stream': bench_stream,
+}
+
+
+class RssSampler:
+    """Samples the server's RSS on a background thread"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = process_rss_mb(self.pid)
+            if rss:
+                self.peak = max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--formats', type=int, default=40, help='formats per fake video')
+    parser.add_argument('--extract-latency', type=float, default=0.05, help='stub extraction latency (s)')
+    parser.add_argument('--downloads', type=int, default=8, help='downloads per media kind')
+    parser.add_argument('--media-mb', type=float, default=8)
+    parser.add_argument('--rows', type=int, default=20000, help='seeded rows for the downloads scenario')
+    parser.add_argument('--file-mb', type=int, default=256, help='file size for the stream scenario')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads')
+    parser.add_argument('--max-concurrent-downloads', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=120, help='max seconds per download')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    env = dict(stub_extractor_env(), MAX_CONCURRENT_DOWNLOADS=str(args.max_concurrent_downloads))
+    gunicorn_args = ['--workers', '1', '--worker-class', 'gthread', '--threads', str(args.threads)]
+
+    results = {}
+    server = AppServer(gunicorn_args, env=env)
+    server.log_path = os.path.join(server.workdir, 'server.log')
+    print(f'Server log: {server.log_path}')
+    with FakeVideoHost() as host, server:
+        results['startup_rss_mb'] = process_rss_mb(server.process.pid)
+        for name in scenarios:
+            with RssSampler(server.process.pid) as sampler:
+                results[name] = BENCHMARKS[name](server, host, args)
+            results[name + '_peak_rss_mb'] = sampler.peak
+            print(f'{name}: {json.dumps(results[name])} (peak RSS {sampler.peak} MB)')
+
+    if args.json:
+        write_results(args.json, 'api', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
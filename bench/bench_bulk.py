@@ -0,0 +1,161 @@
+"""Benchmark renaming and deleting many downloads: per-item endpoints vs /api/files/bulk.
+
+Usage:
+    python bench/bench_bulk.py [--items 1000] [--concurrency 1] [--json out.json]
+
+Starts app.py under gunicorn, seeds --items small files and their
+downloads rows, then renames and deletes all of them twice over: once
+with one PUT /api/rename-file and DELETE /api/delete-file request per item
+(--concurrency requests at a time, as a UI looping over a selection
+would), and once with a single POST /api/files/bulk per step. Reports
+wall time, items per second and errors for each, and checks both leave
+no files or rows behind.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import AppServer, percentile, write_results
+
+
+def seed(server, prefix, count, size=4096):
+    """Create count files and their downloads rows; returns their ids"""
+    rows = []
+    for i in range(count):
+        filename = f'{prefix}-{i:05d}.mp4'
+        path = os.path.join('data', filename)
+        with open(os.path.join(server.workdir, path), 'wb') as f:
+            f.write(os.urandom(size))
+        rows.append(('http://bench.invalid/video', filename, path, size, '1920x1080', 60))
+    conn = sqlite3.connect(server.database, timeout=30)
+    conn.executemany('''
+        INSERT INTO downloads (url, filename, filepath, filesize, resolution, duration)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    ids = [row[0] for row in conn.execute(
+        'SELECT id FROM downloads WHERE filename LIKE ? ORDER BY id', (f'{prefix}-%',)
+    )]
+    conn.close()
+    return ids
+
+
+def leftovers(server, prefix):
+    """(files, rows) still present for a seeded prefix"""
+    files = 0
+    for _, _, names in os.walk(server.data_dir):
+        files += sum(1 for name in names if name.startswith(prefix) or name.startswith(f'renamed-{prefix}'))
+    conn = sqlite3.connect(server.database, timeout=30)
+    rows = conn.execute(
+        'SELECT COUNT(*) FROM downloads WHERE filename LIKE ? OR filename LIKE ?', (f'{prefix}-%', f'renamed-{prefix}-%')
+    ).fetchone()[0]
+    conn.close()
+    return files, rows
+
+
+def timed_step(items, task, concurrency):
+    """Run task(item) -> ok for every item; returns (wall seconds, latencies ms, errors)"""
+    latencies = []
+    errors = 0
+
+    def run(item):
+        began = time.perf_counter()
+        ok = task(item)
+        return ok, (time.perf_counter() - began) * 1000
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, elapsed in pool.map(run, items):
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+    return time.perf_counter() - began, latencies, errors
+
+
+def step_summary(count, wall, latencies, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'wall_s': round(wall, 3),
+        'items_per_s': round(count / wall, 1) if wall else 0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def bench_per_item(server, count, concurrency):
+    ids = seed(server, 'item', count)
+
+    def rename(download_id):
+        status, _ = server.request('PUT', f'/api/rename-file/{download_id}',
+                                   body={'filename': f'renamed-item-{download_id}'})
+        return status == 200
+
+    def delete(download_id):
+        status, _ = server.request('DELETE', f'/api/delete-file/{download_id}')
+        return status == 200
+
+    results = {
+        'rename': step_summary(count, *timed_step(ids, rename, concurrency)),
+        'delete': step_summary(count, *timed_step(ids, delete, concurrency)),
+    }
+    results['leftover_files'], results['leftover_rows'] = leftovers(server, 'item')
+    return results
+
+
+def bench_bulk(server, count):
+    ids = seed(server, 'bulk', count)
+
+    def apply(operations):
+        def task(_):
+            status, body = server.request('POST', '/api/files/bulk', body={'operations': operations}, timeout=300)
+            return status == 200 and json.loads(body)['failed'] == 0
+        return task
+
+    renames = [{'op': 'rename', 'id': download_id, 'filename': f'renamed-bulk-{download_id}'} for download_id in ids]
+    deletes = [{'op': 'delete', 'id': download_id} for download_id in ids]
+    results = {
+        'rename': step_summary(count, *timed_step([None], apply(renames), 1)),
+        'delete': step_summary(count, *timed_step([None], apply(deletes), 1)),
+    }
+    # Unlinks run in the background after the response
+    deadline = time.time() + 30
+    while leftovers(server, 'bulk')[0] and time.time() < deadline:
+        time.sleep(0.05)
+    results['leftover_files'], results['leftover_rows'] = leftovers(server, 'bulk')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=1, help='parallel per-item requests')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    gunicorn_args = ['--workers', '1', '--worker-class', 'gthread', '--threads', str(args.threads)]
+    with AppServer(gunicorn_args, env={'FILES_BULK_MAX_ITEMS': str(max(args.items, 5000))}) as server:
+        results = {
+            'per_item': bench_per_item(server, args.items, args.concurrency),
+            'bulk': bench_bulk(server, args.items),
+        }
+
+    for mode, steps in results.items():
+        for step in ('rename', 'delete'):
+            summary = steps[step]
+            print(f"{mode:<9} {step:<7} {summary['wall_s']:>8.3f}s {summary['items_per_s']:>9.1f} items/s "
+                  f"requests={summary['requests']} errors={summary['errors']} p50={summary['p50_ms']}ms")
+        print(f"{mode:<9} leftover files={steps['leftover_files']} rows={steps['leftover_rows']}")
+    for step in ('rename', 'delete'):
+        per_item, bulk = results['per_item'][step]['wall_s'], results['bulk'][step]['wall_s']
+        print(f"{step} speedup: {per_item / bulk:.1f}x" if bulk else f"{step} speedup: n/a")
+
+    if args.json:
+        write_results(args.json, 'bulk', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Micro-benchmark for the /api/video-info format selection pipeline.
+
+Usage:
+    python bench/bench_formats.py [--json results.json] [recorded.json ...]
+
+Measures the CPU cost per request of formats.select_formats over format
+lists of 100-500 entries, next to the old inline loop from get_video_info.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from formats import FormatRules, select_formats  # noqa: E402
+from fixtures import youtube_formats, dash_formats, load_recorded  # noqa: E402
+
+
+def legacy_select(formats, duration):
+    """The format loop get_video_info used before formats.py (kept for comparison)"""
+    available_formats = []
+    for fmt in formats:
+        print(f"Format: {fmt.get('format_id')} - {fmt.get('ext')} - {fmt.get('resolution')} - vcodec: {fmt.get('vcodec')} - acodec: {fmt.get('acodec')}")
+        if fmt.get('vcodec') == 'none':
+            continue
+        if fmt.get('acodec') == 'none' and fmt.get('ext') not in ['mp4', 'webm', 'mkv']:
+            continue
+        if fmt.get('ext') not in ['mp4', 'webm', 'mkv', 'm4a', 'flv', 'avi', 'mov', 'wmv', '3gp']:
+            continue
+        audio_language = (fmt.get('language') or '').lower()
+        language_preference = fmt.get('language_preference') or 0
+        if audio_language or language_preference > 0:
+            if audio_language not in ['en', 'eng', 'english', 'hu', 'hun', 'hungarian', 'magyar', '']:
+                print(f"Skipping format {fmt.get('format_id')} due to language: {audio_language}")
+                continue
+        format_note = (fmt.get('format_note') or '').lower()
+        if format_note and any(lang in format_note for lang in ['deutsch', 'german', 'de', 'ger']):
+            print(f"Skipping format {fmt.get('format_id')} due to German language detected in format note: {format_note}")
+            continue
+        filesize = fmt.get('filesize', 0)
+        if not filesize:
+            resolution = fmt.get('resolution', '0x0')
+            width, height = 0, 0
+            if resolution and resolution != 'audio only':
+                try:
+                    width, height = map(int, resolution.split('x'))
+                except ValueError:
+                    pass
+            total_pixels = width * height
+            if total_pixels >= 1920 * 1080:
+                filesize = duration * 2.0 * 1024 * 1024
+            elif total_pixels >= 1280 * 720:
+                filesize = duration * 1.2 * 1024 * 1024
+            elif total_pixels >= 854 * 480:
+                filesize = duration * 0.8 * 1024 * 1024
+            elif total_pixels >= 640 * 360:
+                filesize = duration * 0.5 * 1024 * 1024
+            else:
+                filesize = duration * 0.3 * 1024 * 1024
+        format_info = {
+            'format_id': fmt.get('format_id'), 'ext': fmt.get('ext'),
+            'resolution': fmt.get('resolution', 'Unknown'), 'filesize': int(filesize),
+            'fps': fmt.get('fps') or None, 'vcodec': fmt.get('vcodec', 'Unknown'),
+            'acodec': fmt.get('acodec', 'Unknown'), 'quality': fmt.get('quality', 0),
+            'format_note': fmt.get('format_note', ''), 'tbr': fmt.get('tbr', 0),
+            'language': audio_language or 'unknown', 'language_preference': language_preference,
+        }
+        if format_info['format_id'] and format_info['ext'] and format_info['resolution'] != 'Unknown' and format_info['filesize'] > 0:
+            available_formats.append(format_info)
+
+    def get_resolution_pixels(resolution_str):
+        if not resolution_str or resolution_str == 'Unknown':
+            return 0
+        try:
+            if 'x' in resolution_str:
+                width, height = map(int, resolution_str.split('x'))
+                return width * height
+        except ValueError:
+            pass
+        return 0
+
+    available_formats.sort(key=lambda x: (
+        get_resolution_pixels(x['resolution']), x['tbr'] or 0, x['quality'] or 0
+    ), reverse=True)
+    return available_formats
+
+
+def measure(func, min_time=0.5):
+    """Run func repeatedly for at least min_time seconds; return seconds per call"""
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recordings', nargs='*', help='yt-dlp -J recordings to benchmark as well')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds to run each case')
+    args = parser.parse_args()
+
+    cases = []
+    for count in (100, 250, 500):
+        cases.append((f'youtube-{count}', youtube_formats(count), 600))
+        cases.append((f'dash-{count}', dash_formats(count), 600))
+    for path in args.recordings:
+        formats, duration = load_recorded(path)
+        cases.append((os.path.basename(path), formats, duration))
+
+    rules = FormatRules()
+    sink = io.StringIO()
+    results = []
+    print(f"{'case':<20} {'formats':>8} {'kept':>6} {'engine us':>11} {'legacy us':>11} {'speedup':>8}")
+    for name, formats, duration in cases:
+        kept = len(select_formats(formats, duration, rules))
+        engine = measure(lambda: select_formats(formats, duration, rules), args.min_time)
+
+        def run_legacy():
+            with redirect_stdout(sink):
+                legacy_select(formats, duration)
+            sink.seek(0)
+            sink.truncate()
+        legacy = measure(run_legacy, args.min_time)
+
+        results.append({
+            'case': name,
+            'formats': len(formats),
+            'kept': kept,
+            'engine_us': round(engine * 1e6, 1),
+            'legacy_us': round(legacy * 1e6, 1),
+        })
+        print(f"{name:<20} {len(formats):>8} {kept:>6} {engine * 1e6:>11.1f} {legacy * 1e6:>11.1f} {legacy / engine:>7.1f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'formats', 'timestamp': time.time(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark concurrent ranged /api/stream-file requests against a local file.
+
+Usage:
+    python bench/bench_ranges.py [--clients 8] [--duration 10] [--no-sendfile] [--json out.json]
+
+Starts app.py under gunicorn, runs --clients threads issuing random Range
+requests while a probe thread polls /api/test, then reports streaming
+throughput, worker occupancy (share of worker threads busy streaming)
+and API latency while the streams run.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from harness import AppServer, percentile, write_results
+
+
+def make_file(path, size_mb):
+    """Create a sparse test file of size_mb megabytes"""
+    with open(path, 'wb') as f:
+        f.truncate(size_mb * 1024 * 1024)
+        f.seek(0)
+        f.write(os.urandom(1024 * 1024))
+
+
+def stream_client(server, download_id, size, range_bytes, stop, stats, lock):
+    conn = server.connection()
+    rng = random.Random()
+    while not stop.is_set():
+        start = rng.randrange(0, max(size - range_bytes, 1))
+        end = min(start + range_bytes, size) - 1
+        began = time.perf_counter()
+        conn.request('GET', f'/api/stream-file/{download_id}', headers={'Range': f'bytes={start}-{end}'})
+        response = conn.getresponse()
+        received = 0
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+        elapsed = time.perf_counter() - began
+        with lock:
+            stats['requests'] += 1
+            stats['bytes'] += received
+            stats['busy'] += elapsed
+            if response.status != 206 or received != end - start + 1:
+                stats['errors'] += 1
+    conn.close()
+
+
+def probe(server, stop, latencies):
+    while not stop.is_set():
+        began = time.perf_counter()
+        status, _ = server.request('GET', '/api/test')
+        latencies.append((time.perf_counter() - began) * 1000)
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--file-size-mb', type=int, default=512)
+    parser.add_argument('--range-mb', type=float, default=4)
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads')
+    parser.add_argument('--no-sendfile', action='store_true', help='disable sendfile in gunicorn')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    gunicorn_args = ['--workers', '1', '--worker-class', 'gthread', '--threads', str(args.threads)]
+    if args.no_sendfile:
+        gunicorn_args.append('--no-sendfile')
+
+    with AppServer(gunicorn_args) as server:
+        path = os.path.join(server.data_dir, 'bench.mp4')
+        make_file(path, args.file_size_mb)
+        download_id = server.add_download(path)
+        size = os.path.getsize(path)
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'requests': 0, 'bytes': 0, 'busy': 0.0, 'errors': 0}
+        latencies = []
+        threads = [
+            threading.Thread(target=stream_client, args=(
+                server, download_id, size, int(args.range_mb * 1024 * 1024), stop, stats, lock
+            ))
+            for _ in range(args.clients)
+        ]
+        threads.append(threading.Thread(target=probe, args=(server, stop, latencies)))
+
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - began
+
+    results = {
+        'range_requests': stats['requests'],
+        'errors': stats['errors'],
+        'throughput_mb_s': round(stats['bytes'] / wall / 1024 / 1024, 1),
+        'requests_per_s': round(stats['requests'] / wall, 1),
+        'worker_occupancy': round(stats['busy'] / (wall * args.threads), 3),
+        'api_p50_ms': round(percentile(latencies, 50), 2),
+        'api_p99_ms': round(percentile(latencies, 99), 2),
+        'api_max_ms': round(max(latencies or [0]), 2),
+    }
+    for key, value in results.items():
+        print(f"{key:<20} {value}")
+
+    if args.json:
+        write_results(args.json, 'ranges', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Load test: API latency while long streams and slow extractions are running.
+
+Usage:
+    python bench/bench_serving.py [--streams 20] [--extractions 8] [--duration 15]
+                                  [--workers 1] [--threads 64] [--json out.json]
+
+Starts app.py under gunicorn, measures API latency with nothing else
+running (baseline), then again while --streams clients each play a file
+through /api/stream-file at --stream-rate (open-ended Range requests, like
+a video player) and --extractions clients keep /api/video-info busy with
+slow, uncached extractions (--extract-latency seconds each).
+
+Probed endpoints: /api/test, /api/jobs, /api/downloads and a cached
+/api/video-info. The API is responsive if their p99 under load stays
+close to the baseline.
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from harness import AppServer, percentile, stub_extractor_env, write_results
+
+CACHED_URL = 'http://127.0.0.1:1/watch/cached?formats=20'
+SLOW_URL = 'http://127.0.0.1:1/watch/slow{}?formats=20&latency={}'
+
+PROBES = [
+    ('GET', '/api/test', None),
+    ('GET', '/api/jobs', None),
+    ('GET', '/api/downloads?limit=50', None),
+    ('POST', '/api/video-info', {'url': CACHED_URL}),
+]
+
+
+def probe(server, stop, interval):
+    """Request each probed endpoint in turn; returns latencies per endpoint"""
+    latencies = defaultdict(list)
+    errors = Counter()
+    for method, path, body in itertools.cycle(PROBES):
+        if stop.is_set():
+            break
+        began = time.perf_counter()
+        try:
+            status, _ = server.request(method, path, body, timeout=30)
+        except OSError:
+            status = None
+        latencies[path].append((time.perf_counter() - began) * 1000)
+        if status != 200:
+            errors[path] += 1
+        stop.wait(interval)
+    return {
+        path: {
+            'requests': len(values),
+            'errors': errors[path],
+            'p50_ms': round(percentile(values, 50), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+            'max_ms': round(max(values), 2),
+        }
+        for path, values in latencies.items()
+    }
+
+
+def stream_client(server, download_id, rate, stop, stats, lock):
+    """Play the file at `rate` bytes/s, starting over at the end"""
+    chunk = 64 * 1024
+    while not stop.is_set():
+        conn = server.connection(timeout=30)
+        try:
+            conn.request('GET', f'/api/stream-file/{download_id}', headers={'Range': 'bytes=0-'})
+            response = conn.getresponse()
+            began = time.perf_counter()
+            received = 0
+            while not stop.is_set():
+                data = response.read(chunk)
+                if not data:
+                    break
+                received += len(data)
+                with lock:
+                    stats['bytes'] += len(data)
+                # Pace reads like a player consuming the stream
+                ahead = received / rate - (time.perf_counter() - began)
+                if ahead > 0:
+                    stop.wait(ahead)
+        except OSError:
+            with lock:
+                stats['errors'] += 1
+        finally:
+            conn.close()
+
+
+def extraction_client(server, ids, latency, stop, statuses, lock):
+    """Keep requesting uncached (slow) extractions"""
+    while not stop.is_set():
+        try:
+            status, _ = server.request('POST', '/api/video-info', {'url': SLOW_URL.format(next(ids), latency)},
+                                       timeout=120)
+        except OSError:
+            status = None
+        with lock:
+            statuses[status] += 1
+        if status == 503:
+            stop.wait(0.5)
+
+
+def run_phase(server, args, download_id, load):
+    stop = threading.Event()
+    lock = threading.Lock()
+    stream_stats = {'bytes': 0, 'errors': 0}
+    statuses = Counter()
+    ids = itertools.count()
+    threads = []
+    if load:
+        for _ in range(args.streams):
+            threads.append(threading.Thread(
+                target=stream_client, args=(server, download_id, args.stream_rate * 1024 * 1024, stop, stream_stats, lock)
+            ))
+        for _ in range(args.extractions):
+            threads.append(threading.Thread(
+                target=extraction_client, args=(server, ids, args.extract_latency, stop, statuses, lock)
+            ))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    # Let the streams and extractions ramp up before probing
+    time.sleep(1 if load else 0)
+    result = {}
+    prober = threading.Thread(target=lambda: result.update(probe(server, stop, args.probe_interval)))
+    began = time.perf_counter()
+    prober.start()
+    time.sleep(args.duration)
+    stop.set()
+    prober.join()
+    wall = time.perf_counter() - began
+    for thread in threads:
+        thread.join(5)
+
+    summary = {'probes': result}
+    if load:
+        summary['streams'] = {
+            'clients': args.streams,
+            'throughput_mb_s': round(stream_stats['bytes'] / wall / 1024 / 1024, 1),
+            'errors': stream_stats['errors'],
+        }
+        summary['extractions'] = {str(status): count for status, count in statuses.items()}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=20)
+    parser.add_argument('--stream-rate', type=float, default=2, help='MB/s each stream is read at')
+    parser.add_argument('--extractions', type=int, default=8, help='clients requesting slow extractions')
+    parser.add_argument('--extract-latency', type=float, default=3, help='seconds each slow extraction takes')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per phase')
+    parser.add_argument('--probe-interval', type=float, default=0.02)
+    parser.add_argument('--file-mb', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=64, help='gunicorn gthread threads')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    gunicorn_args = ['--workers', str(args.workers), '--worker-class', 'gthread', '--threads', str(args.threads)]
+    env = dict(stub_extractor_env(), WEB_CONCURRENCY=str(args.workers))
+    server = AppServer(gunicorn_args, env=env)
+    server.log_path = os.path.join(server.workdir, 'server.log')
+    print(f'Server log: {server.log_path}')
+
+    results = {}
+    with server:
+        path = os.path.join(server.data_dir, 'serving-bench.mp4')
+        with open(path, 'wb') as f:
+            f.truncate(args.file_mb * 1024 * 1024)
+        download_id = server.add_download(path)
+        status, _ = server.request('POST', '/api/video-info', {'url': CACHED_URL})
+        if status != 200:
+            raise RuntimeError(f'/api/video-info returned {status}')
+
+        for name, load in (('baseline', False), ('load', True)):
+            results[name] = run_phase(server, args, download_id, load)
+            print(f'{name}: {json.dumps(results[name])}')
+
+    if args.json:
+        write_results(args.json, 'serving', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark cold start and worker restarts of app.py under gunicorn.
+
+Usage:
+    python bench/bench_startup.py [--modes lazy,background,master] [--runs 5] [--json out.json]
+
+For each mode, starts gunicorn --runs times and measures from process
+start to the first /api/test response (healthy), to /api/startup
+reporting ready, and to the first /api/video-info response (which needs
+yt-dlp). Then it terminates the worker once per run, as --max-requests
+does, and times its replacement the same way.
+
+    lazy        PRELOAD_YT_DLP=0: yt-dlp is imported by the first extraction
+    background  yt-dlp is warmed on a worker thread after the database is up
+    master      gunicorn.conf.py warms yt-dlp in the master before forking
+
+Worker private memory (not shared with the master) is reported per mode.
+"""
+import argparse
+import itertools
+import json
+import os
+import signal
+import time
+
+from harness import REPO_DIR, AppServer, percentile, stub_extractor_env, write_results
+
+MODES = {
+    'lazy': ({'PRELOAD_YT_DLP': '0'}, None),
+    'background': ({'PRELOAD_YT_DLP': '1'}, None),
+    'master': ({'PRELOAD_YT_DLP': '1'}, os.path.join(REPO_DIR, 'gunicorn.conf.py')),
+}
+
+# Handled by the stub extractor without any network request; a new ID
+# per request so the info cache never answers it
+VIDEO_URL = 'http://127.0.0.1:1/watch/startup{}?formats=20'
+VIDEO_IDS = itertools.count()
+
+
+def private_mb(pid):
+    """Memory of a process not shared with others in MB (Linux only, else None)"""
+    total = 0
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    total += int(line.split()[1])
+    except (OSError, ValueError):
+        return None
+    return round(total / 1024, 1)
+
+
+def first_extraction_ms(server, began):
+    status, _ = server.request('POST', '/api/video-info', {'url': VIDEO_URL.format(next(VIDEO_IDS))})
+    if status != 200:
+        raise RuntimeError(f'/api/video-info returned {status}')
+    return (time.perf_counter() - began) * 1000
+
+
+def timings(server, began):
+    return {
+        'healthy_ms': (server.healthy_at - began) * 1000,
+        'ready_ms': (server.ready_at - began) * 1000,
+        'first_video_info_ms': first_extraction_ms(server, began),
+    }
+
+
+def summarize(samples):
+    summary = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        summary[key + '_p50'] = round(percentile(values, 50), 1)
+        summary[key + '_max'] = round(max(values), 1) if values else 0
+    return summary
+
+
+def bench_mode(env, config, args):
+    gunicorn_args = ['--workers', '1', '--worker-class', 'gthread', '--threads', str(args.threads)]
+    cold, restart = [], []
+    for _ in range(args.runs):
+        server = AppServer(gunicorn_args, env=dict(stub_extractor_env(), **env), config=config)
+        server.log_path = os.path.join(server.workdir, 'server.log')
+        with server:
+            cold.append(dict(timings(server, server.started_at), private_mb=private_mb(server.worker_pid())))
+
+            # Replace the worker the way --max-requests does
+            pid = server.worker_pid()
+            began = time.perf_counter()
+            os.kill(pid, signal.SIGTERM)
+            server.wait_ready(pid=pid)
+            restart.append(timings(server, began))
+    return {'cold': summarize(cold), 'restart': summarize(restart)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--runs', type=int, default=5, help='server starts per mode')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn gthread threads')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    modes = [name for name in args.modes.split(',') if name]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f'unknown modes: {", ".join(sorted(unknown))}')
+
+    results = {}
+    for name in modes:
+        env, config = MODES[name]
+        results[name] = bench_mode(env, config, args)
+        print(f'{name}: {json.dumps(results[name])}')
+
+    if args.json:
+        write_results(args.json, 'startup', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Local fake video host serving synthetic progressive MP4, HLS and DASH media.
+
+Paths (sizes in bytes, all content is generated on the fly):
+    /media/<name>.mp4?size=N               progressive file, supports Range
+    /hls/<id>/index.m3u8?segments=N&segment_size=B
+    /hls/<id>/seg<i>.ts?segment_size=B     HLS media segments
+    /dash/<id>/seg<i>.m4s?segment_size=B   DASH fragments
+Add ``delay=<seconds>`` to any URL to slow the response down.
+
+The stub extractor in bench/plugins points yt-dlp at these URLs.
+"""
+import os
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from harness import free_port
+
+# Media bodies are slices of one repeated random block
+BLOCK = os.urandom(1024 * 1024)
+
+# Minimal ISO BMFF header so the files look like MP4 to anything sniffing them
+FTYP = struct.pack('>I4s4sI8s', 24, b'ftyp', b'isom', 512, b'isomiso2')
+
+
+def media_bytes(offset, length):
+    """Bytes [offset, offset + length) of the synthetic media stream"""
+    out = bytearray()
+    while length > 0:
+        start = offset % len(BLOCK)
+        chunk = BLOCK[start:start + length]
+        out += chunk
+        offset += len(chunk)
+        length -= len(chunk)
+    return bytes(out)
+
+
+class FakeHostHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def handle_request(self, head):
+        parts = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        delay = float(query.get('delay', 0))
+        if delay:
+            time.sleep(delay)
+
+        match = re.fullmatch(r'/media/[\w-]+\.mp4', parts.path)
+        if match:
+            return self.send_media(int(query.get('size', 4 * 1024 * 1024)), head, header=FTYP)
+
+        match = re.fullmatch(r'/hls/([\w-]+)/index\.m3u8', parts.path)
+        if match:
+            segments = int(query.get('segments', 10))
+            segment_size = int(query.get('segment_size', 256 * 1024))
+            lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+            for i in range(segments):
+                lines += ['#EXTINF:4.0,', f'seg{i}.ts?segment_size={segment_size}']
+            lines.append('#EXT-X-ENDLIST')
+            body = ('\n'.join(lines) + '\n').encode()
+            return self.send_body(body, 'application/vnd.apple.mpegurl', head)
+
+        match = re.fullmatch(r'/(hls|dash)/[\w-]+/seg(\d+)\.(ts|m4s)', parts.path)
+        if match:
+            segment_size = int(query.get('segment_size', 256 * 1024))
+            return self.send_media(segment_size, head, offset=int(match.group(2)) * segment_size)
+
+        self.send_error(404)
+
+    def send_body(self, body, content_type, head):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_media(self, size, head, offset=0, header=b''):
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header or '')
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if head:
+            return
+
+        position = start
+        while position <= end:
+            length = min(256 * 1024, end - position + 1)
+            chunk = media_bytes(offset + position, length)
+            if position < len(header):
+                # The first bytes of a progressive file are its MP4 header
+                prefix = header[position:position + length]
+                chunk = prefix + chunk[len(prefix):]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            position += length
+
+
+class FakeVideoHost:
+    """The fake host running on a background thread"""
+
+    def __init__(self, port=None):
+        self.port = port or free_port()
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), FakeHostHandler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def watch_url(self, video_id, **params):
+        """URL the stub extractor handles; params configure the fake video"""
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return f'{self.base_url}/watch/{video_id}' + (f'?{query}' if query else '')
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    with FakeVideoHost(int(os.environ.get('PORT', 0)) or None) as host:
+        print(f'Fake video host on {host.base_url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,91 @@
+"""Synthetic yt-dlp format lists shaped like real YouTube and DASH sites.
+
+Real recordings can be used instead: save them with ``yt-dlp -J URL > file.json``
+and pass the files to the benchmarks.
+"""
+import json
+import random
+
+YOUTUBE_LANGUAGES = [
+    'en', 'hu', 'de', 'fr', 'es', 'it', 'pt', 'ru', 'ja', 'ko', 'zh-Hans', 'ar',
+    'hi', 'id', 'nl', 'pl', 'tr', 'uk', 'vi', 'sv',
+]
+HEIGHTS = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+VIDEO_CODECS = [('avc1.640028', 'mp4'), ('vp09.00.40.08', 'webm'), ('av01.0.08M.08', 'mp4')]
+
+
+def youtube_formats(count, seed=1):
+    """Build a YouTube-like list: storyboards, per-language audio, DASH video, HLS"""
+    rng = random.Random(seed)
+    formats = []
+
+    for i in range(4):
+        formats.append({
+            'format_id': f'sb{i}', 'ext': 'mhtml', 'vcodec': 'none', 'acodec': 'none',
+            'resolution': f'{48 * (i + 1)}x{27 * (i + 1)}', 'format_note': 'storyboard',
+        })
+
+    while len(formats) < count:
+        kind = rng.random()
+        if kind < 0.35:
+            language = rng.choice(YOUTUBE_LANGUAGES)
+            formats.append({
+                'format_id': f'{rng.randint(139, 251)}-{len(formats)}',
+                'ext': rng.choice(['m4a', 'webm']),
+                'vcodec': 'none', 'acodec': rng.choice(['mp4a.40.2', 'opus']),
+                'resolution': 'audio only', 'language': language,
+                'language_preference': rng.choice([-1, 10]),
+                'format_note': f'{language} original (default), medium',
+                'abr': rng.choice([48, 64, 128, 160]), 'tbr': rng.choice([48, 64, 128, 160]),
+                'filesize': rng.choice([None, rng.randint(10 ** 6, 10 ** 7)]),
+            })
+        else:
+            height = rng.choice(HEIGHTS)
+            width = height * 16 // 9
+            vcodec, ext = rng.choice(VIDEO_CODECS)
+            hls = kind > 0.85
+            formats.append({
+                'format_id': f'{"hls-" if hls else ""}{rng.randint(133, 702)}-{len(formats)}',
+                'ext': ext, 'vcodec': vcodec,
+                'acodec': 'mp4a.40.2' if hls else 'none',
+                'width': width, 'height': height, 'resolution': f'{width}x{height}',
+                'fps': rng.choice([24, 25, 30, 60]),
+                'format_note': f'{height}p' + (', german' if rng.random() < 0.03 else ''),
+                'tbr': round(rng.uniform(80, 18000), 3),
+                'vbr': None,
+                'quality': HEIGHTS.index(height),
+                'filesize': None if hls else rng.choice([None, rng.randint(10 ** 6, 10 ** 9)]),
+                'filesize_approx': None,
+                'protocol': 'm3u8_native' if hls else 'https',
+            })
+    return formats
+
+
+def dash_formats(count, seed=2):
+    """Build a generic DASH manifest list: many bitrate ladders, few sizes known"""
+    rng = random.Random(seed)
+    formats = []
+    while len(formats) < count:
+        if rng.random() < 0.2:
+            formats.append({
+                'format_id': f'dash-audio-{len(formats)}', 'ext': 'm4a',
+                'vcodec': 'none', 'acodec': 'mp4a.40.2', 'resolution': 'audio only',
+                'tbr': rng.choice([64, 96, 128]), 'language': rng.choice([None, 'en', 'fr']),
+            })
+        else:
+            height = rng.choice(HEIGHTS[:6])
+            width = height * 16 // 9
+            formats.append({
+                'format_id': f'dash-video-{len(formats)}', 'ext': 'mp4',
+                'vcodec': 'avc1.4d401f', 'acodec': 'none',
+                'width': width, 'height': height, 'resolution': f'{width}x{height}',
+                'tbr': round(rng.uniform(200, 8000), 3), 'fps': 30,
+            })
+    return formats
+
+
+def load_recorded(path):
+    """Load the formats list from a ``yt-dlp -J`` recording"""
+    with open(path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    return info.get('formats', []), info.get('duration') or 0
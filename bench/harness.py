@@ -0,0 +1,197 @@
+"""Shared helpers for the benchmarks: run app.py under gunicorn in a scratch directory."""
+import http.client
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# yt-dlp plugin directory holding the stub extractor for the fake video host
+PLUGIN_DIR = os.path.join(REPO_DIR, 'bench', 'plugins')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def stub_extractor_env():
+    """Environment that makes yt-dlp load the stub extractor plugin"""
+    paths = [PLUGIN_DIR] + [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]
+    return {'PYTHONPATH': os.pathsep.join(paths)}
+
+
+def process_rss_mb(pid):
+    """Resident memory of a process and its children in MB (Linux only, else None)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return round(total / 1024, 1)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class AppServer:
+    """app.py running under gunicorn with its own data/ and config/ directories"""
+
+    def __init__(self, gunicorn_args=None, env=None, workdir=None, log_path=None, config=None):
+        self.port = free_port()
+        self.workdir = workdir or tempfile.mkdtemp(prefix='vd-bench-')
+        self.gunicorn_args = gunicorn_args or ['--workers', '1', '--worker-class', 'gthread', '--threads', '32']
+        self.env = dict(os.environ, **(env or {}))
+        self.log_path = log_path
+        # gunicorn config file (e.g. the repo's gunicorn.conf.py); none by default
+        self.config = config
+        self.process = None
+        self.started_at = None
+        self.healthy_at = None
+        self.ready_at = None
+
+    @property
+    def data_dir(self):
+        return os.path.join(self.workdir, 'data')
+
+    @property
+    def database(self):
+        return os.path.join(self.data_dir, 'downloads.db')
+
+    def start(self, timeout=60):
+        os.makedirs(self.data_dir, exist_ok=True)
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--bind', f'127.0.0.1:{self.port}',
+            '--pythonpath', REPO_DIR,
+            '--log-level', 'warning',
+        ] + (['--config', self.config] if self.config else []) + self.gunicorn_args + ['app:app']
+        self.started_at = time.perf_counter()
+        # Server output (yt-dlp progress lines included) goes to log_path if set
+        log = open(self.log_path, 'ab') if self.log_path else None
+        self.process = subprocess.Popen(command, cwd=self.workdir, env=self.env, stdout=log, stderr=log)
+        if log:
+            log.close()
+        self.wait_ready(timeout)
+        return self
+
+    def wait_ready(self, timeout=60, pid=None):
+        """Wait for the first /api/test response, then for the startup phases to finish.
+
+        Sets healthy_at and ready_at. With ``pid``, responses from that
+        worker are ignored (waiting for its replacement).
+        """
+        deadline = time.time() + timeout
+        self.healthy_at = self.ready_at = None
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with code {self.process.returncode}')
+            try:
+                if self.healthy_at is None:
+                    status, _ = self.request('GET', '/api/test', timeout=1)
+                    if status == 200 and (pid is None or self.worker_pid() != pid):
+                        self.healthy_at = time.perf_counter()
+                if self.healthy_at is not None:
+                    status, body = self.request('GET', '/api/startup', timeout=1)
+                    if status == 200 and json.loads(body)['ready']:
+                        self.ready_at = time.perf_counter()
+                        return
+            except OSError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError('server did not become ready')
+
+    def worker_pid(self):
+        """PID of the worker answering requests (single-worker servers)"""
+        status, body = self.request('GET', '/api/startup', timeout=1)
+        return json.loads(body)['pid']
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def connection(self, timeout=30):
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=timeout)
+
+    def request(self, method, path, body=None, headers=None, timeout=30):
+        """Send one request on a fresh connection; returns (status, body bytes)"""
+        conn = self.connection(timeout)
+        try:
+            payload = json.dumps(body).encode() if body is not None else None
+            all_headers = {'Content-Type': 'application/json'} if payload else {}
+            all_headers.update(headers or {})
+            conn.request(method, path, body=payload, headers=all_headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+    def add_download(self, filepath, filename=None, url='http://bench.invalid/video', filesize=None):
+        """Insert a downloads row pointing at an existing file; returns its id"""
+        conn = sqlite3.connect(self.database, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO downloads (url, filename, filepath, filesize, resolution, duration)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            url,
+            filename or os.path.basename(filepath),
+            filepath,
+            filesize if filesize is not None else os.path.getsize(filepath),
+            '1920x1080',
+            60
+        ))
+        download_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return download_id
+
+
+def write_results(path, name, config, results):
+    """Save benchmark results as JSON for comparing runs across commits"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+            capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ''
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'benchmark': name,
+            'commit': commit,
+            'timestamp': time.time(),
+            'config': config,
+            'results': results,
+        }, f, indent=2)
@@ -0,0 +1,90 @@
+"""yt-dlp plugin extractor for the benchmarks' fake video host.
+
+yt-dlp loads it when bench/plugins is on PYTHONPATH. It handles
+http://127.0.0.1:<port>/watch/<id> URLs without any network request;
+query parameters shape the result:
+
+    formats=20     number of formats returned
+    latency=0      seconds extraction takes
+    kind=mp4       which format carries audio+video: mp4, hls or dash
+    size=4194304   media size in bytes
+    segments=16    HLS/DASH segment count
+    delay=0        per-response delay of the media URLs
+"""
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from yt_dlp.extractor.common import InfoExtractor
+
+LANGUAGES = ['en', 'hu', 'de', 'fr', 'es', 'it', 'ja', 'ko']
+
+
+class BenchStubIE(InfoExtractor):
+    IE_NAME = 'benchstub'
+    _VALID_URL = r'https?://(?:127\.0\.0\.1|localhost):(?P<port>\d+)/watch/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        video_id, port = self._match_valid_url(url).group('id', 'port')
+        params = {key: values[-1] for key, values in parse_qs(urlsplit(url).query).items()}
+        count = int(params.get('formats', 20))
+        latency = float(params.get('latency', 0))
+        kind = params.get('kind', 'mp4')
+        size = int(params.get('size', 4 * 1024 * 1024))
+        segments = max(int(params.get('segments', 16)), 1)
+        segment_size = max(size // segments, 1)
+        delay = params.get('delay')
+
+        if latency:
+            time.sleep(latency)
+
+        base = f'http://127.0.0.1:{port}'
+        suffix = f'&delay={delay}' if delay else ''
+
+        def acodec(for_kind):
+            return 'mp4a.40.2' if kind == for_kind else 'none'
+
+        formats = [{
+            'format_id': '18',
+            'url': f'{base}/media/{video_id}.mp4?size={size}{suffix}',
+            'ext': 'mp4', 'protocol': 'http',
+            'vcodec': 'avc1.42001E', 'acodec': acodec('mp4'),
+            'width': 640, 'height': 360, 'tbr': 800, 'filesize': size,
+        }, {
+            'format_id': 'hls-720',
+            'url': f'{base}/hls/{video_id}/index.m3u8?segments={segments}&segment_size={segment_size}{suffix}',
+            'ext': 'mp4', 'protocol': 'm3u8_native',
+            'vcodec': 'avc1.64001F', 'acodec': acodec('hls'),
+            'width': 1280, 'height': 720, 'tbr': 2500, 'filesize_approx': segment_size * segments,
+        }, {
+            'format_id': 'dash-1080',
+            'url': f'{base}/dash/{video_id}/manifest.mpd',
+            'fragment_base_url': f'{base}/dash/{video_id}/',
+            'fragments': [
+                {'path': f'seg{i}.m4s?segment_size={segment_size}{suffix}', 'duration': 4.0}
+                for i in range(segments)
+            ],
+            'ext': 'mp4', 'protocol': 'http_dash_segments',
+            'vcodec': 'avc1.640028', 'acodec': acodec('dash'),
+            'width': 1920, 'height': 1080, 'tbr': 5000, 'filesize_approx': segment_size * segments,
+        }]
+
+        # Audio-only variants fill the list up to the requested format count
+        for i in range(max(count - len(formats), 0)):
+            formats.append({
+                'format_id': f'audio-{i}',
+                'url': f'{base}/media/{video_id}-audio{i}.mp4?size={max(size // 8, 1)}{suffix}',
+                'ext': 'm4a', 'protocol': 'http',
+                'vcodec': 'none', 'acodec': 'mp4a.40.2',
+                'abr': 64 + 32 * (i % 4), 'language': LANGUAGES[i % len(LANGUAGES)],
+                'filesize': max(size // 8, 1),
+            })
+
+        return {
+            'id': video_id,
+            'title': f'Bench video {video_id}',
+            'duration': segments * 4,
+            'uploader': 'bench',
+            'view_count': 0,
+            'upload_date': '20250101',
+            'formats': formats[:max(count, 1)],
+        }
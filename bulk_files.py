@@ -0,0 +1,259 @@
+import contextvars
+import logging
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Counter
+
+log = logging.getLogger(__name__)
+
+BULK_OPERATIONS = ('delete', 'rename', 'move')
+
+# Characters a new filename may not contain
+INVALID_NAME = re.compile(r'[/\\\0]')
+
+# Suffix of files set aside for deletion (the janitor removes leftovers)
+DELETED_SUFFIX = '.deleted'
+
+# Rows fetched per query, below SQLite's limit on bound parameters
+QUERY_CHUNK = 500
+
+BULK_ITEMS = Counter(
+    'downloader_bulk_file_items_total', 'Items of /api/files/bulk by operation and result', ['operation', 'result']
+)
+
+
+class BulkFileError(Exception):
+    """One item of a bulk operation cannot be applied"""
+
+
+class _Abort(Exception):
+    """Rolls an atomic batch back after an item failed"""
+
+
+class FileJournal:
+    """File renames and directories made in a batch, undone in reverse order on rollback"""
+
+    def __init__(self):
+        self.entries = []
+        self.directories = []
+
+    def rename(self, source, target):
+        os.rename(source, target)
+        self.entries.append((source, target))
+
+    def makedirs(self, path):
+        """Create a directory and any missing parents, recording each one created"""
+        missing = []
+        while path and not os.path.isdir(path):
+            missing.append(path)
+            path = os.path.dirname(path)
+        for directory in reversed(missing):
+            os.mkdir(directory)
+            self.directories.append(directory)
+
+    def rollback(self):
+        for source, target in reversed(self.entries):
+            try:
+                os.rename(target, source)
+            except OSError as e:
+                log.error("Could not move %s back to %s: %s", target, source, e)
+        for directory in reversed(self.directories):
+            try:
+                os.rmdir(directory)
+            except OSError as e:
+                log.error("Could not remove directory %s: %s", directory, e)
+        self.entries = []
+        self.directories = []
+
+
+class BulkFileManager:
+    """Deletes, renames and moves many downloads in one database transaction.
+
+    Renames and moves happen inside the transaction and are journaled;
+    files to delete are first renamed aside. If anything fails before the
+    commit, the journal puts every file back and the database rolls back
+    with it. After the commit, the set-aside files are unlinked on a
+    background pool, which also calls ``on_delete`` with each deleted
+    download's ID. Moves go to folders under ``data_dir`` except the
+    ``reserved`` ones (the app's own caches).
+    """
+
+    def __init__(self, db, data_dir, reserved=(), on_delete=None, max_workers=4):
+        self.db = db
+        self.data_dir = str(data_dir)
+        self.reserved = set(reserved)
+        self.on_delete = on_delete
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='unlink')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def apply(self, operations, atomic=False):
+        """One result per operation: {'id', 'op', 'ok'} plus the new 'filename' or an 'error'.
+
+        With ``atomic``, nothing is applied unless every operation succeeds.
+        Raises (with everything rolled back) if the batch cannot be committed.
+        """
+        results = [None] * len(operations)
+        valid = []
+        seen = set()
+        for index, operation in enumerate(operations):
+            try:
+                valid.append((index, self._validate(operation, seen)))
+            except BulkFileError as e:
+                results[index] = self._failed(operation, e)
+
+        if valid and not (atomic and len(valid) < len(operations)):
+            try:
+                self._apply(valid, results, atomic)
+            except _Abort:
+                pass
+
+        if atomic and not all(result['ok'] for result in results if result):
+            for index, result in enumerate(results):
+                if result is None or result['ok']:
+                    results[index] = self._failed(operations[index], 'Not applied: another operation failed')
+        for result in results:
+            BULK_ITEMS.labels(result['op'] if result['op'] in BULK_OPERATIONS else 'invalid',
+                              'ok' if result['ok'] else 'failed').inc()
+        return results
+
+    def pending(self):
+        """Unlinks queued or running"""
+        with self._lock:
+            return self._pending
+
+    def _validate(self, operation, seen):
+        if not isinstance(operation, dict):
+            raise BulkFileError('Operation must be an object')
+        op = operation.get('op')
+        if op not in BULK_OPERATIONS:
+            raise BulkFileError(f"Invalid op, use one of: {', '.join(BULK_OPERATIONS)}")
+        download_id = operation.get('id')
+        if not isinstance(download_id, int) or isinstance(download_id, bool):
+            raise BulkFileError('id must be a download ID')
+        if download_id in seen:
+            raise BulkFileError('Download appears in more than one operation')
+        seen.add(download_id)
+
+        if op == 'rename':
+            filename = operation.get('filename')
+            if not isinstance(filename, str) or not filename.strip() or filename in ('.', '..') \
+                    or INVALID_NAME.search(filename):
+                raise BulkFileError('filename must be a name without path separators')
+            return {'op': op, 'id': download_id, 'filename': filename}
+        if op == 'move':
+            folder = operation.get('folder')
+            if not isinstance(folder, str) or '\0' in folder:
+                raise BulkFileError('folder must be a path under the data directory ("" for the top)')
+            directory = os.path.normpath(os.path.join(self.data_dir, folder))
+            relative = os.path.relpath(directory, self.data_dir)
+            if os.path.isabs(folder) or relative == '..' or relative.startswith('..' + os.sep) \
+                    or relative.split(os.sep)[0] in self.reserved:
+                raise BulkFileError('folder must be a path under the data directory ("" for the top)')
+            return {'op': op, 'id': download_id, 'directory': directory}
+        return {'op': op, 'id': download_id}
+
+    def _apply(self, valid, results, atomic):
+        journal = FileJournal()
+        token = uuid.uuid4().hex[:8]
+        deleted = []
+        set_aside = []
+        try:
+            with self.db.transaction() as conn:
+                rows = self._rows(conn, [operation['id'] for _, operation in valid])
+                for index, operation in valid:
+                    row = rows.get(operation['id'])
+                    try:
+                        if row is None:
+                            raise BulkFileError('Download not found')
+                        if operation['op'] == 'delete':
+                            conn.execute('DELETE FROM downloads WHERE id = ?', (row['id'],))
+                            deleted.append(row)
+                            results[index] = {'id': row['id'], 'op': 'delete', 'ok': True}
+                        else:
+                            results[index] = self._relocate(conn, journal, row, operation)
+                    except (BulkFileError, OSError) as e:
+                        results[index] = self._failed(operation, e)
+                        if atomic:
+                            raise _Abort()
+
+                # Deduplicated downloads share a file; it goes with the last of them
+                for filepath in dict.fromkeys(row['filepath'] for row in deleted):
+                    if conn.execute('SELECT 1 FROM downloads WHERE filepath = ? LIMIT 1', (filepath,)).fetchone():
+                        continue
+                    if os.path.exists(filepath):
+                        aside = f'{filepath}.{token}{DELETED_SUFFIX}'
+                        journal.rename(filepath, aside)
+                        set_aside.append(aside)
+        except BaseException:
+            journal.rollback()
+            raise
+
+        for path in set_aside:
+            self._submit(self._unlink, path)
+        if self.on_delete is not None:
+            for row in deleted:
+                self._submit(self.on_delete, row['id'])
+        if deleted or journal.entries:
+            log.info("Bulk file operations applied", extra={
+                'deleted': len(deleted), 'relocated': len(journal.entries) - len(set_aside), 'unlinks': len(set_aside)
+            })
+
+    def _relocate(self, conn, journal, row, operation):
+        """Rename or move one download's file and update the rows pointing at it"""
+        old_path = row['filepath']
+        if operation['op'] == 'rename':
+            # The extension is kept, as with /api/rename-file
+            filename = operation['filename'] + os.path.splitext(row['filename'])[1]
+            new_path = os.path.join(os.path.dirname(old_path), filename)
+        else:
+            filename = row['filename']
+            new_path = os.path.join(operation['directory'], os.path.basename(old_path))
+
+        if new_path != old_path:
+            if not os.path.exists(old_path):
+                raise BulkFileError('Physical file not found')
+            if os.path.exists(new_path):
+                raise BulkFileError('A file with this name already exists')
+            journal.makedirs(os.path.dirname(new_path))
+            journal.rename(old_path, new_path)
+            # Deduplicated downloads pointing at the same file follow it
+            conn.execute('UPDATE downloads SET filepath = ? WHERE filepath = ?', (new_path, old_path))
+        conn.execute('UPDATE downloads SET filename = ? WHERE id = ?', (filename, row['id']))
+        return {'id': row['id'], 'op': operation['op'], 'ok': True, 'filename': filename}
+
+    def _rows(self, conn, ids):
+        rows = {}
+        for i in range(0, len(ids), QUERY_CHUNK):
+            chunk = ids[i:i + QUERY_CHUNK]
+            for row in conn.execute(
+                f'SELECT id, filename, filepath FROM downloads WHERE id IN ({", ".join("?" * len(chunk))})', chunk
+            ):
+                rows[row['id']] = row
+        return rows
+
+    def _failed(self, operation, error):
+        operation = operation if isinstance(operation, dict) else {}
+        return {'id': operation.get('id'), 'op': operation.get('op'), 'ok': False, 'error': str(error)}
+
+    def _submit(self, func, *args):
+        with self._lock:
+            self._pending += 1
+        future = self._pool.submit(contextvars.copy_context().run, func, *args)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+        if future.exception() is not None:
+            log.warning("Cleanup after bulk operation failed: %s", future.exception())
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,491 @@
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from info_cache import normalize_url
+from metrics import Histogram
+
+log = logging.getLogger(__name__)
+
+DB_QUERY_SECONDS = Histogram(
+    'downloader_db_query_seconds', 'Time spent in SQLite statements', ['statement'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+)
+
+
+def _statement_kind(sql):
+    """First keyword of a statement (SELECT, INSERT, ...), the query time label"""
+    return sql.lstrip().split(None, 1)[0].upper()
+
+def _add_downloads_fts(conn):
+    """Full-text index over downloads.filename/url (skipped if SQLite lacks FTS5)"""
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS downloads_fts
+            USING fts5(filename, url, content='downloads', content_rowid='id')
+        ''')
+    except sqlite3.OperationalError as e:
+        log.warning("FTS5 not available, download search falls back to LIKE: %s", e)
+        return
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS downloads_fts_insert AFTER INSERT ON downloads BEGIN
+            INSERT INTO downloads_fts (rowid, filename, url) VALUES (new.id, new.filename, new.url);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS downloads_fts_delete AFTER DELETE ON downloads BEGIN
+            INSERT INTO downloads_fts (downloads_fts, rowid, filename, url) VALUES ('delete', old.id, old.filename, old.url);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS downloads_fts_update AFTER UPDATE OF filename, url ON downloads BEGIN
+            INSERT INTO downloads_fts (downloads_fts, rowid, filename, url) VALUES ('delete', old.id, old.filename, old.url);
+            INSERT INTO downloads_fts (rowid, filename, url) VALUES (new.id, new.filename, new.url);
+        END
+    ''')
+    conn.execute("INSERT INTO downloads_fts (downloads_fts) VALUES ('rebuild')")
+
+
+def _add_download_dedup_keys(conn):
+    """Lookup keys for deduplication, backfilling url_key for existing rows"""
+    conn.execute('ALTER TABLE downloads ADD COLUMN url_key TEXT')
+    conn.execute('ALTER TABLE downloads ADD COLUMN format_id TEXT')
+    conn.execute('ALTER TABLE downloads ADD COLUMN content_hash TEXT')
+    rows = conn.execute('SELECT id, url FROM downloads').fetchall()
+    conn.executemany(
+        'UPDATE downloads SET url_key = ? WHERE id = ?',
+        [(normalize_url(row[1]), row[0]) for row in rows]
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_downloads_url_key ON downloads (url_key, format_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_downloads_filesize ON downloads (filesize)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_downloads_filepath ON downloads (filepath)')
+
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Each is a list of statements or a callable taking the connection. Never
+# edit a released migration; append a new one instead.
+MIGRATIONS = [
+    # 1: base schema (CREATE IF NOT EXISTS so databases from before
+    # migrations were introduced are picked up as-is)
+    [
+        '''CREATE TABLE IF NOT EXISTS downloads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            filepath TEXT NOT NULL,
+            filesize INTEGER,
+            resolution TEXT,
+            duration REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'completed'
+        )''',
+        '''CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            format_id TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL DEFAULT 0,
+            error TEXT,
+            download_id INTEGER,
+            owner TEXT,
+            heartbeat_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)',
+        '''CREATE TABLE IF NOT EXISTS video_info_cache (
+            url_key TEXT PRIMARY KEY,
+            info TEXT NOT NULL,
+            metadata TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_video_info_cache_accessed ON video_info_cache (accessed_at)',
+    ],
+    # 2: indexes for listing and lookups on large histories
+    [
+        'CREATE INDEX IF NOT EXISTS idx_downloads_created_at ON downloads (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_downloads_url ON downloads (url)',
+        'CREATE INDEX IF NOT EXISTS idx_downloads_status ON downloads (status)',
+    ],
+    # 3: change counter for downloads (drives /api/downloads ETags) and search
+    [
+        '''CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )''',
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('downloads', 0)",
+        '''CREATE TRIGGER IF NOT EXISTS downloads_version_insert AFTER INSERT ON downloads BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'downloads';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS downloads_version_update AFTER UPDATE ON downloads BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'downloads';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS downloads_version_delete AFTER DELETE ON downloads BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'downloads';
+        END''',
+        _add_downloads_fts,
+    ],
+    # 4: what is needed to resume an interrupted download
+    [
+        'ALTER TABLE jobs ADD COLUMN output_template TEXT',
+        'ALTER TABLE jobs ADD COLUMN selected_format TEXT',
+        'ALTER TABLE jobs ADD COLUMN part_path TEXT',
+    ],
+    # 5: bandwidth priority ('interactive' or 'batch')
+    [
+        "ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT 'interactive'",
+    ],
+    # 6: deduplication by (normalized URL, format) and by content hash
+    [
+        _add_download_dedup_keys,
+    ],
+    # 7: storage quota bookkeeping (last access per download, eviction log)
+    [
+        'ALTER TABLE downloads ADD COLUMN last_accessed_at REAL',
+        "UPDATE downloads SET last_accessed_at = CAST(strftime('%s', created_at) AS REAL)",
+        'CREATE INDEX IF NOT EXISTS idx_downloads_last_accessed ON downloads (last_accessed_at, id)',
+        '''CREATE TABLE IF NOT EXISTS evictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ran_at REAL NOT NULL,
+            reason TEXT NOT NULL,
+            policy TEXT NOT NULL,
+            files INTEGER NOT NULL,
+            reclaimed_bytes INTEGER NOT NULL,
+            details TEXT
+        )''',
+    ],
+    # 8: job changes visible to other worker processes (live progress, who changed what when)
+    [
+        'ALTER TABLE jobs ADD COLUMN live TEXT',
+        'ALTER TABLE jobs ADD COLUMN updated_at REAL',
+        'ALTER TABLE jobs ADD COLUMN updated_by TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (updated_at)',
+    ],
+    # 9: time spent in each phase of a finished job (downloading, merging, ...)
+    [
+        'ALTER TABLE jobs ADD COLUMN phases TEXT',
+    ],
+    # 10: thumbnail cache (id is a download id or the hash of an upstream thumbnail URL)
+    [
+        '''CREATE TABLE IF NOT EXISTS thumbnails (
+            id TEXT PRIMARY KEY,
+            source_url TEXT,
+            filename TEXT,
+            size INTEGER,
+            etag TEXT,
+            created_at REAL,
+            accessed_at REAL,
+            failed_at REAL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_thumbnails_accessed_at ON thumbnails (accessed_at)',
+    ],
+    # 11: archive exports of several downloads and the progress of their last transfer
+    [
+        '''CREATE TABLE IF NOT EXISTS exports (
+            id TEXT PRIMARY KEY,
+            format TEXT NOT NULL,
+            download_ids TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            status TEXT NOT NULL,
+            files INTEGER,
+            size INTEGER,
+            start INTEGER,
+            sent_bytes INTEGER,
+            updated_at REAL
+        )''',
+    ],
+    # 12: recording an access (last_accessed_at) no longer bumps the downloads version
+    [
+        'DROP TRIGGER IF EXISTS downloads_version_update',
+        '''CREATE TRIGGER downloads_version_update AFTER UPDATE OF
+            url, filename, filepath, filesize, resolution, duration, created_at, status,
+            url_key, format_id, content_hash ON downloads BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'downloads';
+        END''',
+    ],
+    # 13: queued jobs waiting out a site's rate limit are not claimed before run_after
+    [
+        'ALTER TABLE jobs ADD COLUMN run_after REAL',
+    ],
+    # 14: runtime settings shared by all worker processes (e.g. log levels)
+    [
+        '''CREATE TABLE IF NOT EXISTS settings (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )''',
+    ],
+    # 15: change counter for download thumbnails (which /api/downloads rows link one; part of its ETag)
+    [
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('thumbnails', 0)",
+        '''CREATE TRIGGER IF NOT EXISTS thumbnails_version_insert AFTER INSERT ON thumbnails
+            WHEN new.id NOT GLOB '*[^0-9]*' BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'thumbnails';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS thumbnails_version_update AFTER UPDATE OF source_url, filename, failed_at
+            ON thumbnails WHEN new.id NOT GLOB '*[^0-9]*' BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'thumbnails';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS thumbnails_version_delete AFTER DELETE ON thumbnails
+            WHEN old.id NOT GLOB '*[^0-9]*' BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = 'thumbnails';
+        END''',
+    ],
+    # 16: times a job was put back in the queue to retry later (capped)
+    [
+        'ALTER TABLE jobs ADD COLUMN retries INTEGER NOT NULL DEFAULT 0',
+    ],
+]
+
+DOWNLOAD_COLUMNS = (
+    'id', 'url', 'filename', 'filepath', 'filesize', 'resolution', 'duration',
+    'created_at', 'status', 'format_id', 'content_hash'
+)
+
+# Columns returned by /api/downloads (the server-side path stays private)
+LIST_COLUMNS = tuple(column for column in DOWNLOAD_COLUMNS if column not in ('filepath', 'content_hash'))
+
+
+def encode_cursor(created_at, download_id):
+    """Opaque pagination cursor for the row at (created_at, id)"""
+    raw = json.dumps([created_at, download_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, download_id = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    return created_at, int(download_id)
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 prefix query matching all words"""
+    words = [word.replace('"', '""') for word in text.split()]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class Database:
+    """Per-thread pooled SQLite connections to downloads.db.
+
+    Each thread keeps one connection open (re-opened after a fork), in WAL
+    mode so download threads writing never block readers. Connections run
+    in autocommit mode; use ``transaction()`` to group writes. Statements
+    are compiled once per connection by sqlite3's statement cache.
+    """
+
+    def __init__(self, path, cache_size_kb=16384, statement_cache=256):
+        self.path = path
+        self.cache_size_kb = cache_size_kb
+        self.statement_cache = statement_cache
+        self._local = threading.local()
+        self._fts = None
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.statement_cache
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+            conn.execute('PRAGMA temp_store = MEMORY')
+            conn.execute('PRAGMA busy_timeout = 30000')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        cursor = self.connection().execute(sql, params)
+        DB_QUERY_SECONDS.labels(_statement_kind(sql)).observe(time.perf_counter() - started)
+        return cursor
+
+    def query(self, sql, params=()):
+        started = time.perf_counter()
+        rows = self.connection().execute(sql, params).fetchall()
+        DB_QUERY_SECONDS.labels(_statement_kind(sql)).observe(time.perf_counter() - started)
+        return rows
+
+    def query_one(self, sql, params=()):
+        started = time.perf_counter()
+        row = self.connection().execute(sql, params).fetchone()
+        DB_QUERY_SECONDS.labels(_statement_kind(sql)).observe(time.perf_counter() - started)
+        return row
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Run the enclosed statements in one transaction"""
+        conn = self.connection()
+        if conn.in_transaction:
+            # Nested use joins the outer transaction
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def migrate(self):
+        """Apply pending schema migrations"""
+        with self.transaction():
+            version = self.query_one('PRAGMA user_version')[0]
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                for step in migration:
+                    if callable(step):
+                        step(self.connection())
+                    else:
+                        self.execute(step)
+                self.execute(f'PRAGMA user_version = {number}')
+        return len(MIGRATIONS)
+
+    # Downloads
+
+    def get_download(self, download_id):
+        row = self.query_one(
+            f'SELECT {", ".join(DOWNLOAD_COLUMNS)} FROM downloads WHERE id = ?', (download_id,)
+        )
+        return dict(row) if row else None
+
+    def has_table(self, name):
+        return self.query_one("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)) is not None
+
+    def get_setting(self, name):
+        """(value, updated_at) of a shared setting, or (None, None) if it was never set"""
+        row = self.query_one('SELECT value, updated_at FROM settings WHERE name = ?', (name,))
+        return (json.loads(row[0]), row[1]) if row else (None, None)
+
+    def update_setting(self, name, update):
+        """Replace a shared setting with update(current value or None); returns the new value"""
+        with self.transaction() as conn:
+            row = conn.execute('SELECT value FROM settings WHERE name = ?', (name,)).fetchone()
+            value = update(json.loads(row[0]) if row else None)
+            conn.execute('''
+                INSERT INTO settings (name, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            ''', (name, json.dumps(value), time.time()))
+        return value
+
+    def table_version(self, name):
+        """Change counter bumped by triggers on every write to the table"""
+        row = self.query_one('SELECT version FROM table_versions WHERE name = ?', (name,))
+        return row[0] if row else 0
+
+    def list_downloads(self, limit=50, cursor=None, status=None, resolution=None,
+                       since=None, until=None, filename=None, search=None):
+        """Return one page of downloads (newest first) and the cursor for the next page.
+
+        Pages are keyset-paginated on (created_at, id), so every page costs
+        the same no matter how deep into the history it is.
+        """
+        where = []
+        params = []
+        if cursor:
+            created_at, download_id = decode_cursor(cursor)
+            where.append('(created_at, id) < (?, ?)')
+            params.extend([created_at, download_id])
+        if status:
+            where.append('status = ?')
+            params.append(status)
+        if resolution:
+            where.append('resolution = ?')
+            params.append(resolution)
+        if since:
+            where.append('created_at >= ?')
+            params.append(since)
+        if until:
+            # A bare date includes the whole day
+            where.append("created_at < date(?, '+1 day')" if len(until) == 10 else 'created_at <= ?')
+            params.append(until)
+        if filename:
+            escaped = filename.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where.append("filename LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+        if search and search.split():
+            if self._has_fts():
+                where.append('id IN (SELECT rowid FROM downloads_fts WHERE downloads_fts MATCH ?)')
+                params.append(fts_query(search))
+            else:
+                where.append('(filename LIKE ? OR url LIKE ?)')
+                params.extend([f'%{search}%', f'%{search}%'])
+
+        query = f'SELECT {", ".join(LIST_COLUMNS)} FROM downloads'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        rows = [dict(row) for row in self.query(query, params)]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+        return rows, next_cursor
+
+    def _has_fts(self):
+        if self._fts is None:
+            self._fts = self.has_table('downloads_fts')
+        return self._fts
+
+    def add_download(self, url, filename, filepath, filesize, resolution, duration, format_id=None):
+        cursor = self.execute('''
+            INSERT INTO downloads (url, filename, filepath, filesize, resolution, duration, url_key, format_id,
+                                   last_accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (url, filename, filepath, filesize, resolution, duration, normalize_url(url), format_id, time.time()))
+        return cursor.lastrowid
+
+    def find_completed_download(self, url, format_id=None):
+        """Most recent completed download of a URL (normalized) in a format"""
+        row = self.query_one(f'''
+            SELECT {", ".join(DOWNLOAD_COLUMNS)} FROM downloads
+            WHERE url_key = ? AND format_id IS ? AND status = 'completed'
+            ORDER BY id DESC LIMIT 1
+        ''', (normalize_url(url), format_id))
+        return dict(row) if row else None
+
+    def find_downloads_by_size(self, filesize, exclude_id=None):
+        """Downloads of exactly filesize bytes (the candidates for identical content)"""
+        rows = self.query(f'''
+            SELECT {", ".join(DOWNLOAD_COLUMNS)} FROM downloads
+            WHERE filesize = ? AND id IS NOT ?
+        ''', (filesize, exclude_id))
+        return [dict(row) for row in rows]
+
+    def set_content_hash(self, download_id, content_hash):
+        self.execute('UPDATE downloads SET content_hash = ? WHERE id = ?', (content_hash, download_id))
+
+    def count_file_references(self, filepath):
+        """Number of downloads whose record points at filepath"""
+        return self.query_one('SELECT COUNT(*) FROM downloads WHERE filepath = ?', (filepath,))[0]
+
+    def delete_download(self, download_id):
+        self.execute('DELETE FROM downloads WHERE id = ?', (download_id,))
+
+    def rename_download(self, download_id, filename, filepath):
+        self.execute('''
+            UPDATE downloads
+            SET filename = ?, filepath = ?
+            WHERE id = ?
+        ''', (filename, filepath, download_id))
@@ -0,0 +1,68 @@
+import hashlib
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """SHA-256 of a file, read in fixed-size chunks so memory use stays flat"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_duplicate(source, target):
+    """Replace target with a hardlink to source; False if they cannot be linked"""
+    try:
+        if os.path.samefile(source, target):
+            return True
+        tmp_path = target + '.dedup'
+        os.link(source, tmp_path)
+    except OSError as e:
+        # Different filesystems, or links not supported: keep the copy
+        log.warning("Could not hardlink %s to %s: %s", target, source, e)
+        return False
+    os.replace(tmp_path, target)
+    return True
+
+
+def deduplicate_download(db, download_id):
+    """Store a finished download's content once if an identical file exists.
+
+    Only files sharing their exact size with another download are hashed,
+    so unique downloads cost nothing. Duplicates become hardlinks of the
+    existing file: each download keeps its own name, and the data is freed
+    by the filesystem when the last link is deleted. Returns the id of the
+    download whose file was linked, or None.
+    """
+    download = db.get_download(download_id)
+    if not download or not download['filesize'] or not os.path.exists(download['filepath']):
+        return None
+
+    candidates = [
+        row for row in db.find_downloads_by_size(download['filesize'], exclude_id=download_id)
+        if os.path.exists(row['filepath'])
+    ]
+    if not candidates:
+        return None
+
+    content_hash = hash_file(download['filepath'])
+    db.set_content_hash(download_id, content_hash)
+
+    for candidate in candidates:
+        if not candidate['content_hash']:
+            candidate['content_hash'] = hash_file(candidate['filepath'])
+            db.set_content_hash(candidate['id'], candidate['content_hash'])
+        if candidate['content_hash'] == content_hash:
+            if link_duplicate(candidate['filepath'], download['filepath']):
+                return candidate['id']
+            return None
+    return None
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class Subscription:
+    """One client's view of the event stream.
+
+    Only the latest pending event per job is kept, so a slow client never
+    buffers more than one event per job no matter how fast jobs report.
+    """
+
+    def __init__(self, broker, job_id=None):
+        self.broker = broker
+        self.job_id = job_id
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def wants(self, job_id):
+        return self.job_id is None or self.job_id == job_id
+
+    def push(self, job_id, event):
+        with self._cond:
+            self._pending[job_id] = event
+            self._pending.move_to_end(job_id)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Wait for pending events; returns an empty list on timeout or once closed"""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._pending.values())
+            self._pending.clear()
+        return events
+
+    def close(self):
+        """Stop receiving events and wake a waiting get()"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Fan out job events to Server-Sent Events subscribers.
+
+    Progress events are coalesced per job and flushed at most ``max_rate``
+    times per second; status changes (queued, running, completed, failed)
+    are delivered immediately.
+    """
+
+    def __init__(self, max_rate=4.0):
+        self.interval = 1.0 / max(max_rate, 0.1)
+        self._subscribers = set()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._deliver_lock = threading.Lock()
+        self._flusher = None
+
+    def subscribe(self, job_id=None):
+        subscription = Subscription(self, job_id)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, job_id, event, immediate=False):
+        """Publish a job event; non-immediate events are rate-limited per job"""
+        if immediate:
+            # Drop any coalesced progress so it can't overtake this event
+            with self._deliver_lock:
+                with self._lock:
+                    self._pending.pop(job_id, None)
+                self._deliver(job_id, event)
+            return
+
+        with self._lock:
+            self._pending[job_id] = event
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='event-flusher')
+                self._flusher.daemon = True
+                self._flusher.start()
+
+    def _deliver(self, job_id, event):
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.wants(job_id)]
+        for subscription in subscribers:
+            subscription.push(job_id, event)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._deliver_lock:
+                with self._lock:
+                    pending = self._pending
+                    self._pending = {}
+                for job_id, event in pending.items():
+                    self._deliver(job_id, event)
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
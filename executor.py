@@ -0,0 +1,64 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorBusyError(Exception):
+    """Too many calls are already queued or running on the executor"""
+
+
+class SingleFlightExecutor:
+    """Thread pool for slow blocking work that request threads wait on.
+
+    Calls with the same key share one run: a second request for a URL that
+    is being extracted waits for the first extraction instead of starting
+    another. At most ``max_pending`` distinct calls may be queued or
+    running; past that, submit() raises ExecutorBusyError right away so
+    request threads do not pile up behind a backlog.
+    """
+
+    def __init__(self, max_workers=4, max_pending=16, name='executor'):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'joined': 0, 'rejected': 0}
+
+    def submit(self, key, func, *args, block=False):
+        """Future for func(*args), shared with an in-flight call for the same key.
+
+        With ``block``, the call is queued even when the executor is busy.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats['joined'] += 1
+                return future
+            if not block and len(self._inflight) >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise ExecutorBusyError(f'{len(self._inflight)} calls already pending')
+            # Run in the caller's context so log records keep its request ID
+            future = self._pool.submit(contextvars.copy_context().run, func, *args)
+            self._inflight[key] = future
+            self.stats['submitted'] += 1
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def run(self, key, func, *args, timeout=None, block=False):
+        """submit() and wait; raises TimeoutError if the result takes longer than timeout"""
+        return self.submit(key, func, *args, block=block).result(timeout)
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def pending(self):
+        with self._lock:
+            return len(self._inflight)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._inflight), max_pending=self.max_pending,
+                        workers=self.max_workers)
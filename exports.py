@@ -0,0 +1,307 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import tarfile
+import time
+import uuid
+import zlib
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('zip', 'tar')
+
+# Bytes read from a file per chunk
+CHUNK_SIZE = 1024 * 1024
+
+# Progress is written to the database at most this often per export
+PROGRESS_INTERVAL = 1.0
+
+ArchiveEntry = namedtuple('ArchiveEntry', ['name', 'path', 'size', 'mtime'])
+
+
+def unique_names(names):
+    """Make archive member names unique by numbering repeats: a.mp4, a (2).mp4"""
+    seen = set()
+    result = []
+    for name in names:
+        candidate = name
+        root, ext = os.path.splitext(name)
+        number = 2
+        while candidate in seen:
+            candidate = f'{root} ({number}){ext}'
+            number += 1
+        seen.add(candidate)
+        result.append(candidate)
+    return result
+
+
+class Archive:
+    """An archive laid out as a list of (length, source) segments.
+
+    A source is bytes, an ArchiveEntry (the file's data) or a callable
+    returning bytes once everything before it has been streamed. Sizes are
+    known up front, so the response has a Content-Length; memory use is
+    one chunk whatever the archive size.
+    """
+
+    extension = None
+    mimetype = None
+    # Whether any byte range can be produced without streaming what precedes it
+    supports_ranges = False
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.segments = self._layout()
+        self.size = sum(length for length, _ in self.segments)
+
+    def _layout(self):
+        raise NotImplementedError
+
+    def _file_data(self, entry, offset=0):
+        """Yield entry.size bytes of the file from offset, padded or cut if it changed since"""
+        remaining = entry.size - offset
+        with open(entry.path, 'rb') as f:
+            f.seek(offset)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    log.warning("%s shrank while being exported, padding with zeros", entry.path)
+                    while remaining > 0:
+                        chunk = bytes(min(CHUNK_SIZE, remaining))
+                        remaining -= len(chunk)
+                        yield chunk
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def _consumed(self, entry, chunk):
+        """Called with each chunk of file data as it is streamed"""
+
+    def iter_range(self, start=0, end=None):
+        """Yield the archive's bytes from start to end (inclusive)"""
+        end = self.size - 1 if end is None else end
+        position = 0
+        for length, source in self.segments:
+            segment_end = position + length
+            if segment_end <= start:
+                position = segment_end
+                continue
+            if position > end:
+                break
+            skip = max(start - position, 0)
+            take = min(end + 1, segment_end) - position - skip
+            if isinstance(source, ArchiveEntry):
+                for chunk in self._file_data(source, skip):
+                    if len(chunk) >= take:
+                        chunk = chunk[:take]
+                    take -= len(chunk)
+                    self._consumed(source, chunk)
+                    yield chunk
+                    if take <= 0:
+                        break
+            else:
+                data = source() if callable(source) else source
+                yield data[skip:skip + take]
+            position = segment_end
+
+
+class TarArchive(Archive):
+    """POSIX (pax) tar; every byte range can be produced on its own"""
+
+    extension = 'tar'
+    mimetype = 'application/x-tar'
+    supports_ranges = True
+
+    def _layout(self):
+        segments = []
+        for entry in self.entries:
+            info = tarfile.TarInfo(entry.name)
+            info.size = entry.size
+            info.mtime = int(entry.mtime)
+            info.mode = 0o644
+            header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+            segments.append((len(header), header))
+            segments.append((entry.size, entry))
+            padding = -entry.size % tarfile.BLOCKSIZE
+            if padding:
+                segments.append((padding, bytes(padding)))
+        # End of archive: two empty blocks
+        segments.append((2 * tarfile.BLOCKSIZE, bytes(2 * tarfile.BLOCKSIZE)))
+        return segments
+
+
+def dos_datetime(mtime):
+    t = time.localtime(max(mtime, 315532800))  # DOS dates start in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+class ZipArchive(Archive):
+    """Store-only ZIP64 (files are not recompressed).
+
+    CRCs are computed while the data streams and written in data
+    descriptors and the central directory, so byte ranges are not
+    supported: the archive is always produced from the start.
+    """
+
+    extension = 'zip'
+    mimetype = 'application/zip'
+    supports_ranges = False
+
+    # Data descriptor, UTF-8 names
+    FLAGS = 0x0808
+    VERSION = 45
+
+    def __init__(self, entries):
+        # CRC-32 of each member's data so far, by name
+        self._crcs = {}
+        super().__init__(entries)
+
+    def _layout(self):
+        segments = []
+        central = []
+        offset = 0
+        for entry in self.entries:
+            name = entry.name.encode('utf-8', 'surrogateescape')
+            dos_time, dos_date = dos_datetime(entry.mtime)
+            local = struct.pack(
+                '<IHHHHHIIIHH', 0x04034b50, self.VERSION, self.FLAGS, 0, dos_time, dos_date,
+                0, 0xFFFFFFFF, 0xFFFFFFFF, len(name), 20
+            ) + name + struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            segments.append((len(local), local))
+            segments.append((entry.size, entry))
+            segments.append((24, self._descriptor(entry)))
+            central.append((entry, name, dos_time, dos_date, offset))
+            offset += len(local) + entry.size + 24
+
+        central_size = sum(46 + len(name) + 28 for _, name, _, _, _ in central)
+        segments.append((central_size, lambda: self._central_directory(central)))
+        end = struct.pack(
+            '<IQHHIIQQQQ', 0x06064b50, 44, self.VERSION, self.VERSION, 0, 0,
+            len(central), len(central), central_size, offset
+        )
+        end += struct.pack('<IIQI', 0x07064b50, 0, offset + central_size, 1)
+        end += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+        segments.append((len(end), end))
+        return segments
+
+    def _consumed(self, entry, chunk):
+        self._crcs[entry.name] = zlib.crc32(chunk, self._crcs.get(entry.name, 0))
+
+    def _descriptor(self, entry):
+        return lambda: struct.pack('<IIQQ', 0x08074b50, self._crcs.get(entry.name, 0), entry.size, entry.size)
+
+    def _central_directory(self, central):
+        records = []
+        for entry, name, dos_time, dos_date, offset in central:
+            records.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | self.VERSION, self.VERSION, self.FLAGS, 0,
+                dos_time, dos_date, self._crcs.get(entry.name, 0), 0xFFFFFFFF, 0xFFFFFFFF, len(name), 28, 0, 0, 0,
+                0o100644 << 16, 0xFFFFFFFF
+            ) + name + struct.pack('<HHQQQ', 0x0001, 24, entry.size, entry.size, offset))
+        return b''.join(records)
+
+
+ARCHIVES = {'zip': ZipArchive, 'tar': TarArchive}
+
+
+class ExportStore:
+    """Exports (a format and a list of download IDs) kept in the database.
+
+    The archive is built from the files on disk each time an export is
+    requested, so any worker can serve it, and a tar export can be resumed
+    with a Range request for as long as the export is kept (``ttl``).
+    Progress of the latest transfer is written back at most once per
+    PROGRESS_INTERVAL.
+    """
+
+    def __init__(self, db, ttl=86400):
+        self.db = db
+        self.ttl = ttl
+
+    def create(self, download_ids, fmt):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Invalid format, use one of: {', '.join(EXPORT_FORMATS)}")
+        now = time.time()
+        export_id = uuid.uuid4().hex
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM exports WHERE created_at < ?', (now - self.ttl,))
+            conn.execute('''
+                INSERT INTO exports (id, format, download_ids, created_at, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (export_id, fmt, json.dumps(download_ids), now, 'created', now))
+        return self.get(export_id)
+
+    def get(self, export_id):
+        row = self.db.query_one('SELECT * FROM exports WHERE id = ? AND created_at >= ?',
+                                (export_id, time.time() - self.ttl))
+        if row is None:
+            return None
+        export = dict(row)
+        export['download_ids'] = json.loads(export['download_ids'])
+        return export
+
+    def archive(self, export):
+        """Archive of the export's files that are still on disk, and its ETag"""
+        ids = export['download_ids']
+        rows = {}
+        # Stay below SQLite's limit on bound parameters
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for row in self.db.query(
+                f'SELECT id, filename, filepath FROM downloads WHERE id IN ({", ".join("?" * len(chunk))})', chunk
+            ):
+                rows[row['id']] = row
+
+        found = []
+        for download_id in ids:
+            row = rows.get(download_id)
+            if row is None:
+                continue
+            try:
+                stat = os.stat(row['filepath'])
+            except OSError:
+                continue
+            found.append((row['filename'], row['filepath'], stat.st_size, stat.st_mtime))
+
+        names = unique_names([filename for filename, _, _, _ in found])
+        entries = [ArchiveEntry(name, path, size, mtime) for name, (_, path, size, mtime) in zip(names, found)]
+        archive = ARCHIVES[export['format']](entries)
+        # Same files (size and modification time) = same bytes, so a resumed
+        # transfer can check it is continuing the same archive
+        digest = hashlib.sha1(export['id'].encode())
+        for entry in entries:
+            digest.update(f'{entry.name}\0{entry.size}\0{entry.mtime}\0'.encode('utf-8', 'surrogateescape'))
+        return archive, f'"{digest.hexdigest()[:24]}"'
+
+    def stream(self, export, archive, start=0, end=None, on_bytes=None):
+        """archive.iter_range(), recording the transfer's progress on the export"""
+        end = archive.size - 1 if end is None else end
+        sent = 0
+        written_at = 0
+        status = 'interrupted'
+        try:
+            for chunk in archive.iter_range(start, end):
+                sent += len(chunk)
+                if on_bytes is not None:
+                    on_bytes(len(chunk))
+                now = time.monotonic()
+                if now - written_at >= PROGRESS_INTERVAL:
+                    written_at = now
+                    self._progress(export['id'], 'streaming', archive, start, sent)
+                yield chunk
+            status = 'completed'
+        finally:
+            # Also reached when the client goes away (the export stays 'interrupted')
+            self._progress(export['id'], status, archive, start, sent)
+            log.info("Export %s %s", export['id'], status, extra={
+                'format': export['format'], 'files': len(archive.entries), 'start': start, 'sent_bytes': sent
+            })
+
+    def _progress(self, export_id, status, archive, start, sent):
+        self.db.execute('''
+            UPDATE exports SET status = ?, files = ?, size = ?, start = ?, sent_bytes = ?, updated_at = ?
+            WHERE id = ?
+        ''', (status, len(archive.entries), archive.size, start, sent, time.time(), export_id))
@@ -0,0 +1,159 @@
+import os
+import unicodedata
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from flask import Response, request
+
+# Bytes read per iteration when the server cannot use sendfile
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised for Range headers that cannot be served (416)"""
+
+
+def make_etag(stat):
+    """Strong ETag derived from the file's size and modification time"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range_header(header, size):
+    """Parse a single-range ``Range`` header into an inclusive (start, end).
+
+    Returns None when the header should be ignored (missing or not a byte
+    range). Multi-range requests are rejected with RangeNotSatisfiable.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+    if ',' in spec:
+        raise RangeNotSatisfiable('Multiple ranges are not supported')
+
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first == '':
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable('Empty suffix range')
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start > end or start >= size:
+        raise RangeNotSatisfiable(f'Range {header} outside of {size} bytes')
+    return start, min(end, size - 1)
+
+
+def if_range_matches(if_range, etag, mtime):
+    """Check an If-Range validator (ETag or HTTP date) against the file"""
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Weak ETags never match for If-Range
+        return if_range == etag
+    try:
+        # A date only matches the exact Last-Modified (RFC 9110, 13.1.5)
+        return int(parsedate_to_datetime(if_range).timestamp()) == int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+def _content_disposition(download_name, as_attachment):
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        return disposition, {'filename': simple, 'filename*': f"UTF-8''{quoted}"}
+    return disposition, {'filename': download_name}
+
+
+def _iter_file_range(f, start, length):
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def send_file_range(filepath, mimetype, download_name=None, as_attachment=False,
+                    mode='sendfile', data_dir=None, accel_prefix='/protected-data/'):
+    """Serve a file with byte-range, If-Range and ETag/304 support.
+
+    ``mode`` selects how the body is sent:
+      - ``sendfile``: the worker sends it (os.sendfile under gunicorn)
+      - ``x-accel``: nginx serves it via X-Accel-Redirect below ``accel_prefix``
+      - ``x-sendfile``: Apache/lighttpd serve it via X-Sendfile
+    """
+    stat = os.stat(filepath)
+    size = stat.st_size
+    etag = make_etag(stat)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        'Cache-Control': 'no-cache',
+    }
+
+    response = Response(mimetype=mimetype, headers=headers)
+    if download_name:
+        disposition, names = _content_disposition(download_name, as_attachment)
+        response.headers.set('Content-Disposition', disposition, **names)
+
+    if mode in ('x-accel', 'x-sendfile'):
+        # The front-end server handles ranges and conditional requests itself
+        if mode == 'x-accel':
+            relative = os.path.relpath(os.path.abspath(filepath), os.path.abspath(data_dir))
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative)
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(filepath)
+        return response
+
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response.status_code = 304
+        return response
+
+    start, end = 0, size - 1
+    try:
+        byte_range = parse_range_header(request.headers.get('Range'), size)
+    except RangeNotSatisfiable:
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range and if_range_matches(request.headers.get('If-Range'), etag, stat.st_mtime):
+        start, end = byte_range
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    length = end - start + 1 if size else 0
+    response.content_length = length
+    if request.method == 'HEAD':
+        # Headers only: no file to open
+        return response
+
+    f = open(filepath, 'rb')
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'):
+        # gunicorn sends Content-Length bytes from the current offset with os.sendfile
+        f.seek(start)
+        response.response = file_wrapper(f, CHUNK_SIZE)
+    else:
+        response.response = _iter_file_range(f, start, length)
+    response.direct_passthrough = True
+    return response
@@ -0,0 +1,178 @@
+import json
+import re
+
+# Declarative format filtering rules; can be overridden by config/format_rules.json
+DEFAULT_RULES = {
+    # Containers offered to the user
+    'allowed_exts': ['mp4', 'webm', 'mkv', 'm4a', 'flv', 'avi', 'mov', 'wmv', '3gp'],
+    # Video-only formats are allowed in these containers (audio is merged during download)
+    'video_only_exts': ['mp4', 'webm', 'mkv'],
+    # Formats that declare an audio language must use one of these
+    'allowed_languages': ['en', 'eng', 'english', 'hu', 'hun', 'hungarian', 'magyar'],
+    # Formats whose note mentions one of these words are skipped (German dubs)
+    'blocked_note_words': ['deutsch', 'german', 'de', 'ger'],
+    # Video codec prefixes that are never offered, e.g. ["av01"]
+    'blocked_vcodecs': [],
+    # Fallback size estimate when neither filesize nor bitrate is known:
+    # [minimum pixel count, bytes per second of video], highest tier first
+    'size_tiers': [
+        [1920 * 1080, 2.0 * 1024 * 1024],
+        [1280 * 720, 1.2 * 1024 * 1024],
+        [854 * 480, 0.8 * 1024 * 1024],
+        [640 * 360, 0.5 * 1024 * 1024],
+        [0, 0.3 * 1024 * 1024],
+    ],
+}
+
+
+class FormatRules:
+    """Format rules compiled into sets and regexes for fast lookups"""
+
+    def __init__(self, config=None):
+        config = dict(DEFAULT_RULES, **(config or {}))
+        self.allowed_exts = frozenset(config['allowed_exts'])
+        self.video_only_exts = frozenset(config['video_only_exts'])
+        self.allowed_languages = frozenset(config['allowed_languages']) | {''}
+        self.blocked_vcodecs = tuple(config['blocked_vcodecs'])
+        self.size_tiers = [tuple(tier) for tier in config['size_tiers']]
+        words = config['blocked_note_words']
+        self.blocked_note = re.compile(
+            r'\b(?:' + '|'.join(re.escape(w) for w in words) + r')\b'
+        ) if words else None
+
+
+def load_rules(path):
+    """Load format rules from a JSON file, falling back to the defaults"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return FormatRules(json.load(f))
+    except FileNotFoundError:
+        return FormatRules()
+
+
+class FormatRecord:
+    """One yt-dlp format, parsed once into the fields the selector needs"""
+
+    __slots__ = (
+        'format_id', 'ext', 'resolution', 'pixels', 'fps', 'vcodec', 'acodec',
+        'quality', 'format_note', 'tbr', 'language', 'language_preference',
+        'filesize', 'sort_key'
+    )
+
+    def to_dict(self):
+        return {
+            'format_id': self.format_id,
+            'ext': self.ext,
+            'resolution': self.resolution,
+            'filesize': self.filesize,
+            'fps': self.fps,
+            'vcodec': self.vcodec,
+            'acodec': self.acodec,
+            'quality': self.quality,
+            'format_note': self.format_note,
+            'tbr': self.tbr,
+            'language': self.language or 'unknown',
+            'language_preference': self.language_preference
+        }
+
+
+def _pixels(fmt, resolution):
+    width = fmt.get('width')
+    height = fmt.get('height')
+    if width and height:
+        return width * height
+    if resolution and 'x' in resolution:
+        try:
+            width, height = map(int, resolution.split('x'))
+            return width * height
+        except ValueError:
+            pass
+    return 0
+
+
+def estimate_filesize(fmt, pixels, duration, rules):
+    """Estimate a format's size: exact size, then bitrate x duration, then resolution tiers"""
+    filesize = fmt.get('filesize') or fmt.get('filesize_approx')
+    if filesize:
+        return int(filesize)
+    if not duration:
+        return 0
+
+    # tbr is in kbit/s; fall back to the video + audio bitrates
+    bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if bitrate:
+        return int(bitrate * 1000 / 8 * duration)
+
+    for min_pixels, bytes_per_second in rules.size_tiers:
+        if pixels >= min_pixels:
+            return int(duration * bytes_per_second)
+    return 0
+
+
+def check_format(fmt, rules):
+    """Return the reason a raw format is rejected, or None if it is allowed"""
+    vcodec = fmt.get('vcodec')
+    ext = fmt.get('ext')
+
+    # Skip formats without video
+    if vcodec == 'none':
+        return 'no video'
+    if fmt.get('acodec') == 'none' and ext not in rules.video_only_exts:
+        return 'video only'
+    if ext not in rules.allowed_exts:
+        return 'container'
+    if vcodec and rules.blocked_vcodecs and vcodec.startswith(rules.blocked_vcodecs):
+        return 'codec'
+
+    language = (fmt.get('language') or '').lower()
+    if (language or (fmt.get('language_preference') or 0) > 0) and language not in rules.allowed_languages:
+        return 'language'
+
+    note = fmt.get('format_note')
+    if note and rules.blocked_note and rules.blocked_note.search(note.lower()):
+        return 'format note'
+    return None
+
+
+def parse_format(fmt, duration, rules):
+    """Parse an allowed raw format into a FormatRecord"""
+    record = FormatRecord()
+    record.format_id = fmt.get('format_id')
+    record.ext = fmt.get('ext')
+    record.resolution = fmt.get('resolution') or 'Unknown'
+    record.pixels = _pixels(fmt, record.resolution)
+    record.fps = fmt.get('fps') or None  # Don't show FPS if not available
+    record.vcodec = fmt.get('vcodec', 'Unknown')
+    record.acodec = fmt.get('acodec', 'Unknown')
+    record.quality = fmt.get('quality', 0)
+    record.format_note = fmt.get('format_note', '')
+    record.tbr = fmt.get('tbr', 0)
+    record.language = (fmt.get('language') or '').lower()
+    record.language_preference = fmt.get('language_preference', 0)
+    record.filesize = estimate_filesize(fmt, record.pixels, duration, rules)
+    # Resolution first, then bitrate, then quality
+    record.sort_key = (record.pixels, record.tbr or 0, record.quality or 0)
+    return record
+
+
+def select_formats(formats, duration, rules, trace=None):
+    """Filter, size and sort raw yt-dlp formats for the format picker.
+
+    ``trace(fmt, reason)`` is called for every raw format (``reason`` is None
+    when the format was kept), so callers can log the selection when needed.
+    """
+    records = []
+    for fmt in formats:
+        reason = check_format(fmt, rules)
+        if reason is None:
+            record = parse_format(fmt, duration, rules)
+            # Skip formats with incomplete critical information
+            if not (record.format_id and record.ext and record.resolution != 'Unknown' and record.filesize > 0):
+                reason = 'incomplete'
+            else:
+                records.append(record)
+        if trace is not None:
+            trace(fmt, reason)
+
+    records.sort(key=lambda record: record.sort_key, reverse=True)
+    return [record.to_dict() for record in records]
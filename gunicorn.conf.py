@@ -0,0 +1,33 @@
+"""gunicorn settings read from the working directory.
+
+Thread workers are the supported high-concurrency mode: request threads
+only wait on sockets, sendfile and the extraction pool, and every piece of
+shared state is in the database, so WEB_CONCURRENCY > 1 is safe. Size
+GUNICORN_THREADS for the number of simultaneous streams plus API headroom.
+
+Do not use --preload: app.py starts the job queue threads at import, and
+threads do not survive the fork into workers.
+"""
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '64'))
+# gthread workers heartbeat from their main loop, so this does not cut off
+# long streams or extractions; it only catches a hung worker
+timeout = 30
+keepalive = 2
+max_requests = 1000
+max_requests_jitter = 100
+
+
+def on_starting(server):
+    # Import the heavy dependencies once in the master. Workers, including
+    # the ones max_requests replaces, fork with them loaded and share their
+    # pages copy-on-write instead of importing them again.
+    import flask
+    import flask_cors
+    if os.environ.get('PRELOAD_YT_DLP', '1') == '1':
+        from startup import warm_yt_dlp
+        warm_yt_dlp()
@@ -0,0 +1,266 @@
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+
+from executor import ExecutorBusyError, SingleFlightExecutor
+from metrics import Counter, Histogram
+from postprocess import PostProcessingError
+
+log = logging.getLogger(__name__)
+
+# Codecs an MPEG-TS segment can carry that browsers' HLS players decode
+VIDEO_CODECS = ('h264', 'hevc')
+AUDIO_CODECS = ('aac', 'mp3', 'ac3', 'eac3')
+
+PLAYLIST_MIMETYPE = 'application/vnd.apple.mpegurl'
+SEGMENT_MIMETYPE = 'video/mp2t'
+
+# Last-play times (file mtimes) are updated at most this often per segment
+TOUCH_INTERVAL = 60
+
+# Eviction frees space down to this fraction of max_bytes, so it does not run on every cut
+EVICT_TO = 0.9
+
+HLS_SEGMENT_REQUESTS = Counter(
+    'downloader_hls_segment_requests_total', 'HLS segment requests by whether the segment was cached', ['result']
+)
+HLS_CUT_SECONDS = Histogram(
+    'downloader_hls_cut_seconds', 'Time to cut one HLS segment with ffmpeg',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+
+class HlsUnavailableError(Exception):
+    """A file cannot be played as HLS (no ffmpeg, or codecs MPEG-TS segments cannot carry)"""
+
+
+def plan_segments(packets, start_time, duration, target):
+    """Segments [start, end, frames, preroll] cut at keyframes, each at least `target` seconds.
+
+    `packets` are the video stream's (pts, dts, keyframe); `end` is None
+    for the last segment. Without packets (audio only), segments are cut
+    every `target` seconds.
+    """
+    if not packets:
+        count = max(math.ceil(duration / target), 1)
+        return [
+            [start_time + i * target, start_time + (i + 1) * target if i + 1 < count else None, None, 0.0]
+            for i in range(count)
+        ]
+
+    keyframes = sorted(pts for pts, _, key in packets if key)
+    starts = []
+    for pts in keyframes:
+        if not starts or pts - starts[-1] >= target:
+            starts.append(pts)
+    preroll = {pts: max(pts - dts, 0.0) for pts, dts, key in packets if key}
+
+    times = sorted(pts for pts, _, _ in packets)
+    segments = []
+    position = 0
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else None
+        frames = 0
+        while position < len(times) and (end is None or times[position] < end):
+            if times[position] >= start:
+                frames += 1
+            position += 1
+        segments.append([start, end, frames, preroll.get(start, 0.0)])
+    return segments
+
+
+class HlsCache:
+    """HLS renditions of stored downloads, cut on demand and kept under ``directory``.
+
+    The playlist comes from the file's keyframes (listed once with
+    ffprobe); each segment is stream-copied by ffmpeg the first time it is
+    requested, so seeking only cuts the segments it lands on and nothing is
+    re-encoded. Files live in one directory per download and file version.
+    Past ``max_bytes``, the least recently played segments are deleted;
+    they are cut again if asked for.
+    """
+
+    def __init__(self, directory, processing, max_bytes=0, segment_seconds=6.0, max_workers=4, max_pending=32):
+        self.directory = str(directory)
+        self.processing = processing
+        self.max_bytes = max_bytes
+        self.segment_seconds = segment_seconds
+        # Concurrent requests for the same segment share one ffmpeg run
+        self._pool = SingleFlightExecutor(max_workers=max_workers, max_pending=max_pending, name='hls')
+        self._evict_lock = threading.Lock()
+        # Bytes of segments on disk, counted on the first cut
+        self._used = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def playlist(self, download_id, path, timeout=None):
+        """(m3u8 text, ETag) of a stored file.
+
+        Raises HlsUnavailableError if it cannot be played as HLS,
+        ExecutorBusyError when too many files are being cut and TimeoutError
+        after timeout.
+        """
+        key, plan = self._plan(download_id, path, timeout)
+        segments = plan['segments']
+        lengths = [(end if end is not None else plan['end']) - start for start, end, _, _ in segments]
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            '#EXT-X-PLAYLIST-TYPE:VOD',
+            f'#EXT-X-TARGETDURATION:{max(math.ceil(max(lengths)), 1)}',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+        ]
+        for number, length in enumerate(lengths):
+            lines.append(f'#EXTINF:{length:.6f},')
+            lines.append(f'{number}.ts')
+        lines.append('#EXT-X-ENDLIST')
+        return '\n'.join(lines) + '\n', key
+
+    def segment(self, download_id, path, number, timeout=None):
+        """Path of a segment, cutting it first if needed; None if there is no such segment"""
+        key, plan = self._plan(download_id, path, timeout)
+        if not 0 <= number < len(plan['segments']):
+            return None
+        output = os.path.join(self.directory, key, f'{number}.ts')
+        try:
+            stat = os.stat(output)
+        except FileNotFoundError:
+            HLS_SEGMENT_REQUESTS.labels('cut').inc()
+            self._pool.run((key, number), self._cut, key, path, plan, number, timeout=timeout)
+        else:
+            HLS_SEGMENT_REQUESTS.labels('cached').inc()
+            self._touch(output, stat)
+        # Cut the next segment while this one plays
+        if number + 1 < len(plan['segments']):
+            following = os.path.join(self.directory, key, f'{number + 1}.ts')
+            if not os.path.exists(following):
+                try:
+                    self._pool.submit((key, number + 1), self._cut, key, path, plan, number + 1)
+                except ExecutorBusyError:
+                    pass
+        return output
+
+    def remove(self, download_id):
+        """Delete the playlists and segments of a download"""
+        prefix = f'{download_id}-'
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and entry.name.startswith(prefix):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def pending(self):
+        return self._pool.pending()
+
+    def _plan(self, download_id, path, timeout):
+        stat = os.stat(path)
+        # A new version of the file gets a new directory
+        key = f'{download_id}-{stat.st_size:x}-{int(stat.st_mtime):x}'
+        try:
+            with open(os.path.join(self.directory, key, 'plan.json')) as f:
+                plan = json.load(f)
+        except (FileNotFoundError, ValueError):
+            plan = self._pool.run((key, 'plan'), self._make_plan, key, path, timeout=timeout)
+        if plan.get('error'):
+            raise HlsUnavailableError(plan['error'])
+        return key, plan
+
+    def _make_plan(self, key, path):
+        """Probe a file and write its segment plan; runs on the HLS pool"""
+        if not self.processing.available or self.processing.ffprobe is None:
+            raise HlsUnavailableError('HLS playback needs ffmpeg and ffprobe')
+        try:
+            info = self.processing.probe(path)
+            if info['video'] is None and info['audio'] is None:
+                plan = {'error': 'No audio or video stream'}
+            elif info['video'] not in VIDEO_CODECS + (None,) or info['audio'] not in AUDIO_CODECS + (None,):
+                codecs = '/'.join(codec for codec in (info['video'], info['audio']) if codec)
+                plan = {'error': f'{codecs} cannot be played as HLS'}
+            else:
+                started = time.perf_counter()
+                packets = self.processing.video_packets(path) if info['video'] else []
+                plan = {
+                    'video': info['video'],
+                    'audio': info['audio'],
+                    'end': info['start_time'] + info['duration'],
+                    'segments': plan_segments(packets, info['start_time'], info['duration'], self.segment_seconds),
+                }
+                log.info("Planned %d HLS segments for %s", len(plan['segments']), os.path.basename(path),
+                         extra={'duration_ms': round((time.perf_counter() - started) * 1000, 1)})
+        except PostProcessingError as e:
+            plan = {'error': f'Could not read the file: {e}'}
+
+        # Failures are kept too: the same file would fail the same way
+        directory = os.path.join(self.directory, key)
+        os.makedirs(directory, exist_ok=True)
+        temp = os.path.join(directory, f'plan.{os.getpid()}.json')
+        with open(temp, 'w') as f:
+            json.dump(plan, f)
+        os.replace(temp, os.path.join(directory, 'plan.json'))
+        return plan
+
+    def _cut(self, key, path, plan, number):
+        """Cut one segment with ffmpeg; runs on the HLS pool"""
+        output = os.path.join(self.directory, key, f'{number}.ts')
+        if os.path.exists(output):
+            # Another worker cut it meanwhile
+            return output
+        start, end, frames, preroll = plan['segments'][number]
+        # A name of this process's own until complete: another worker may cut the same segment
+        partial = os.path.join(self.directory, key, f'{number}.{os.getpid()}.ts')
+        started = time.perf_counter()
+        self.processing.segment(path, partial, start if number else None, end, frames, preroll)
+        HLS_CUT_SECONDS.observe(time.perf_counter() - started)
+        os.replace(partial, output)
+        self._enforce(os.path.getsize(output))
+        return output
+
+    def _touch(self, path, stat):
+        now = time.time()
+        if now - stat.st_mtime >= TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                pass
+
+    def _segments(self):
+        """(mtime, size, path) of every segment on disk (with leftovers of interrupted cuts)"""
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for segment in os.scandir(entry.path):
+                if segment.name.endswith('.ts'):
+                    try:
+                        stat = segment.stat()
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, stat.st_size, segment.path))
+        return found
+
+    def _enforce(self, added):
+        """Delete least recently played segments once the cache is past max_bytes"""
+        if not self.max_bytes:
+            return
+        with self._evict_lock:
+            if self._used is not None:
+                self._used += added
+                if self._used <= self.max_bytes:
+                    return
+            # Recount from disk: other workers cut and evict too
+            segments = self._segments()
+            self._used = sum(size for _, size, _ in segments)
+            if self._used <= self.max_bytes:
+                return
+            evicted = 0
+            for _, size, path in sorted(segments):
+                if self._used <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._used -= size
+                evicted += 1
+            log.info("Evicted %d HLS segments", evicted)
@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that never change which video a URL points at
+TRACKING_PARAMS = {'fbclid', 'gclid', 'si', 'feature', 'igshid', 'ref', 'ref_src'}
+
+# Large info dict keys the downloader never needs
+DROPPED_INFO_KEYS = ('automatic_captions', 'subtitles', 'heatmap')
+
+
+def normalize_url(url):
+    """Normalize a video URL so equivalent links share one cache entry"""
+    parts = urlsplit(url.strip())
+    netloc = parts.netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith('utm_')
+    )
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), netloc, path, urlencode(query), ''))
+
+
+class InfoCache:
+    """Two-tier (memory LRU + SQLite) cache of yt-dlp extraction results.
+
+    Each entry holds the sanitized raw info dict, which ``download_video``
+    feeds back into ``process_ie_result``, and the processed metadata
+    (including the filtered ``formats`` list) returned by /api/video-info.
+    """
+
+    def __init__(self, db, ttl=1800, max_entries=500, memory_entries=64):
+        self.db = db
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0}
+
+    def get(self, url):
+        """Return (info, metadata) for a URL, or None if missing or expired"""
+        key = normalize_url(url)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry['created_at'] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry['info'], entry['metadata']
+                del self._memory[key]
+
+        row = self.db.query_one('SELECT info, metadata, created_at FROM video_info_cache WHERE url_key = ?', (key,))
+        if row and now - row[2] < self.ttl:
+            self.db.execute('UPDATE video_info_cache SET accessed_at = ? WHERE url_key = ?', (now, key))
+        elif row:
+            self.db.execute('DELETE FROM video_info_cache WHERE url_key = ?', (key,))
+
+        with self._lock:
+            if not row:
+                self.stats['misses'] += 1
+                return None
+            if now - row[2] >= self.ttl:
+                # Counted apart from misses: each lookup has exactly one result
+                self.stats['expired'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+
+        entry = {'info': json.loads(row[0]), 'metadata': json.loads(row[1]), 'created_at': row[2]}
+        self._remember(key, entry)
+        return entry['info'], entry['metadata']
+
+    def put(self, url, info, metadata):
+        """Store a sanitized info dict and its processed metadata"""
+        key = normalize_url(url)
+        info = {k: v for k, v in info.items() if k not in DROPPED_INFO_KEYS}
+        now = time.time()
+
+        with self.db.transaction() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO video_info_cache (url_key, info, metadata, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, json.dumps(info), json.dumps(metadata), now, now))
+            # Enforce the size cap by evicting the least recently used rows
+            conn.execute('''
+                DELETE FROM video_info_cache WHERE url_key IN (
+                    SELECT url_key FROM video_info_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+
+        self._remember(key, {'info': info, 'metadata': metadata, 'created_at': now})
+
+    def invalidate(self, url):
+        """Drop a URL from both tiers (e.g. after its stream URLs expired)"""
+        key = normalize_url(url)
+        with self._lock:
+            self._memory.pop(key, None)
+        self.db.execute('DELETE FROM video_info_cache WHERE url_key = ?', (key,))
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_stats(self):
+        """Return hit/miss counters and the current entry counts"""
+        disk_entries = self.db.query_one('SELECT COUNT(*) FROM video_info_cache')[0]
+
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+        stats['disk_entries'] = disk_entries
+        stats['ttl'] = self.ttl
+        stats['max_entries'] = self.max_entries
+        return stats
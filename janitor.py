@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+import time
+
+from jobs import JOB_QUEUED, JOB_RUNNING, JOB_PROCESSING, JOB_FAILED
+
+log = logging.getLogger(__name__)
+
+# yt-dlp leftovers: .part/.ytdl files, fragments, per-format files awaiting
+# a merge (name.f137.mp4) and merge temp files (name.temp.mp4), hardlinks
+# deduplication was about to swap in (name.mp4.dedup), and files a bulk
+# delete set aside but did not get to unlink (name.mp4.1a2b3c4d.deleted)
+PARTIAL_FILE = re.compile(
+    r'(\.part(-Frag\d+)?|\.ytdl|\.f\d+\.\w+|\.temp\.\w+|\.audio\.\w+|\.dedup|\.[0-9a-f]{8}\.deleted)$'
+)
+
+# Set-aside files are also looked for in subfolders, where bulk moves put downloads
+DELETED_FILE = re.compile(r'\.[0-9a-f]{8}\.deleted$')
+
+
+def is_partial_file(name):
+    return PARTIAL_FILE.search(name) is not None
+
+
+def template_prefix(output_template):
+    """File name prefix shared by everything a job writes (name_timestamp.)"""
+    name = os.path.basename(output_template)
+    return name.split('%(', 1)[0]
+
+
+def partial_files(data_dir, reserved=()):
+    """Partial files under data_dir, as (name relative to data_dir, DirEntry).
+
+    Every kind is matched at the top level. In subfolders, where bulk moves
+    put downloads, only set-aside files are; the ``reserved`` top-level
+    folders (the app's caches) are skipped.
+    """
+    pending = [(str(data_dir), '')]
+    while pending:
+        directory, prefix = pending.pop()
+        for entry in os.scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                if prefix or entry.name not in reserved:
+                    pending.append((entry.path, f'{prefix}{entry.name}/'))
+            elif entry.is_file() and (DELETED_FILE.search(entry.name) if prefix else is_partial_file(entry.name)):
+                yield prefix + entry.name, entry
+
+
+def run_janitor(db, data_dir, grace_seconds=3600, retention_seconds=86400, reserved=()):
+    """Reconcile partial download files in data_dir against the jobs table.
+
+    Partial files of queued/running/processing jobs are kept. Those of failed jobs are
+    kept for ``retention_seconds`` so the job can be resumed, then removed.
+    Files no job owns are removed once older than ``grace_seconds`` (younger
+    ones may belong to a job another process just started).
+    """
+    now = time.time()
+    jobs = db.query('''
+        SELECT id, status, output_template, finished_at,
+               CAST(strftime('%s', finished_at) AS INTEGER) AS finished_ts
+        FROM jobs WHERE output_template IS NOT NULL AND status IN (?, ?, ?, ?)
+    ''', (JOB_QUEUED, JOB_RUNNING, JOB_PROCESSING, JOB_FAILED))
+
+    owners = []
+    for job in jobs:
+        expired = job['status'] == JOB_FAILED and (job['finished_ts'] or now) < now - retention_seconds
+        owners.append((template_prefix(job['output_template']), job['id'], expired))
+
+    report = {'scanned': 0, 'kept': 0, 'deleted': [], 'reclaimed_bytes': 0, 'expired_jobs': []}
+    expired_jobs = set()
+
+    for name, entry in partial_files(data_dir, reserved):
+        report['scanned'] += 1
+        stat = entry.stat()
+
+        # Never touch a file a finished download points at
+        if db.query_one('SELECT 1 FROM downloads WHERE filename = ?', (entry.name,)):
+            report['kept'] += 1
+            continue
+
+        owner = next((o for o in owners if o[0] and entry.name.startswith(o[0])), None)
+        if owner is not None and not owner[2]:
+            report['kept'] += 1
+            continue
+        if owner is None and stat.st_mtime > now - grace_seconds:
+            report['kept'] += 1
+            continue
+
+        try:
+            os.remove(entry.path)
+        except OSError as e:
+            log.warning("Janitor could not remove %s: %s", entry.path, e)
+            continue
+        report['deleted'].append(name)
+        report['reclaimed_bytes'] += stat.st_size
+        if owner is not None:
+            expired_jobs.add(owner[1])
+
+    # Expired failed jobs can no longer resume; forget their partial file
+    for job_id in expired_jobs:
+        db.execute('UPDATE jobs SET part_path = NULL WHERE id = ?', (job_id,))
+    report['expired_jobs'] = sorted(expired_jobs)
+    return report
@@ -0,0 +1,445 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from logs import job_id_var
+from metrics import Counter
+
+log = logging.getLogger(__name__)
+
+# Job lifecycle states stored in the jobs table
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+# Downloaded and handed to post-processing; no longer holds a download slot
+JOB_PROCESSING = 'processing'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+# Returned by a runner that called defer(): the stage it handed the job to
+# calls finish() itself
+JOB_DEFERRED = object()
+
+JOB_COLUMNS = (
+    'id', 'url', 'filename', 'format_id', 'status', 'progress', 'error',
+    'download_id', 'created_at', 'started_at', 'finished_at',
+    'output_template', 'selected_format', 'part_path', 'priority', 'phases', 'run_after', 'retries'
+)
+
+# Job columns plus the live progress flushed by the process running it
+SELECT_COLUMNS = ', '.join(JOB_COLUMNS + ('live',))
+
+# Columns a running download may record through update_job()
+UPDATABLE_COLUMNS = ('output_template', 'selected_format', 'part_path')
+
+JOB_RETRIES = Counter('downloader_jobs_retried_total', 'Jobs put back in the queue to retry later')
+
+JOB_OUTCOMES = Counter(
+    'downloader_jobs_finished_total',
+    'Finished jobs by outcome (completed, failed, or reused an existing download)',
+    ['outcome']
+)
+
+
+class RetryLater(Exception):
+    """Raised by a runner to put its job back in the queue for ``delay`` seconds"""
+
+    def __init__(self, delay, reason=''):
+        super().__init__(reason)
+        self.delay = delay
+
+
+class JobQueue:
+    """Bounded pool of worker threads draining the persistent jobs table.
+
+    Jobs are claimed with a conditional UPDATE, so several processes (e.g.
+    gunicorn workers) can share one database without running a job twice;
+    ``max_running`` caps running jobs across all of them. Running jobs are
+    heartbeated; a job whose owner stopped heartbeating is put back in the
+    queue and picked up again after a restart. A runner raising RetryLater
+    has its job queued again, not claimed before the delay has passed; after
+    ``max_retries`` of those the job fails with the runner's reason.
+
+    Live progress is flushed to the database every ``progress_interval``
+    seconds, and changes made by other processes are passed to
+    ``listener`` every ``relay_interval`` seconds while ``relay_when()``
+    is true, so any worker can report on any job.
+    """
+
+    def __init__(self, db, runner, max_workers=2, poll_interval=2.0,
+                 heartbeat_interval=10.0, stale_after=30.0, listener=None,
+                 max_running=None, progress_interval=1.0, relay_interval=1.0, relay_when=None, max_retries=10):
+        self.db = db
+        self.runner = runner
+        self.listener = listener
+        self.max_workers = max(1, int(max_workers))
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_running = max_running
+        self.progress_interval = progress_interval
+        self.relay_interval = relay_interval
+        self.relay_when = relay_when
+        self.max_retries = max_retries
+        self.owner = uuid.uuid4().hex
+
+        self._live = {}
+        self._dirty = set()
+        self._phase_started = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker, heartbeat, progress and relay threads"""
+        if self._threads:
+            return
+        targets = [(self._worker_loop, f'download-worker-{i}') for i in range(self.max_workers)]
+        targets += [(self._heartbeat_loop, 'download-heartbeat'), (self._progress_loop, 'download-progress')]
+        if self.listener is not None:
+            targets.append((self._relay_loop, 'job-relay'))
+        for target, name in targets:
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Ask the worker threads to exit after their current job"""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def submit(self, url, filename, format_id=None, priority='interactive'):
+        """Insert a queued job and wake an idle worker"""
+        cursor = self.db.execute('''
+            INSERT INTO jobs (url, filename, format_id, status, priority, updated_at, updated_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (url, filename, format_id, JOB_QUEUED, priority, time.time(), self.owner))
+        job_id = cursor.lastrowid
+
+        with self._wakeup:
+            self._wakeup.notify()
+        self._notify(self.get_job(job_id), immediate=True)
+        return job_id
+
+    def submit_completed(self, url, filename, download_id, format_id=None, priority='interactive'):
+        """Record a job already satisfied by an existing download"""
+        cursor = self.db.execute('''
+            INSERT INTO jobs (url, filename, format_id, status, progress, download_id, priority,
+                              started_at, finished_at, updated_at, updated_by)
+            VALUES (?, ?, ?, ?, 100, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?, ?)
+        ''', (url, filename, format_id, JOB_COMPLETED, download_id, priority, time.time(), self.owner))
+        job_id = cursor.lastrowid
+
+        JOB_OUTCOMES.labels('reused').inc()
+        self._notify(self.get_job(job_id), immediate=True)
+        return job_id
+
+    def update_job(self, job_id, **columns):
+        """Persist resume information (output template, format, .part path) for a job"""
+        columns = {k: v for k, v in columns.items() if k in UPDATABLE_COLUMNS}
+        if not columns:
+            return
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        self.db.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', list(columns.values()) + [job_id])
+
+    def resume(self, job_id):
+        """Put a failed job back in the queue; it continues from its .part file"""
+        cursor = self.db.execute('''
+            UPDATE jobs SET status = ?, error = NULL, finished_at = NULL, retries = 0, updated_at = ?, updated_by = ?
+            WHERE id = ? AND status = ?
+        ''', (JOB_QUEUED, time.time(), self.owner, job_id, JOB_FAILED))
+        if cursor.rowcount != 1:
+            return False
+
+        with self._wakeup:
+            self._wakeup.notify()
+        self._notify(self.get_job(job_id), immediate=True)
+        return True
+
+    def report_progress(self, job_id, **fields):
+        """Record live progress for a running job (flushed to the database periodically)"""
+        with self._lock:
+            live = self._live.get(job_id)
+            if live is None:
+                return
+            live.update(fields)
+            self._dirty.add(job_id)
+            event = dict(live, id=job_id)
+        self._notify(event)
+
+    def start_phase(self, job_id, name):
+        """Enter a named phase of a running job; the previous one's duration goes into 'phases'"""
+        now = time.perf_counter()
+        with self._lock:
+            live = self._live.get(job_id)
+            if live is None:
+                return
+            self._close_phase(job_id, live, now)
+            self._phase_started[job_id] = now
+            live['phase'] = name
+            self._dirty.add(job_id)
+            event = dict(live, id=job_id)
+        self._notify(event, immediate=True)
+
+    def _close_phase(self, job_id, live, now):
+        started = self._phase_started.pop(job_id, None)
+        if started is not None:
+            live['phases'] = live.get('phases', []) + [{'name': live['phase'], 'seconds': round(now - started, 3)}]
+
+    def defer(self, job_id):
+        """Move a running job to post-processing, freeing its download slot.
+
+        The runner returns JOB_DEFERRED afterwards, and whoever processes the
+        job calls finish().
+        """
+        with self._lock:
+            live = self._live.get(job_id)
+            if live is None:
+                return
+            live['status'] = JOB_PROCESSING
+            event = dict(live, id=job_id)
+        self.db.execute('''
+            UPDATE jobs SET status = ?, updated_at = ?, updated_by = ? WHERE id = ? AND owner = ?
+        ''', (JOB_PROCESSING, time.time(), self.owner, job_id, self.owner))
+        self._notify(event, immediate=True)
+
+    def finish(self, job_id, download_id=None, error=None):
+        """Complete (or, with error, fail) a deferred job"""
+        if error is not None:
+            self._finish(job_id, JOB_FAILED, error=error)
+        else:
+            self._finish(job_id, JOB_COMPLETED, download_id=download_id)
+
+    def _notify(self, job, immediate=False):
+        if self.listener is not None and job is not None:
+            try:
+                self.listener(job, immediate)
+            except Exception as e:
+                log.warning("Job listener failed: %s", e)
+
+    def get_job(self, job_id):
+        """Return a job as a dict, merged with its live progress"""
+        row = self.db.query_one(f'SELECT {SELECT_COLUMNS} FROM jobs WHERE id = ?', (job_id,))
+        if not row:
+            return None
+        return self._row_to_job(row)
+
+    def list_jobs(self, statuses=None, limit=100):
+        """Return the most recent jobs, optionally filtered by status"""
+        query = f'SELECT {SELECT_COLUMNS} FROM jobs'
+        params = []
+        if statuses:
+            query += f' WHERE status IN ({", ".join("?" for _ in statuses)})'
+            params.extend(statuses)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+
+        return [self._row_to_job(row) for row in self.db.query(query, params)]
+
+    def active_count(self):
+        """Number of jobs downloading in this process"""
+        with self._lock:
+            return sum(1 for live in self._live.values() if live['status'] == JOB_RUNNING)
+
+    def counts(self):
+        """Return the number of jobs in each state"""
+        return {row[0]: row[1] for row in self.db.query('SELECT status, COUNT(*) FROM jobs GROUP BY status')}
+
+    def _row_to_job(self, row):
+        job = dict(row)
+        flushed = job.pop('live', None)
+        if job.get('phases'):
+            job['phases'] = json.loads(job['phases'])
+        with self._lock:
+            live = self._live.get(job['id'])
+            if live is not None:
+                job.update(live)
+                return job
+        if flushed and job['status'] in (JOB_RUNNING, JOB_PROCESSING):
+            # Running in another process: its last flushed progress
+            job.update(json.loads(flushed))
+        return job
+
+    def _running_count(self):
+        return self.db.query_one('SELECT COUNT(*) FROM jobs WHERE status = ?', (JOB_RUNNING,))[0]
+
+    def _requeue_stale(self):
+        now = time.time()
+        self.db.execute('''
+            UPDATE jobs SET status = ?, owner = NULL, progress = 0, live = NULL, updated_at = ?, updated_by = ?
+            WHERE status IN (?, ?) AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+        ''', (JOB_QUEUED, now, self.owner, JOB_RUNNING, JOB_PROCESSING, now - self.stale_after))
+
+    def _claim_next(self):
+        self._requeue_stale()
+
+        while True:
+            row = self.db.query_one('''
+                SELECT id FROM jobs WHERE status = ? AND (run_after IS NULL OR run_after <= ?) ORDER BY id LIMIT 1
+            ''', (JOB_QUEUED, time.time()))
+            if not row:
+                return None
+
+            # The running-count check is evaluated under SQLite's write lock,
+            # so processes racing for the last slot cannot both win
+            now = time.time()
+            cursor = self.db.execute('''
+                UPDATE jobs
+                SET status = ?, owner = ?, heartbeat_at = ?, started_at = CURRENT_TIMESTAMP, error = NULL,
+                    live = NULL, run_after = NULL, updated_at = ?, updated_by = ?
+                WHERE id = ? AND status = ?
+                  AND (? IS NULL OR (SELECT COUNT(*) FROM jobs WHERE status = ?) < ?)
+            ''', (
+                JOB_RUNNING, self.owner, now, now, self.owner, row[0], JOB_QUEUED,
+                self.max_running, JOB_RUNNING, self.max_running
+            ))
+            if cursor.rowcount == 1:
+                break
+            if self.max_running and self._running_count() >= self.max_running:
+                # Other processes are running as many jobs as allowed
+                return None
+            # Another worker claimed it first; try the next one
+
+        job = dict(self.db.query_one(f'SELECT {", ".join(JOB_COLUMNS)} FROM jobs WHERE id = ?', (row[0],)))
+
+        with self._lock:
+            self._live[job['id']] = {'status': JOB_RUNNING, 'progress': 0}
+        job.update(status=JOB_RUNNING, progress=0)
+        self._notify(job, immediate=True)
+        return job
+
+    def _finish(self, job_id, status, download_id=None, error=None):
+        with self._lock:
+            live = self._live.pop(job_id, {})
+            self._dirty.discard(job_id)
+            self._close_phase(job_id, live, time.perf_counter())
+
+        self.db.execute('''
+            UPDATE jobs
+            SET status = ?, progress = ?, download_id = ?, error = ?, owner = NULL,
+                finished_at = CURRENT_TIMESTAMP, live = NULL, phases = ?, updated_at = ?, updated_by = ?
+            WHERE id = ? AND owner = ?
+        ''', (
+            status,
+            100 if status == JOB_COMPLETED else live.get('progress', 0),
+            download_id,
+            error,
+            json.dumps(live['phases']) if live.get('phases') else None,
+            time.time(),
+            self.owner,
+            job_id,
+            self.owner
+        ))
+
+        JOB_OUTCOMES.labels(status).inc()
+        self._notify(self.get_job(job_id), immediate=True)
+
+    def _retry_later(self, job_id, delay):
+        """Put a running job back in the queue, not to be claimed for delay seconds"""
+        with self._lock:
+            self._live.pop(job_id, None)
+            self._dirty.discard(job_id)
+            self._phase_started.pop(job_id, None)
+
+        now = time.time()
+        self.db.execute('''
+            UPDATE jobs SET status = ?, owner = NULL, progress = 0, live = NULL, run_after = ?,
+                            retries = retries + 1, updated_at = ?, updated_by = ?
+            WHERE id = ? AND owner = ?
+        ''', (JOB_QUEUED, now + delay, now, self.owner, job_id, self.owner))
+
+        JOB_RETRIES.inc()
+        self._notify(self.get_job(job_id), immediate=True)
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim_next()
+            except sqlite3.Error as e:
+                log.error("Job queue database error: %s", e)
+                job = None
+
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            token = job_id_var.set(job['id'])
+            try:
+                download_id = self.runner(job)
+                if download_id is not JOB_DEFERRED:
+                    self._finish(job['id'], JOB_COMPLETED, download_id=download_id)
+            except RetryLater as e:
+                if job['retries'] >= self.max_retries:
+                    log.warning("Job failed after %d retries: %s", job['retries'], e)
+                    self._finish(job['id'], JOB_FAILED, error=str(e))
+                else:
+                    log.info("Job retries in %.0fs: %s", e.delay, e)
+                    self._retry_later(job['id'], e.delay)
+            except Exception as e:
+                log.warning("Job failed: %s", e)
+                self._finish(job['id'], JOB_FAILED, error=str(e))
+            finally:
+                job_id_var.reset(token)
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self.heartbeat_interval):
+            with self._lock:
+                running = list(self._live.keys())
+            if not running:
+                continue
+            try:
+                self.db.execute(f'''
+                    UPDATE jobs SET heartbeat_at = ?
+                    WHERE owner = ? AND id IN ({", ".join("?" for _ in running)})
+                ''', [time.time(), self.owner] + running)
+            except sqlite3.Error as e:
+                log.warning("Job heartbeat failed: %s", e)
+
+    def _progress_loop(self):
+        while not self._stopping.wait(self.progress_interval):
+            with self._lock:
+                dirty = [(job_id, dict(self._live[job_id])) for job_id in self._dirty if job_id in self._live]
+                self._dirty.clear()
+            for job_id, live in dirty:
+                try:
+                    self.db.execute('''
+                        UPDATE jobs SET progress = ?, live = ?, updated_at = ?, updated_by = ?
+                        WHERE id = ? AND owner = ?
+                    ''', (live.get('progress', 0), json.dumps(live), time.time(), self.owner, job_id, self.owner))
+                except sqlite3.Error as e:
+                    log.warning("Job progress flush failed: %s", e)
+
+    def _relay_loop(self):
+        """Pass job changes made by other processes to the listener"""
+        since = time.time()
+        # Rows seen in the overlap window (id -> updated_at), so none is sent twice
+        seen = {}
+        while not self._stopping.wait(self.relay_interval):
+            if self.relay_when is not None and not self.relay_when():
+                since = time.time()
+                continue
+            try:
+                # Look back a second for rows whose transaction committed late
+                rows = self.db.query(f'''
+                    SELECT {SELECT_COLUMNS}, updated_at FROM jobs
+                    WHERE updated_at > ? AND updated_by != ?
+                    ORDER BY updated_at
+                ''', (since - 1.0, self.owner))
+            except sqlite3.Error as e:
+                log.warning("Job relay failed: %s", e)
+                continue
+            for row in rows:
+                job = self._row_to_job(row)
+                updated_at = job.pop('updated_at')
+                if seen.get(job['id']) == updated_at:
+                    continue
+                seen[job['id']] = updated_at
+                since = max(since, updated_at)
+                self._notify(job, immediate=job['status'] not in (JOB_RUNNING, JOB_PROCESSING))
+            seen = {job_id: updated_at for job_id, updated_at in seen.items() if updated_at > since - 1.0}
@@ -0,0 +1,200 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+
+# IDs attached to every record logged while handling a request or running a job
+request_id_var = contextvars.ContextVar('request_id', default=None)
+job_id_var = contextvars.ContextVar('job_id', default=None)
+# Set for requests that asked for full tracing: sampled records are always kept
+trace_var = contextvars.ContextVar('trace', default=False)
+
+# LogRecord attributes that are not user-supplied extra fields
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+
+class ContextFilter(logging.Filter):
+    """Copy the current request/job IDs onto each record"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.job_id = job_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records at sampled levels (unless the request is traced)"""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelname)
+        if rate is None or rate >= 1 or trace_var.get():
+            return True
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; extra= fields are included as keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        if getattr(record, 'job_id', None):
+            entry['job_id'] = record.job_id
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and key not in ('request_id', 'job_id') and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not the caller's
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+def trace_log(logger, level, msg, *args, **extra):
+    """Log at level, or regardless of the logger's level inside a traced request"""
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, *args, extra=extra)
+    elif trace_var.get():
+        logger.handle(logger.makeRecord(logger.name, level, '(trace)', 0, msg, args, None, extra=extra))
+
+
+def tracing(logger, level=logging.DEBUG):
+    """Whether trace_log(logger, level, ...) would emit anything (skip building the message otherwise)"""
+    return trace_var.get() or logger.isEnabledFor(level)
+
+
+class LogManager:
+    """Root logging setup: callers format nothing and never touch stdout.
+
+    Records pass the context and sampling filters on the calling thread,
+    then go onto a bounded queue. A QueueListener thread formats them and
+    writes them to stdout.
+    """
+
+    def __init__(self, level='INFO', fmt='json', sample_rates=None, queue_size=10000, stream=None):
+        self.sampling = SamplingFilter(sample_rates)
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(ContextFilter())
+        self.handler.addFilter(self.sampling)
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        if fmt == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s %(job_id)s] %(message)s'))
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output, respect_handler_level=False)
+        self._started = False
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(self.handler)
+        root.setLevel(level.upper())
+
+    def start(self):
+        self.listener.start()
+        self._started = True
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Flush queued records and stop the writer thread"""
+        if self._started:
+            self._started = False
+            self.listener.stop()
+
+    def set_levels(self, levels):
+        """Set logger levels at runtime, e.g. {'': 'INFO', 'formats': 'DEBUG'}"""
+        for name, level in levels.items():
+            level = str(level).upper()
+            if level not in LEVELS:
+                raise ValueError(f'Invalid level for {name or "root"}: {level}')
+            logging.getLogger(name or None).setLevel(level)
+
+    def set_sample_rates(self, rates):
+        for level, rate in rates.items():
+            level = str(level).upper()
+            if level not in LEVELS:
+                raise ValueError(f'Invalid level: {level}')
+            rate = float(rate)
+            if not 0 <= rate <= 1:
+                raise ValueError(f'Sample rate for {level} must be between 0 and 1')
+            self.sampling.rates[level] = rate
+
+    def apply(self, config):
+        """Apply a {'levels': ..., 'sample_rates': ...} config"""
+        self.set_levels(config.get('levels') or {})
+        self.set_sample_rates(config.get('sample_rates') or {})
+
+    def follow(self, load, interval=5.0):
+        """Apply the shared config from load() -> (config, version) now and whenever its version changes.
+
+        Runs on a background thread, so a change made through any worker
+        process reaches all of them.
+        """
+        state = {'version': None}
+
+        def sync():
+            config, version = load()
+            if version != state['version'] and config:
+                self.apply(config)
+            state['version'] = version
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    sync()
+                except Exception as e:
+                    logging.getLogger(__name__).warning("Could not load the shared log config: %s", e)
+
+        sync()
+        threading.Thread(target=loop, name='log-config', daemon=True).start()
+
+    def get_config(self):
+        loggers = {'': logging.getLevelName(logging.getLogger().level)}
+        for name, logger in sorted(logging.root.manager.loggerDict.items()):
+            if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+                loggers[name] = logging.getLevelName(logger.level)
+        return {
+            'levels': loggers,
+            'sample_rates': dict(self.sampling.rates),
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped,
+        }
@@ -0,0 +1,299 @@
+import contextvars
+import json
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Containers that browsers play as MP4
+MP4_EXTENSIONS = ('mp4', 'm4v', 'mov')
+# Containers remuxed (stream copy, no re-encode) to MP4 so <video> can play them
+REMUX_EXTENSIONS = ('mkv', 'flv', 'ts')
+# Audio that can go into an MP4 or WebM container without re-encoding
+MP4_AUDIO = ('m4a', 'mp4', 'aac')
+WEBM_AUDIO = ('webm', 'weba', 'opus')
+# Added to MPEG-TS segment timestamps so none is negative (B-frames are
+# decoded before time 0), which the muxer would otherwise shift
+SEGMENT_TS_OFFSET = 1.0
+
+
+class PostProcessingError(Exception):
+    """An ffmpeg step failed"""
+
+
+def extension(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def has_faststart(path):
+    """Whether an MP4's index (moov) comes before its media data (mdat).
+
+    Only the top-level box headers are read. Returns None if the file is
+    not a readable MP4.
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            position = 0
+            while position + 8 <= size:
+                f.seek(position)
+                box_size, box_type = struct.unpack('>I4s', f.read(8))
+                if box_size == 1:
+                    box_size = struct.unpack('>Q', f.read(8))[0]
+                elif box_size == 0:
+                    box_size = size - position
+                if box_type == b'moov':
+                    return True
+                if box_type == b'mdat':
+                    return False
+                if box_size < 8:
+                    return None
+                position += box_size
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def merge_container(video_path, audio_path):
+    """Container that holds both streams without re-encoding"""
+    video_ext, audio_ext = extension(video_path), extension(audio_path)
+    if video_ext in MP4_EXTENSIONS and audio_ext in MP4_AUDIO:
+        return 'mp4'
+    if video_ext == 'webm' and audio_ext in WEBM_AUDIO:
+        return 'webm'
+    return 'mkv'
+
+
+class ProcessingPool:
+    """Bounded pool running ffmpeg on finished downloads.
+
+    Separate from the download workers: a job hands its files over and
+    frees its download slot, and at most ``max_workers`` ffmpeg processes
+    run at a time. Every step stream-copies; nothing is re-encoded.
+    """
+
+    def __init__(self, ffmpeg='ffmpeg', max_workers=2, timeout=3600, remux=True, thumbnails=False, ffprobe=None):
+        self.ffmpeg = shutil.which(ffmpeg)
+        # ffprobe ships with ffmpeg; look next to it first
+        if ffprobe is None and self.ffmpeg is not None:
+            ffprobe = shutil.which(os.path.join(os.path.dirname(self.ffmpeg), 'ffprobe')) or 'ffprobe'
+        self.ffprobe = shutil.which(ffprobe or 'ffprobe')
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.remux_enabled = remux
+        self.thumbnails = thumbnails
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ffmpeg')
+        self._pending = 0
+        self._lock = threading.Lock()
+        if self.ffmpeg is None:
+            log.warning("ffmpeg not found (%s): downloads are stored without post-processing", ffmpeg)
+
+    @property
+    def available(self):
+        return self.ffmpeg is not None
+
+    def plan(self, path, audio_path=None):
+        """ffmpeg steps a downloaded file needs ('merge', 'remux', 'thumbnail')"""
+        if not self.available:
+            return []
+        steps = []
+        if audio_path:
+            # The merge writes a faststart MP4 itself when the codecs allow
+            steps.append('merge')
+        elif self.remux_enabled and self.needs_remux(path):
+            steps.append('remux')
+        if self.thumbnails:
+            steps.append('thumbnail')
+        return steps
+
+    def needs_remux(self, path):
+        ext = extension(path)
+        if ext in MP4_EXTENSIONS:
+            return has_faststart(path) is False
+        return ext in REMUX_EXTENSIONS
+
+    def submit(self, func, *args):
+        """Run func(*args) on the pool (in the caller's logging context)"""
+        with self._lock:
+            self._pending += 1
+        future = self._pool.submit(contextvars.copy_context().run, func, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def pending(self):
+        """Jobs waiting for or running ffmpeg"""
+        with self._lock:
+            return self._pending
+
+    def merge(self, video_path, audio_path):
+        """Mux a video-only and an audio-only file into one; returns the new path.
+
+        If the merge fails, the video is kept (without audio) and its path returned.
+        """
+        container = merge_container(video_path, audio_path)
+        output = os.path.splitext(video_path)[0] + '.' + container
+        command = [
+            self.ffmpeg, '-y', '-v', 'error', '-i', video_path, '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy'
+        ]
+        if container == 'mp4':
+            command += ['-movflags', '+faststart']
+        try:
+            self._run_into(command, output)
+        except (PostProcessingError, OSError) as e:
+            # The download itself finished: store it video-only rather than lose it
+            log.warning("Keeping %s without audio, merge failed: %s", os.path.basename(video_path), e)
+            try:
+                os.remove(audio_path)
+            except FileNotFoundError:
+                pass
+            return video_path
+        for path in (video_path, audio_path):
+            if path != output:
+                os.remove(path)
+        return output
+
+    def remux(self, path):
+        """Stream-copy into an MP4 with the index up front; returns the new path.
+
+        A file whose streams MP4 cannot hold is kept as it is.
+        """
+        output = os.path.splitext(path)[0] + '.mp4'
+        command = [
+            self.ffmpeg, '-y', '-v', 'error', '-i', path,
+            '-map', '0:v', '-map', '0:a?', '-c', 'copy', '-movflags', '+faststart'
+        ]
+        try:
+            self._run_into(command, output)
+        except PostProcessingError as e:
+            log.warning("Keeping %s as it is, remux failed: %s", os.path.basename(path), e)
+            return path
+        if path != output:
+            os.remove(path)
+        return output
+
+    def thumbnail(self, path, output, duration=None, width=480):
+        """Write a JPEG frame from 10% into the video (at most 30 s in)"""
+        at = min(duration * 0.1, 30) if duration else 1
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        command = [
+            self.ffmpeg, '-y', '-v', 'error', '-ss', f'{at:.2f}', '-i', path,
+            '-frames:v', '1', '-vf', f'scale={width}:-2', '-q:v', '4'
+        ]
+        self._run_into(command, output)
+        return output
+
+    def resize_image(self, path, output, width=480):
+        """Write an image as a JPEG at most `width` pixels wide"""
+        command = [
+            self.ffmpeg, '-y', '-v', 'error', '-i', path,
+            '-frames:v', '1', '-vf', f"scale='min({width},iw)':-2", '-q:v', '4'
+        ]
+        self._run_into(command, output)
+        return output
+
+    def probe(self, path):
+        """Duration, start time and codecs of the first video and audio streams (with ffprobe)"""
+        result = json.loads(self._probe([
+            '-show_entries', 'stream=codec_type,codec_name:format=duration,start_time', '-of', 'json', path
+        ]))
+        info = {'video': None, 'audio': None}
+        for stream in result.get('streams', []):
+            if stream.get('codec_type') in info and info[stream['codec_type']] is None:
+                info[stream['codec_type']] = stream.get('codec_name')
+        fmt = result.get('format', {})
+        info['duration'] = float(fmt.get('duration', 0) or 0)
+        info['start_time'] = float(fmt.get('start_time', 0) or 0)
+        return info
+
+    def video_packets(self, path):
+        """(pts, dts, keyframe) in seconds for each packet of the first video stream"""
+        output = self._probe([
+            '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,dts_time,flags', '-of', 'compact=p=0', path
+        ])
+        packets = []
+        for line in output.splitlines():
+            fields = dict(field.partition('=')[::2] for field in line.split('|'))
+            try:
+                pts = float(fields['pts_time'])
+            except (KeyError, ValueError):
+                continue
+            try:
+                dts = float(fields['dts_time'])
+            except (KeyError, ValueError):
+                dts = pts
+            packets.append((pts, dts, 'K' in fields.get('flags', '')))
+        return packets
+
+    def segment(self, path, output, start=None, end=None, frames=None, preroll=0.0):
+        """Stream-copy the packets from the keyframe at `start` to `end` into an MPEG-TS file.
+
+        Timestamps stay those of the source (plus SEGMENT_TS_OFFSET), so
+        segments cut one by one play back to back. `preroll` is how far the keyframe's decode time
+        precedes it (it would be cut otherwise); `frames`, the segment's
+        video packets, stops the video before the next keyframe, which may
+        be decoded before `end`.
+        """
+        command = [self.ffmpeg, '-y', '-v', 'error']
+        if start is not None:
+            # Seek quickly to before the keyframe, then drop exactly what precedes it
+            command += ['-ss', f'{max(start - preroll - 1, 0):.6f}']
+        command += ['-i', path, '-copyts']
+        offset = SEGMENT_TS_OFFSET
+        if start is not None:
+            command += ['-ss', f'{start - preroll:.6f}']
+            offset += start - preroll
+        command += ['-output_ts_offset', f'{offset:.6f}']
+        if end is not None:
+            command += ['-to', f'{end:.6f}']
+        if frames:
+            command += ['-frames:v', str(frames)]
+        command += [
+            '-map', '0:v:0?', '-map', '0:a:0?', '-c', 'copy', '-muxdelay', '0', '-muxpreload', '0', '-f', 'mpegts'
+        ]
+        self._run_into(command, output)
+        return output
+
+    def _probe(self, args):
+        if self.ffprobe is None:
+            raise PostProcessingError('ffprobe not found')
+        try:
+            result = subprocess.run(
+                [self.ffprobe, '-v', 'error'] + args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, timeout=self.timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise PostProcessingError(f'ffprobe took longer than {self.timeout}s')
+        if result.returncode != 0:
+            message = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+            raise PostProcessingError(message[-1] if message else f'ffprobe exited with {result.returncode}')
+        return result.stdout.decode('utf-8', 'replace')
+
+    def _run_into(self, command, output):
+        """Run an ffmpeg command writing to a temp file, then move it to output"""
+        root, ext = os.path.splitext(output)
+        # name.temp.ext is also what the janitor treats as a leftover
+        temp = f'{root}.temp{ext}'
+        try:
+            result = subprocess.run(
+                command + [temp], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE, timeout=self.timeout
+            )
+            if result.returncode != 0:
+                message = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+                raise PostProcessingError(message[-1] if message else f'ffmpeg exited with {result.returncode}')
+            os.replace(temp, output)
+        except subprocess.TimeoutExpired:
+            raise PostProcessingError(f'ffmpeg took longer than {self.timeout}s')
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
@@ -0,0 +1,240 @@
+import functools
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from metrics import Counter, Histogram
+from startup import yt_dlp
+
+log = logging.getLogger(__name__)
+
+# A 429 means "slow down". A single 403 is usually one private or
+# geo-blocked video, so only this many in a row count as throttling.
+FORBIDDEN_STRIKES = 3
+
+HTTP_ERROR_MESSAGE = re.compile(r'HTTP Error (\d{3})')
+
+HOST_QUEUE_WAIT_SECONDS = Histogram(
+    'downloader_host_queue_wait_seconds', 'Time extractions waited for a host slot or backoff', ['host'],
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+HOST_UPSTREAM_SECONDS = Histogram(
+    'downloader_host_upstream_seconds', 'Extraction time against a host, excluding queue wait', ['host'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+HOST_THROTTLED = Counter(
+    'downloader_host_throttled_total', 'Upstream throttling responses by host and status', ['host', 'status']
+)
+
+
+class HostThrottledError(Exception):
+    """A host is rate limiting us; retry after ``retry_after`` seconds"""
+
+    def __init__(self, host, retry_after, status=None):
+        self.host = host
+        self.retry_after = retry_after
+        self.status = status
+        reason = f'answered HTTP {status}' if status else 'is rate limiting requests'
+        super().__init__(f'{host} {reason}, try again in {max(round(retry_after), 1)}s')
+
+
+def host_key(url):
+    """Host a URL is scheduled under (lowercase, without www.)"""
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+@functools.lru_cache(maxsize=4096)
+def extractor_key(url):
+    """yt-dlp extractor that handles a URL (the first whose pattern matches, as yt-dlp picks)"""
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.suitable(url):
+            return ie.ie_key()
+    return 'Generic'
+
+
+def upstream_status(error):
+    """(HTTP status, Retry-After seconds or None) behind a yt-dlp error, or (None, None)"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, 'status', None)
+        response = getattr(error, 'response', None)
+        if isinstance(status, int) and response is not None:
+            retry_after = response.headers.get('Retry-After')
+            return status, float(retry_after) if retry_after and retry_after.isdigit() else None
+        exc_info = getattr(error, 'exc_info', None)
+        error = (getattr(error, 'cause', None) or error.__cause__ or error.__context__
+                 or (exc_info[1] if exc_info else None))
+    return None, None
+
+
+class _Host:
+    __slots__ = ('active', 'waiting', 'strikes', 'forbidden', 'blocked_until', 'last_status')
+
+    def __init__(self):
+        self.active = 0
+        self.waiting = 0
+        self.strikes = 0
+        self.forbidden = 0
+        self.blocked_until = 0.0
+        self.last_status = None
+
+
+class ExtractionScheduler:
+    """Runs yt-dlp extractions with per-host limits and reusable YoutubeDL instances.
+
+    At most ``max_per_host`` extractions run against one host at a time.
+    A 429, or FORBIDDEN_STRIKES 403s in a row, puts the host in backoff:
+    the delay doubles with each consecutive one (from ``backoff_base`` up
+    to ``backoff_max``, or the Retry-After the host sent), with jitter so
+    waiting requests do not return at once, and resets after a success. Callers wait at most
+    ``max_wait`` for a slot, then get HostThrottledError.
+
+    Extraction reuses idle YoutubeDL instances per extractor, keeping their
+    connections and extractor state, and every instance for an extractor
+    (including the downloads', via share_cookies) uses one cookie jar.
+    """
+
+    def __init__(self, options, max_per_host=2, backoff_base=2.0, backoff_max=300.0, max_wait=30.0, max_idle=4):
+        self.options = options
+        self.max_per_host = max_per_host
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self.max_idle = max_idle
+        self._hosts = {}
+        self._condition = threading.Condition()
+        self._idle = {}
+        self._cookiejars = {}
+        self._lock = threading.Lock()
+
+    def extract(self, url):
+        """ydl.extract_info(url, download=False) on a warm instance, within the host's limits"""
+        key = extractor_key(url)
+        with self.slot(url):
+            ydl = self._acquire(key)
+            try:
+                return ydl.extract_info(url, download=False)
+            finally:
+                self._release(key, ydl)
+
+    def share_cookies(self, ydl, url):
+        """Give a new YoutubeDL the cookie jar of the URL's extractor (before it makes a request)"""
+        ydl.cookiejar = self._cookiejar(extractor_key(url))
+        return ydl
+
+    @contextmanager
+    def slot(self, url):
+        """Hold one of the host's slots; throttling errors raised inside start a backoff"""
+        host = host_key(url)
+        began = time.monotonic()
+        deadline = began + self.max_wait
+        with self._condition:
+            state = self._hosts.setdefault(host, _Host())
+            state.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    backoff = state.blocked_until - now
+                    if backoff <= 0 and state.active < self.max_per_host:
+                        break
+                    if now >= deadline or state.blocked_until > deadline:
+                        raise HostThrottledError(host, max(backoff, 1), state.last_status if backoff > 0 else None)
+                    self._condition.wait(min(backoff, deadline - now) if backoff > 0 else deadline - now)
+                state.active += 1
+            finally:
+                state.waiting -= 1
+        started = time.monotonic()
+        HOST_QUEUE_WAIT_SECONDS.labels(host).observe(started - began)
+
+        try:
+            yield
+        except Exception as e:
+            status, retry_after = upstream_status(e)
+            if status is None:
+                match = HTTP_ERROR_MESSAGE.search(str(e))
+                status = int(match.group(1)) if match else None
+            if status == 429:
+                delay = self._back_off(host, status, retry_after)
+                raise HostThrottledError(host, delay, status) from e
+            if status == 403:
+                with self._condition:
+                    state.forbidden += 1
+                    forbidden = state.forbidden
+                # The error stays this video's own; only a run of them slows the host down
+                if forbidden >= FORBIDDEN_STRIKES:
+                    self._back_off(host, status, retry_after)
+            raise
+        else:
+            with self._condition:
+                state.strikes = 0
+                state.forbidden = 0
+        finally:
+            HOST_UPSTREAM_SECONDS.labels(host).observe(time.monotonic() - started)
+            with self._condition:
+                state.active -= 1
+                self._condition.notify_all()
+
+    def _back_off(self, host, status, retry_after):
+        HOST_THROTTLED.labels(host, str(status)).inc()
+        with self._condition:
+            state = self._hosts[host]
+            state.strikes += 1
+            state.last_status = status
+            delay = min(self.backoff_base * 2 ** (state.strikes - 1), self.backoff_max)
+            # Equal jitter: between half and the full delay
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            if retry_after:
+                delay = max(delay, min(retry_after, self.backoff_max))
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+        log.warning("%s answered HTTP %s, backing off for %.1fs", host, status, delay,
+                    extra={'host': host, 'status': status, 'strikes': state.strikes})
+        return delay
+
+    def _cookiejar(self, key):
+        with self._lock:
+            jar = self._cookiejars.get(key)
+            if jar is None:
+                jar = self._cookiejars[key] = yt_dlp.cookies.YoutubeDLCookieJar()
+            return jar
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop()
+        ydl = yt_dlp.YoutubeDL(self.options)
+        ydl.cookiejar = self._cookiejar(key)
+        return ydl
+
+    def _release(self, key, ydl):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(ydl)
+                return
+        ydl.close()
+
+    def snapshot(self):
+        """Per-host slots in use, waiting callers and remaining backoff"""
+        now = time.monotonic()
+        with self._condition:
+            hosts = {
+                host: {
+                    'active': state.active,
+                    'waiting': state.waiting,
+                    'strikes': state.strikes,
+                    'forbidden': state.forbidden,
+                    'backoff_seconds': round(max(state.blocked_until - now, 0), 1),
+                    'last_status': state.last_status,
+                }
+                for host, state in self._hosts.items()
+            }
+        with self._lock:
+            idle = {key: len(instances) for key, instances in self._idle.items()}
+        return {'max_per_host': self.max_per_host, 'hosts': hosts, 'idle_instances': idle}
@@ -10,51 +10,73 @@ import toast from "react-hot-toast";
 
 function App() {
     const [videoInfo, setVideoInfo] = useState(null);
-    const [downloadStatus, setDownloadStatus] = useState({
-        is_downloading: false,
-        progress: 0,
-        status: "idle",
-    });
+    const [jobs, setJobs] = useState([]);
     const [downloads, setDownloads] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [searchQuery, setSearchQuery] = useState("");
+    const [downloadsVersion, setDownloadsVersion] = useState(0);
     const [isLoading, setIsLoading] = useState(false);
 
-    // Poll download status when downloading
+    // Receive live job progress over a single Server-Sent Events stream
     useEffect(() => {
-        let interval;
-        if (downloadStatus.is_downloading) {
-            interval = setInterval(async () => {
-                try {
-                    const status = await videoService.getDownloadStatus();
-                    setDownloadStatus(status);
-
-                    if (
-                        !status.is_downloading &&
-                        status.status !== "downloading"
-                    ) {
-                        // Download completed
-                        toast.success("Download completed!");
-                        loadDownloads(); // Refresh downloads list
-                    }
-                } catch (error) {
-                    console.error("Error checking download status:", error);
+        const unsubscribe = videoService.subscribeJobEvents((event) => {
+            if (event.status === "completed" || event.status === "failed") {
+                if (event.status === "completed") {
+                    toast.success(`Download completed: ${event.filename}`);
+                } else {
+                    toast.error(
+                        `Download failed: ${event.error || event.filename}`
+                    );
                 }
-            }, 1000);
-        }
+                setDownloadsVersion((version) => version + 1); // Refresh downloads list
+                setJobs((current) =>
+                    current.filter((job) => job.id !== event.id)
+                );
+                return;
+            }
 
-        return () => {
-            if (interval) clearInterval(interval);
-        };
-    }, [downloadStatus.is_downloading]);
+            setJobs((current) => {
+                const index = current.findIndex((job) => job.id === event.id);
+                if (index === -1) {
+                    return [...current, event];
+                }
+                const updated = [...current];
+                updated[index] = { ...current[index], ...event };
+                return updated;
+            });
+        });
+
+        return unsubscribe;
+    }, []);
 
-    // Load downloads on component mount
+    // Load downloads on mount, when the search changes and after downloads finish
     useEffect(() => {
         loadDownloads();
-    }, []);
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [searchQuery, downloadsVersion]);
 
     const loadDownloads = async () => {
         try {
-            const data = await videoService.getDownloads();
-            setDownloads(data);
+            const data = await videoService.getDownloads(
+                searchQuery ? { q: searchQuery } : {}
+            );
+            setDownloads(data.items);
+            setNextCursor(data.next_cursor);
+        } catch (error) {
+            console.error("Error loading downloads:", error);
+            toast.error("Failed to load downloads");
+        }
+    };
+
+    const loadMoreDownloads = async () => {
+        if (!nextCursor) return;
+        try {
+            const data = await videoService.getDownloads({
+                cursor: nextCursor,
+                ...(searchQuery ? { q: searchQuery } : {}),
+            });
+            setDownloads((current) => [...current, ...data.items]);
+            setNextCursor(data.next_cursor);
         } catch (error) {
             console.error("Error loading downloads:", error);
             toast.error("Failed to load downloads");
@@ -89,22 +111,24 @@ function App() {
             return;
         }
 
-        if (downloadStatus.is_downloading) {
-            toast.error("Another download is in progress");
-            return;
-        }
-
         try {
-            await videoService.startDownload(
+            const { job } = await videoService.startDownload(
                 videoInfo.url || "",
                 filename,
                 format_id
             );
-            toast.success("Download started");
+            if (job.status === "completed") {
+                toast.success("Already downloaded");
+                setDownloadsVersion((version) => version + 1);
+                return;
+            }
+            toast.success("Download queued");
 
-            // Start polling for status
-            const status = await videoService.getDownloadStatus();
-            setDownloadStatus(status);
+            setJobs((current) =>
+                current.some((existing) => existing.id === job.id)
+                    ? current
+                    : [...current, job]
+            );
         } catch (error) {
             console.error("Error starting download:", error);
             toast.error(
@@ -193,19 +217,22 @@ function App() {
                     <VideoInput
                         onSubmit={handleUrlSubmit}
                         isLoading={isLoading}
-                        disabled={downloadStatus.is_downloading}
                     />
 
                     {/* Download Progress */}
-                    {downloadStatus.is_downloading && (
+                    {jobs.map((job) => (
                         <DownloadProgress
-                            progress={downloadStatus.progress}
-                            status={downloadStatus.status}
+                            key={job.id}
+                            filename={job.filename}
+                            progress={job.progress || 0}
+                            status={job.phase || job.status}
+                            speed={job.speed}
+                            eta={job.eta}
                         />
-                    )}
+                    ))}
 
                     {/* Video Preview */}
-                    {videoInfo && !downloadStatus.is_downloading && (
+                    {videoInfo && (
                         <VideoPreview
                             videoInfo={videoInfo}
                             onDownload={handleDownload}
@@ -218,6 +245,13 @@ function App() {
                         onDownload={handleFileDownload}
                         onDelete={handleFileDelete}
                         onRename={handleFileRename}
+                        hasMore={Boolean(nextCursor)}
+                        onLoadMore={loadMoreDownloads}
+                        searchQuery={searchQuery}
+                        onSearch={setSearchQuery}
+                        onExport={() =>
+                            videoService.exportDownloads({ q: searchQuery })
+                        }
                     />
                 </div>
             </div>
@@ -1,13 +1,22 @@
 import React from "react";
 import { Loader } from "lucide-react";
+import { formatFileSize, formatDuration } from "../utils/helpers";
 
-const DownloadProgress = ({ progress, status }) => {
+const DownloadProgress = ({ filename, progress, status, speed, eta }) => {
     const getStatusText = () => {
         switch (status) {
+            case "queued":
+                return "Waiting in queue...";
             case "downloading":
                 return "Downloading video...";
             case "processing":
                 return "Processing video...";
+            case "merging":
+                return "Merging audio and video...";
+            case "remuxing":
+                return "Optimizing for playback...";
+            case "thumbnail":
+                return "Creating thumbnail...";
             default:
                 return "Preparing download...";
         }
@@ -18,6 +27,11 @@ const DownloadProgress = ({ progress, status }) => {
             <h2 className="text-xl font-semibold mb-4 flex items-center text-gray-900 dark:text-white transition-colors duration-300">
                 <Loader className="w-5 h-5 mr-2 animate-spin text-gray-700 dark:text-gray-300" />
                 Download Progress
+                {filename && (
+                    <span className="ml-2 text-base font-normal text-gray-500 dark:text-gray-400 truncate">
+                        {filename}
+                    </span>
+                )}
             </h2>
 
             <div className="space-y-4">
@@ -26,6 +40,8 @@ const DownloadProgress = ({ progress, status }) => {
                         {getStatusText()}
                     </span>
                     <span className="text-sm text-gray-500 dark:text-gray-400 transition-colors duration-300">
+                        {speed ? `${formatFileSize(speed)}/s · ` : ""}
+                        {eta ? `${formatDuration(eta)} left · ` : ""}
                         {Math.round(progress)}%
                     </span>
                 </div>
@@ -9,6 +9,8 @@ import {
     Monitor,
     Clock,
     Play,
+    Search,
+    Archive,
 } from "lucide-react";
 import {
     formatFileSize,
@@ -17,8 +19,19 @@ import {
 } from "../utils/helpers";
 import VideoPlayer from "./VideoPlayer";
 
-const DownloadsList = ({ downloads, onDownload, onDelete, onRename }) => {
+const DownloadsList = ({
+    downloads,
+    onDownload,
+    onDelete,
+    onRename,
+    hasMore,
+    onLoadMore,
+    searchQuery,
+    onSearch,
+    onExport,
+}) => {
     const [editingId, setEditingId] = useState(null);
+    const [searchInput, setSearchInput] = useState(searchQuery || "");
     const [editName, setEditName] = useState("");
     const [selectedVideo, setSelectedVideo] = useState(null);
 
@@ -59,7 +72,13 @@ const DownloadsList = ({ downloads, onDownload, onDelete, onRename }) => {
     const handleVideoDownload = (downloadId) => {
         onDownload(downloadId);
     };
-    if (downloads.length === 0) {
+
+    const handleSearchSubmit = (e) => {
+        e.preventDefault();
+        onSearch(searchInput.trim());
+    };
+
+    if (downloads.length === 0 && !searchQuery) {
         return (
             <div className="bg-white dark:bg-gray-800 rounded-lg shadow-md dark:shadow-lg p-6 transition-colors duration-300">
                 <h2 className="text-xl font-semibold mb-4 flex items-center text-gray-900 dark:text-white transition-colors duration-300">
@@ -83,9 +102,39 @@ const DownloadsList = ({ downloads, onDownload, onDelete, onRename }) => {
         <div className="bg-white dark:bg-gray-800 rounded-lg shadow-md dark:shadow-lg p-6 transition-colors duration-300">
             <h2 className="text-xl font-semibold mb-4 flex items-center text-gray-900 dark:text-white transition-colors duration-300">
                 <FileVideo className="w-5 h-5 mr-2 text-gray-700 dark:text-gray-300" />
-                Downloads ({downloads.length})
+                Downloads ({downloads.length}
+                {hasMore ? "+" : ""})
+                {downloads.length > 0 && (
+                    <button
+                        onClick={onExport}
+                        className="ml-auto flex items-center px-3 py-1 text-sm font-normal bg-gray-100 dark:bg-gray-700 text-gray-700 dark:text-gray-300 rounded hover:bg-gray-200 dark:hover:bg-gray-600 transition-colors duration-300"
+                        title="Download the listed files as one ZIP archive"
+                    >
+                        <Archive className="w-4 h-4 mr-1" />
+                        Export
+                    </button>
+                )}
             </h2>
 
+            <form onSubmit={handleSearchSubmit} className="mb-4 flex">
+                <div className="relative flex-1">
+                    <Search className="w-4 h-4 absolute left-3 top-1/2 -translate-y-1/2 text-gray-400" />
+                    <input
+                        type="search"
+                        value={searchInput}
+                        onChange={(e) => setSearchInput(e.target.value)}
+                        placeholder="Search by filename or URL"
+                        className="w-full pl-9 pr-3 py-2 border border-gray-300 dark:border-gray-600 rounded-lg bg-white dark:bg-gray-700 text-gray-900 dark:text-white placeholder-gray-500 dark:placeholder-gray-400 focus:ring-2 focus:ring-blue-500 focus:border-transparent transition-colors duration-300"
+                    />
+                </div>
+            </form>
+
+            {downloads.length === 0 && (
+                <p className="text-center py-4 text-gray-500 dark:text-gray-400 transition-colors duration-300">
+                    No downloads match your search
+                </p>
+            )}
+
             <div className="space-y-4">
                 {downloads.map((download) => (
                     <div
@@ -93,6 +142,17 @@ const DownloadsList = ({ downloads, onDownload, onDelete, onRename }) => {
                         className="border border-gray-200 dark:border-gray-700 rounded-lg p-4 hover:shadow-md dark:hover:shadow-lg transition-all duration-300 bg-gray-50 dark:bg-gray-700"
                     >
                         <div className="flex items-start justify-between">
+                            {download.thumbnail && (
+                                <img
+                                    src={download.thumbnail}
+                                    alt=""
+                                    loading="lazy"
+                                    className="w-32 h-20 object-cover rounded mr-4 flex-shrink-0"
+                                    onError={(e) => {
+                                        e.currentTarget.style.display = "none";
+                                    }}
+                                />
+                            )}
                             <div className="flex-1 min-w-0">
                                 {editingId === download.id ? (
                                     <div className="flex items-center space-x-2">
@@ -219,6 +279,17 @@ const DownloadsList = ({ downloads, onDownload, onDelete, onRename }) => {
                 ))}
             </div>
 
+            {hasMore && (
+                <div className="mt-4 text-center">
+                    <button
+                        onClick={onLoadMore}
+                        className="px-4 py-2 text-sm bg-gray-100 dark:bg-gray-700 text-gray-700 dark:text-gray-200 rounded-lg hover:bg-gray-200 dark:hover:bg-gray-600 transition-colors duration-300"
+                    >
+                        Load more
+                    </button>
+                </div>
+            )}
+
             {/* Video Player Popup */}
             {selectedVideo && (
                 <VideoPlayer
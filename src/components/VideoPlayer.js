@@ -1,8 +1,63 @@
-import React from "react";
+import React, { useEffect, useRef } from "react";
 import { X, Download, Play } from "lucide-react";
 import { formatFileSize, formatDuration } from "../utils/helpers";
 
+// Containers browsers play directly; anything else is played as HLS
+const NATIVE_EXTENSIONS = ["mp4", "m4v", "mov", "webm", "ogv"];
+
 const VideoPlayer = ({ video, onClose, onDownload }) => {
+    const videoRef = useRef(null);
+
+    useEffect(() => {
+        const element = videoRef.current;
+        if (!video || !element) return undefined;
+
+        const direct = `/api/stream-file/${video.id}`;
+        const extension = (video.filename || "").split(".").pop().toLowerCase();
+        if (NATIVE_EXTENSIONS.includes(extension)) {
+            element.src = direct;
+            return undefined;
+        }
+
+        // Segments are cut on the server as they are played; if the file
+        // cannot be played as HLS, fall back to the file itself
+        const playlist = `/api/hls/${video.id}/index.m3u8`;
+        let player = null;
+        let cancelled = false;
+        const fallback = () => {
+            if (player) {
+                player.destroy();
+                player = null;
+            }
+            element.src = direct;
+        };
+
+        if (element.canPlayType("application/vnd.apple.mpegurl")) {
+            element.addEventListener("error", fallback, { once: true });
+            element.src = playlist;
+        } else {
+            import("hls.js").then(({ default: Hls }) => {
+                if (cancelled) return;
+                if (!Hls.isSupported()) {
+                    fallback();
+                    return;
+                }
+                player = new Hls();
+                player.on(Hls.Events.ERROR, (event, data) => {
+                    if (data.fatal) fallback();
+                });
+                player.loadSource(playlist);
+                player.attachMedia(element);
+            }, fallback);
+        }
+
+        return () => {
+            cancelled = true;
+            element.removeEventListener("error", fallback);
+            if (player) player.destroy();
+        };
+    }, [video]);
+
     if (!video) return null;
 
     const handleOverlayClick = (e) => {
@@ -46,19 +101,8 @@ const VideoPlayer = ({ video, onClose, onDownload }) => {
                         className="w-full h-auto max-h-[60vh]"
                         preload="metadata"
                         poster={video.thumbnail || undefined}
+                        ref={videoRef}
                     >
-                        <source
-                            src={`/api/stream-file/${video.id}`}
-                            type="video/mp4"
-                        />
-                        <source
-                            src={`/api/stream-file/${video.id}`}
-                            type="video/webm"
-                        />
-                        <source
-                            src={`/api/stream-file/${video.id}`}
-                            type="video/mkv"
-                        />
                         Your browser does not support the video tag.
                     </video>
                 </div>
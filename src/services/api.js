@@ -26,15 +26,32 @@ export const videoService = {
         return response.data;
     },
 
-    // Get download status
-    getDownloadStatus: async () => {
-        const response = await api.get("/download-status");
+    // Get a single download job
+    getJob: async (jobId) => {
+        const response = await api.get(`/jobs/${jobId}`);
         return response.data;
     },
 
-    // List all downloads
-    getDownloads: async () => {
-        const response = await api.get("/downloads");
+    // List download jobs, optionally filtered by status
+    getJobs: async (statuses = []) => {
+        const response = await api.get("/jobs", {
+            params: statuses.length ? { status: statuses.join(",") } : {},
+        });
+        return response.data;
+    },
+
+    // Subscribe to live job events (Server-Sent Events); returns an unsubscribe function
+    subscribeJobEvents: (onJob) => {
+        const source = new EventSource(`${API_BASE_URL}/events`);
+        source.addEventListener("job", (event) => {
+            onJob(JSON.parse(event.data));
+        });
+        return () => source.close();
+    },
+
+    // List downloads one page at a time ({ items, next_cursor })
+    getDownloads: async (params = {}) => {
+        const response = await api.get("/downloads", { params });
         return response.data;
     },
 
@@ -46,6 +63,26 @@ export const videoService = {
         return response;
     },
 
+    // Export downloads as one archive; a form POST lets the browser stream
+    // it straight to disk instead of holding it in memory
+    exportDownloads: (filters = {}, format = "zip") => {
+        const form = document.createElement("form");
+        form.method = "POST";
+        form.action = `${API_BASE_URL}/export`;
+        Object.entries({ ...filters, format }).forEach(([name, value]) => {
+            if (value) {
+                const input = document.createElement("input");
+                input.type = "hidden";
+                input.name = name;
+                input.value = value;
+                form.appendChild(input);
+            }
+        });
+        document.body.appendChild(form);
+        form.submit();
+        document.body.removeChild(form);
+    },
+
     // Delete file from server
     deleteFile: async (downloadId) => {
         const response = await api.delete(`/delete-file/${downloadId}`);
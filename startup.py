@@ -0,0 +1,131 @@
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Extractors loaded when yt-dlp is warmed up: the generic fallback and the most used site
+WARM_EXTRACTORS = ('Generic', 'Youtube')
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None or self._name in sys.modules
+
+    def load(self):
+        """Import the module (once, thread-safe) and return it"""
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    preloaded = self._name in sys.modules
+                    self._module = importlib.import_module(self._name)
+                    if not preloaded:
+                        log.info("Imported %s", self._name, extra={
+                            'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+                        })
+                module = self._module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+# Shared by every module that runs yt-dlp, so only the first caller pays for the import
+yt_dlp = LazyModule('yt_dlp')
+
+
+def warm_yt_dlp():
+    """Import yt-dlp and the most used extractors.
+
+    Run in the gunicorn master (gunicorn.conf.py) so forked workers share
+    the modules copy-on-write, or on a worker's background thread.
+    """
+    module = yt_dlp.load()
+    with module.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        for ie_key in WARM_EXTRACTORS:
+            ydl.get_info_extractor(ie_key)
+    return module
+
+
+class Startup:
+    """Runs startup phases on a background thread and records how long each took.
+
+    Module import only builds the Flask app, so lightweight routes answer
+    immediately; routes that need the database wait for ``ready``, which is
+    set once every phase in ``required`` has finished.
+    """
+
+    def __init__(self):
+        self.began = time.time()
+        self.ready = threading.Event()
+        self.phases = []
+        self.error = None
+        self._lock = threading.Lock()
+
+    def _run_phase(self, name, func):
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            func()
+        except Exception:
+            status = 'failed'
+            log.exception("Startup phase %s failed", name)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                self.phases.append({'name': name, 'status': status, 'duration_ms': round(duration * 1000, 1)})
+        log.info("Startup phase %s done", name, extra={'duration_ms': round(duration * 1000, 1)})
+
+    def start(self, required, background=()):
+        """Run the (name, func) phases in order on a background thread"""
+        def run():
+            try:
+                for name, func in required:
+                    self._run_phase(name, func)
+            except Exception as e:
+                self.error = str(e)
+                return
+            finally:
+                self.ready.set()
+            for name, func in background:
+                try:
+                    self._run_phase(name, func)
+                except Exception:
+                    pass
+
+        threading.Thread(target=run, daemon=True, name='startup').start()
+        return self
+
+    def wait(self, timeout):
+        """Wait for the required phases; returns an error message or None"""
+        if not self.ready.wait(timeout):
+            return 'Server is starting up'
+        if self.error:
+            return f'Startup failed: {self.error}'
+        return None
+
+    def get_status(self):
+        with self._lock:
+            phases = list(self.phases)
+        return {
+            'ready': self.ready.is_set() and not self.error,
+            'pid': os.getpid(),
+            'error': self.error,
+            'uptime_seconds': round(time.time() - self.began, 3),
+            'phases': phases,
+            'yt_dlp_loaded': yt_dlp.loaded,
+        }
@@ -0,0 +1,183 @@
+"""Static files of the React build served from an in-memory manifest.
+
+    python static_assets.py [build]
+
+writes the .gz (and, with the brotli package installed, .br) variants
+next to the build's files, so the server does not have to compress them
+at startup.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+from flask import Response, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# Only these are worth compressing (images and fonts already are compressed)
+COMPRESSIBLE = re.compile(r'\.(js|css|html|json|svg|txt|map|ico|xml|webmanifest)$')
+MIN_COMPRESS_SIZE = 1024
+
+# Files up to this size are kept in memory; larger ones are sent from disk
+MAX_MEMORY_SIZE = 4 * 1024 * 1024
+
+# Content-hashed names from the build (main.3f2a1b9c.js): never change, cache forever
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.(chunk\.)?\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class Asset:
+    """One file of the build and its precompressed variants"""
+
+    __slots__ = ('path', 'size', 'mimetype', 'etag', 'body', 'variants', 'cache_control')
+
+    def __init__(self, path, data, size):
+        self.path = path
+        self.size = size
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha1(data).hexdigest()[:20] if data is not None else None
+        self.body = data
+        # encoding -> compressed bytes
+        self.variants = {}
+        self.cache_control = IMMUTABLE if HASHED_NAME.search(path) else REVALIDATE
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class StaticAssets:
+    """Manifest of the files under ``root``, built once at startup.
+
+    Requests for paths not in the manifest never reach the filesystem:
+    names with an extension are 404s, anything else is the app's
+    index.html (client-side routes). Each asset is served in the best
+    encoding the client accepts, from .br/.gz files shipped with the build
+    or compressed by compress_missing().
+    """
+
+    def __init__(self, root, index='index.html'):
+        self.root = str(root)
+        self.index = index
+        self.assets = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Index the build directory; returns self"""
+        assets = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                full_path = os.path.join(directory, name)
+                if name.endswith(('.gz', '.br')):
+                    continue
+                size = os.path.getsize(full_path)
+                data = None
+                if size <= MAX_MEMORY_SIZE:
+                    with open(full_path, 'rb') as f:
+                        data = f.read()
+                rel = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                asset = Asset(full_path, data, size)
+                if data is not None:
+                    self._load_variants(asset)
+                assets[rel] = asset
+        with self._lock:
+            self.assets = assets
+        log.info("Indexed %d static files in %s", len(assets), self.root)
+        return self
+
+    def _load_variants(self, asset):
+        mtime = os.path.getmtime(asset.path)
+        for encoding, suffix in ENCODINGS:
+            try:
+                # A variant older than its file is left over from a previous build
+                if os.path.getmtime(asset.path + suffix) >= mtime:
+                    with open(asset.path + suffix, 'rb') as f:
+                        asset.variants[encoding] = f.read()
+            except OSError:
+                pass
+
+    def compress_missing(self, persist=True):
+        """Compress the assets the build shipped no variants for.
+
+        With ``persist``, the variants are also written next to the files
+        (if the directory is writable) so the next start finds them.
+        """
+        encodings = [(encoding, suffix) for encoding, suffix in ENCODINGS if encoding != 'br' or brotli]
+        compressed = 0
+        for rel, asset in list(self.assets.items()):
+            if asset.body is None or asset.size < MIN_COMPRESS_SIZE or not COMPRESSIBLE.search(rel):
+                continue
+            for encoding, suffix in encodings:
+                if encoding in asset.variants:
+                    continue
+                data = compress(asset.body, encoding)
+                if len(data) >= asset.size:
+                    continue
+                asset.variants[encoding] = data
+                compressed += 1
+                if persist:
+                    try:
+                        with open(asset.path + suffix, 'wb') as f:
+                            f.write(data)
+                    except OSError:
+                        persist = False
+        if compressed:
+            log.info("Compressed %d static file variants", compressed)
+        return compressed
+
+    def lookup(self, path):
+        """Asset for a request path, index.html for client-side routes, else None"""
+        asset = self.assets.get(path)
+        if asset is not None:
+            return asset
+        if '.' in path.rsplit('/', 1)[-1]:
+            return None
+        return self.assets.get(self.index)
+
+    def response(self, asset, request):
+        """Serve an asset in the best encoding the request accepts, or 304"""
+        encoding = None
+        for candidate, _ in ENCODINGS:
+            if candidate in asset.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        # Each representation has its own strong ETag
+        etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+
+        if asset.body is None:
+            # Too large to keep in memory
+            response = send_file(asset.path, mimetype=asset.mimetype, conditional=True)
+        elif request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            body = asset.variants[encoding] if encoding else asset.body
+            response = Response(body, mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(etag)
+        response.headers['Cache-Control'] = asset.cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    assets = StaticAssets(sys.argv[1] if len(sys.argv) > 1 else 'build').load()
+    assets.compress_missing()
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Eviction order: least recently accessed first, or oldest download first
+EVICTION_POLICIES = ('lru', 'age')
+
+# Files accessed this recently are never evicted (they may be streaming)
+EVICTION_GRACE_SECONDS = 300
+
+# Last-access times are written at most this often per download
+TOUCH_INTERVAL = 60
+
+
+class StorageFullError(Exception):
+    """Not enough space for a download even after eviction"""
+
+
+def parse_size(value):
+    """Parse a size like '50G', '512M' or '1048576' (bytes); 0 = unlimited"""
+    if not value:
+        return 0
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f'Invalid size: {value}')
+    number, unit = match.groups()
+    multiplier = 1024 ** ('KMGT'.index(unit.upper()) + 1) if unit else 1
+    return int(float(number) * multiplier)
+
+
+class StorageManager:
+    """Keeps DATA_DIR within a byte quota and enough free disk space.
+
+    Usage is the sum of ``downloads.filesize``, counting deduplicated
+    (hardlinked) content once. Eviction only runs once a ``quota`` or
+    ``max_age`` is set: then, when the quota or free-space target is
+    missed, downloads are evicted in ``policy`` order, and downloads not
+    accessed for ``max_age`` are evicted regardless. Without either,
+    ``reserve`` only refuses downloads that would not fit.
+    Each run that evicts something is logged to the evictions table, and
+    ``on_remove`` (if given) is called with each evicted download's ID.
+    """
+
+    def __init__(self, db, data_dir, quota=0, policy='lru', max_age=0, min_free=0, on_remove=None):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f'Unknown eviction policy: {policy}')
+        self.db = db
+        self.data_dir = data_dir
+        self.quota = quota
+        self.policy = policy
+        self.max_age = max_age
+        self.min_free = min_free
+        self.on_remove = on_remove
+
+        self._touched = {}
+        self._lock = threading.Lock()
+        # Serializes eviction runs (several jobs may start at once)
+        self._evict_lock = threading.Lock()
+
+    def touch(self, download_id):
+        """Record an access to a download (throttled to one write per TOUCH_INTERVAL)"""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(download_id, 0) < TOUCH_INTERVAL:
+                return
+            self._touched[download_id] = now
+        self.db.execute('UPDATE downloads SET last_accessed_at = ? WHERE id = ?', (now, download_id))
+
+    def used_bytes(self):
+        row = self.db.query_one('''
+            SELECT COALESCE(SUM(size), 0) FROM (
+                SELECT MAX(COALESCE(filesize, 0)) AS size FROM downloads
+                GROUP BY COALESCE(content_hash, 'id:' || id)
+            )
+        ''')
+        return row[0]
+
+    def free_bytes(self):
+        return shutil.disk_usage(self.data_dir).free
+
+    def reserve(self, needed_bytes, reason='download'):
+        """Make room for needed_bytes more data, evicting if required.
+
+        Raises StorageFullError if the quota or the free disk space still
+        cannot fit the download afterwards.
+        """
+        needed_bytes = max(int(needed_bytes or 0), 0)
+        with self._evict_lock:
+            self._evict(needed_bytes, reason)
+            if self.quota and self.used_bytes() + needed_bytes > self.quota:
+                raise StorageFullError(
+                    f'Storage quota exceeded: {needed_bytes} bytes needed, '
+                    f'{max(self.quota - self.used_bytes(), 0)} available'
+                )
+            free = self.free_bytes()
+            if free < needed_bytes + self.min_free:
+                raise StorageFullError(f'Not enough disk space: {needed_bytes} bytes needed, {free} free')
+
+    def enforce(self, reason='manual'):
+        """Evict until the quota, free-space and age limits are met; returns the run's report"""
+        with self._evict_lock:
+            return self._evict(0, reason)
+
+    def _candidates(self):
+        order = 'last_accessed_at, id' if self.policy == 'lru' else 'created_at, id'
+        return self.db.query(f'''
+            SELECT id, filename, filepath, filesize, last_accessed_at FROM downloads
+            WHERE last_accessed_at < ? ORDER BY {order}
+        ''', (time.time() - EVICTION_GRACE_SECONDS,))
+
+    def _evict(self, needed_bytes, reason):
+        now = time.time()
+        evicted = []
+        reclaimed = 0
+        # Measured once; each eviction lowers usage and raises free space by what it frees
+        used = self.used_bytes()
+        free = self.free_bytes()
+
+        # Eviction is opt-in: with no quota or max age, a low disk never deletes downloads
+        candidates = self._candidates() if self.quota or self.max_age else []
+        for row in candidates:
+            over_quota = self.quota and used - reclaimed + needed_bytes > self.quota
+            short_of_space = free + reclaimed < needed_bytes + self.min_free
+            expired = self.max_age and row['last_accessed_at'] < now - self.max_age
+            if not (over_quota or short_of_space or expired):
+                if not self.max_age:
+                    break
+                continue
+            reclaimed += self._remove(row)
+            evicted.append({'id': row['id'], 'filename': row['filename'], 'filesize': row['filesize']})
+
+        report = {'reason': reason, 'policy': self.policy, 'files': len(evicted), 'reclaimed_bytes': reclaimed}
+        if evicted:
+            self.db.execute('''
+                INSERT INTO evictions (ran_at, reason, policy, files, reclaimed_bytes, details)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (now, reason, self.policy, len(evicted), reclaimed, json.dumps(evicted)))
+            log.info("Evicted %d downloads (%d bytes reclaimed, %s)", len(evicted), reclaimed, reason)
+        report['evicted'] = evicted
+        return report
+
+    def _remove(self, row):
+        """Delete a download and its file; returns the bytes actually freed"""
+        freed = 0
+        filepath = row['filepath']
+        with self.db.transaction() as conn:
+            refs = conn.execute('SELECT COUNT(*) FROM downloads WHERE filepath = ?', (filepath,)).fetchone()[0]
+            conn.execute('DELETE FROM downloads WHERE id = ?', (row['id'],))
+        try:
+            if refs <= 1:
+                stat = os.stat(filepath)
+                os.remove(filepath)
+                # A hardlinked duplicate only frees its data with the last link
+                if stat.st_nlink <= 1:
+                    freed = stat.st_size
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._touched.pop(row['id'], None)
+        if self.on_remove is not None:
+            self.on_remove(row['id'])
+        return freed
+
+    def get_stats(self):
+        """Usage, limits and the most recent eviction runs"""
+        runs = self.db.query('''
+            SELECT ran_at, reason, policy, files, reclaimed_bytes FROM evictions
+            ORDER BY id DESC LIMIT 20
+        ''')
+        disk = shutil.disk_usage(self.data_dir)
+        return {
+            'used_bytes': self.used_bytes(),
+            'quota': self.quota or None,
+            'policy': self.policy,
+            'max_age': self.max_age or None,
+            'min_free': self.min_free,
+            'disk_free': disk.free,
+            'disk_total': disk.total,
+            'recent_evictions': [dict(run) for run in runs],
+        }
@@ -0,0 +1,295 @@
+import hashlib
+import ipaddress
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+from executor import SingleFlightExecutor
+from postprocess import PostProcessingError
+
+log = logging.getLogger(__name__)
+
+# Download IDs, or the hash of an upstream thumbnail URL (see url_id)
+THUMBNAIL_ID = re.compile(r'\d+|[0-9a-f]{20}')
+
+IMAGE_EXTENSIONS = {'image/jpeg': 'jpg', 'image/webp': 'webp', 'image/png': 'png'}
+MIMETYPES = {ext: mimetype for mimetype, ext in IMAGE_EXTENSIONS.items()}
+
+# A thumbnail that could not be fetched or generated is not retried for this long
+FAILURE_RETRY_SECONDS = 600
+
+# Last-access times are written at most this often per thumbnail
+TOUCH_INTERVAL = 60
+
+USER_AGENT = 'Mozilla/5.0 (compatible; video-downloader)'
+
+
+def pick_thumbnail(info, width=480):
+    """URL of the smallest thumbnail in an info dict at least `width` wide (else the widest)"""
+    thumbnails = [t for t in info.get('thumbnails') or [] if t.get('url')]
+    sized = [t for t in thumbnails if t.get('width')]
+    wide = [t for t in sized if t['width'] >= width]
+    if wide:
+        return min(wide, key=lambda t: t['width'])['url']
+    if sized:
+        return max(sized, key=lambda t: t['width'])['url']
+    # yt-dlp sorts thumbnails worst to best
+    return info.get('thumbnail') or (thumbnails[-1]['url'] if thumbnails else None)
+
+
+def check_public_url(url):
+    """Raise ValueError unless url is http(s) on a host that resolves only to public addresses.
+
+    Thumbnail URLs come from the pages being extracted, so without this any
+    page could make the server request its internal network.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f'not an http(s) URL: {url}')
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, ValueError) as e:
+        raise ValueError(f'cannot resolve {parts.hostname}: {e}')
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split('%', 1)[0])
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f'{parts.hostname} resolves to a non-public address ({ip})')
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow redirects only to URLs check_public_url accepts"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def url_id(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+
+
+class ThumbnailCache:
+    """Thumbnails fetched or generated once and kept under ``directory``.
+
+    Video info thumbnails are keyed by the hash of their upstream URL,
+    downloads by their ID. A download's thumbnail comes from the URL
+    recorded when it finished or, failing that, from a frame of the file
+    (with ffmpeg, when post-processing thumbnails are enabled). Images are scaled down to ``width`` when ffmpeg is
+    available. Past ``max_bytes``, the least recently served files are
+    deleted; they are fetched again if asked for.
+    """
+
+    def __init__(self, db, directory, max_bytes=0, width=480, processing=None, fetch_timeout=10,
+                 max_fetch_bytes=5 * 1024 * 1024):
+        self.db = db
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.width = width
+        self.processing = processing
+        self.fetch_timeout = fetch_timeout
+        self.max_fetch_bytes = max_fetch_bytes
+        self._opener = urllib.request.build_opener(PublicRedirectHandler)
+        # Concurrent requests for the same missing thumbnail share one fetch
+        self._pool = SingleFlightExecutor(max_workers=4, max_pending=64, name='thumbnail')
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def register(self, thumb_id, source_url):
+        """Remember where a thumbnail comes from; nothing is fetched until it is asked for"""
+        if not source_url:
+            return
+        self.db.execute('''
+            INSERT INTO thumbnails (id, source_url) VALUES (?, ?)
+            ON CONFLICT (id) DO UPDATE SET source_url = excluded.source_url, failed_at = NULL
+            WHERE source_url IS NOT excluded.source_url
+        ''', (str(thumb_id), source_url))
+
+    def register_url(self, source_url):
+        """Register an upstream thumbnail; returns its local URL ('' without one)"""
+        if not source_url:
+            return ''
+        thumb_id = url_id(source_url)
+        self.register(thumb_id, source_url)
+        return f'/api/thumbnail/{thumb_id}'
+
+    def get(self, thumb_id, timeout=None):
+        """(path, mimetype, etag) of a thumbnail, fetching or generating it first if needed.
+
+        Returns None if there is none. Raises ExecutorBusyError when too
+        many thumbnails are being fetched and TimeoutError after timeout.
+        """
+        row = self._row(thumb_id)
+        if row is None and not thumb_id.isdigit():
+            return None
+        if row is not None and row['filename']:
+            path = os.path.join(self.directory, row['filename'])
+            if os.path.isfile(path):
+                self._touch(thumb_id, row['accessed_at'])
+                return path, MIMETYPES[row['filename'].rsplit('.', 1)[1]], row['etag']
+        if row is not None and row['failed_at'] and row['failed_at'] > time.time() - FAILURE_RETRY_SECONDS:
+            return None
+        return self._pool.run(thumb_id, self._produce, thumb_id, timeout=timeout)
+
+    @property
+    def can_generate(self):
+        """Whether download thumbnails can be made from a frame of the file"""
+        return self.processing is not None and self.processing.available and self.processing.thumbnails
+
+    def listed(self, download_ids):
+        """The IDs among download_ids that have a thumbnail to show (or can have one made)"""
+        ids = [str(download_id) for download_id in download_ids]
+        if not ids:
+            return set()
+        rows = {row['id']: row for row in self.db.query(f'''
+            SELECT id, source_url, filename, failed_at FROM thumbnails WHERE id IN ({", ".join("?" * len(ids))})
+        ''', ids)}
+        retry_after = time.time() - FAILURE_RETRY_SECONDS
+        found = set()
+        for thumb_id in ids:
+            row = rows.get(thumb_id)
+            if row is not None and row['filename']:
+                found.add(thumb_id)
+            elif row is not None and row['failed_at'] and row['failed_at'] > retry_after:
+                continue
+            elif (row is not None and row['source_url']) or self.can_generate:
+                found.add(thumb_id)
+        return found
+
+    def generate(self, thumb_id, video_path, duration=None):
+        """Write a thumbnail from a frame of a video file; raises PostProcessingError"""
+        output = os.path.join(self.directory, f'{thumb_id}.jpg')
+        self.processing.thumbnail(video_path, output, duration, width=self.width)
+        return self._record(str(thumb_id), output)
+
+    def remove(self, thumb_id):
+        """Forget a thumbnail and delete its file"""
+        row = self._row(str(thumb_id))
+        if row is None:
+            return
+        self.db.execute('DELETE FROM thumbnails WHERE id = ?', (str(thumb_id),))
+        if row['filename']:
+            try:
+                os.remove(os.path.join(self.directory, row['filename']))
+            except FileNotFoundError:
+                pass
+
+    def pending(self):
+        return self._pool.pending()
+
+    def get_stats(self):
+        row = self.db.query_one('SELECT COUNT(filename), COALESCE(SUM(size), 0) FROM thumbnails')
+        return {'files': row[0], 'bytes': row[1], 'max_bytes': self.max_bytes or None}
+
+    def _row(self, thumb_id):
+        return self.db.query_one('''
+            SELECT id, source_url, filename, etag, accessed_at, failed_at FROM thumbnails WHERE id = ?
+        ''', (thumb_id,))
+
+    def _touch(self, thumb_id, accessed_at):
+        now = time.time()
+        if not accessed_at or now - accessed_at >= TOUCH_INTERVAL:
+            self.db.execute('UPDATE thumbnails SET accessed_at = ? WHERE id = ?', (now, thumb_id))
+
+    def _produce(self, thumb_id):
+        """Fetch (or generate) a thumbnail that is not on disk; runs on the thumbnail pool"""
+        row = self._row(thumb_id)
+        source_url = row['source_url'] if row else None
+        if source_url:
+            try:
+                return self._fetch(thumb_id, source_url)
+            except (OSError, ValueError, PostProcessingError) as e:
+                log.warning("Could not fetch thumbnail %s: %s", thumb_id, e)
+
+        download = None
+        if thumb_id.isdigit():
+            download = self.db.query_one('SELECT filepath, duration FROM downloads WHERE id = ?', (int(thumb_id),))
+        if download and self.can_generate and os.path.exists(download['filepath']):
+            try:
+                return self.generate(thumb_id, download['filepath'], download['duration'])
+            except PostProcessingError as e:
+                log.warning("Could not generate thumbnail %s: %s", thumb_id, e)
+
+        if row is not None or download is not None:
+            self.db.execute('''
+                INSERT INTO thumbnails (id, failed_at) VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE SET failed_at = excluded.failed_at
+            ''', (thumb_id, time.time()))
+        return None
+
+    def _fetch(self, thumb_id, source_url):
+        check_public_url(source_url)
+        request = urllib.request.Request(source_url, headers={'User-Agent': USER_AGENT})
+        with self._opener.open(request, timeout=self.fetch_timeout) as response:
+            mimetype = response.headers.get_content_type()
+            ext = IMAGE_EXTENSIONS.get(mimetype)
+            if ext is None:
+                raise ValueError(f'not an image: {mimetype}')
+            data = response.read(self.max_fetch_bytes + 1)
+        if len(data) > self.max_fetch_bytes:
+            raise ValueError('image too large')
+
+        output = os.path.join(self.directory, f'{thumb_id}.jpg')
+        if self.processing is not None and self.processing.available:
+            # Keep a compact JPEG scaled to the width the UI shows
+            source = os.path.join(self.directory, f'{thumb_id}.source.{ext}')
+            with open(source, 'wb') as f:
+                f.write(data)
+            try:
+                self.processing.resize_image(source, output, self.width)
+            finally:
+                os.remove(source)
+        else:
+            output = os.path.join(self.directory, f'{thumb_id}.{ext}')
+            with open(output, 'wb') as f:
+                f.write(data)
+        return self._record(thumb_id, output)
+
+    def _record(self, thumb_id, path):
+        with open(path, 'rb') as f:
+            etag = hashlib.sha1(f.read()).hexdigest()[:20]
+        size = os.path.getsize(path)
+        now = time.time()
+        filename = os.path.basename(path)
+        self.db.execute('''
+            INSERT INTO thumbnails (id, filename, size, etag, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                filename = excluded.filename, size = excluded.size, etag = excluded.etag,
+                created_at = excluded.created_at, accessed_at = excluded.accessed_at, failed_at = NULL
+        ''', (thumb_id, filename, size, etag, now, now))
+        self._enforce(keep=thumb_id)
+        return path, MIMETYPES[filename.rsplit('.', 1)[1]], etag
+
+    def _enforce(self, keep=None):
+        """Delete least recently served files until the cache is within max_bytes"""
+        if not self.max_bytes:
+            return
+        with self._evict_lock:
+            used = self.db.query_one('SELECT COALESCE(SUM(size), 0) FROM thumbnails')[0]
+            if used <= self.max_bytes:
+                return
+            rows = self.db.query('''
+                SELECT id, filename, size FROM thumbnails WHERE filename IS NOT NULL AND id != ?
+                ORDER BY accessed_at
+            ''', (keep,))
+            evicted = 0
+            for row in rows:
+                if used <= self.max_bytes:
+                    break
+                # The source URL is kept so the thumbnail can be fetched again
+                self.db.execute('UPDATE thumbnails SET filename = NULL, size = NULL, etag = NULL WHERE id = ?',
+                                (row['id'],))
+                try:
+                    os.remove(os.path.join(self.directory, row['filename']))
+                except FileNotFoundError:
+                    pass
+                used -= row['size'] or 0
+                evicted += 1
+            log.info("Evicted %d thumbnails", evicted)